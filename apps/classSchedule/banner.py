@@ -0,0 +1,354 @@
+"""classSchedule/banner.py - a process-wide gateway to Banner built on a cx_Oracle session pool"""
+
+# python
+import contextlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# django
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# python
+import cx_Oracle
+
+# djClassSchedulePrj
+from apps.classSchedule import metrics
+
+
+class BannerPoolTimeout(cx_Oracle.DatabaseError):
+    """raised when no pooled Banner session frees up within BANNER_POOL_ACQUIRE_TIMEOUT
+
+    it subclasses cx_Oracle.DatabaseError so the oracle_models error handling treats it like any other
+    database failure
+    """
+
+
+def parse_connection_url(url):
+    """split a BANNER_CONNECTION_URL (username/pass@bannerurl:port/databaseID) into its parts
+
+    :param url: the connection url from settings
+    :rtype: tuple
+    :return: (user, password, dsn)
+    """
+    credentials, _, dsn = url.rpartition('@')
+    user, _, password = credentials.partition('/')
+    return user, password, dsn
+
+
+class BannerGateway(object):
+    """owns the cx_Oracle session pool for this process and lends sessions out of it
+
+    every borrower has to get one of ``max_sessions`` slots first, which is how the acquire timeout is enforced
+    on top of a pool that would otherwise block forever. a session that sat idle in the pool for longer than
+    ``ping_interval`` seconds is pinged by the pool itself before it is handed out (cx_Oracle 8.2 and later, which
+    keep the idle time of each session). older versions cannot tell how long a session has been idle, so every
+    session is pinged when it is checked out. dead sessions are dropped from the pool and another one is taken, up
+    to ``CHECKOUT_ATTEMPTS`` times.
+    """
+
+    CHECKOUT_ATTEMPTS = 3
+
+    def __init__(self, connection_url, min_sessions=2, max_sessions=10, increment=1, acquire_timeout=10.0,
+                 ping_interval=60, statement_cache_size=80):
+        self.connection_url = connection_url
+        self.min_sessions = min_sessions
+        self.max_sessions = max_sessions
+        self.increment = increment
+        self.acquire_timeout = acquire_timeout
+        self.ping_interval = ping_interval
+        self.statement_cache_size = statement_cache_size
+
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pid = None
+        self._slots = threading.BoundedSemaphore(max_sessions)
+        self._pool_pings = False
+
+        self._waiting = 0
+        self._acquired = 0
+        self._timeouts = 0
+        self._dropped = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            settings.BANNER_CONNECTION_URL,
+            min_sessions=getattr(settings, 'BANNER_POOL_MIN', 2),
+            max_sessions=getattr(settings, 'BANNER_POOL_MAX', 10),
+            increment=getattr(settings, 'BANNER_POOL_INCREMENT', 1),
+            acquire_timeout=getattr(settings, 'BANNER_POOL_ACQUIRE_TIMEOUT', 10.0),
+            ping_interval=getattr(settings, 'BANNER_POOL_PING_INTERVAL', 60),
+            statement_cache_size=getattr(settings, 'BANNER_STATEMENT_CACHE_SIZE', 80),
+        )
+
+    @property
+    def pool(self):
+        """the session pool, created on first use and again after a fork so workers never share sessions"""
+        pid = os.getpid()
+        if self._pool is None or self._pid != pid:
+            with self._lock:
+                if self._pool is None or self._pid != pid:
+                    user, password, dsn = parse_connection_url(self.connection_url)
+                    self._pool = cx_Oracle.SessionPool(user, password, dsn, self.min_sessions, self.max_sessions,
+                                                       self.increment, threaded=True,
+                                                       getmode=cx_Oracle.SPOOL_ATTRVAL_WAIT)
+                    self._pool_pings = hasattr(self._pool, 'ping_interval')
+                    if self._pool_pings:
+                        self._pool.ping_interval = self.ping_interval
+                    self._pid = pid
+                    logging.getLogger('django').info(
+                        "banner session pool opened - pid %s - min %s - max %s - increment %s" % (
+                            pid, self.min_sessions, self.max_sessions, self.increment))
+        return self._pool
+
+    def acquire(self):
+        """borrow a session from the pool, waiting at most acquire_timeout seconds for a free slot
+
+        :rtype: cx_Oracle.Connection
+        :return: a pooled connection, which has to be handed back with release()
+        """
+        started = time.monotonic()
+        with self._lock:
+            self._waiting += 1
+        try:
+            got_slot = self._slots.acquire(timeout=self.acquire_timeout)
+        finally:
+            with self._lock:
+                self._waiting -= 1
+        waited = time.monotonic() - started
+
+        with self._lock:
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+            if got_slot:
+                self._acquired += 1
+            else:
+                self._timeouts += 1
+        if not got_slot:
+            raise BannerPoolTimeout("no Banner session became available within %.1f seconds" % waited)
+
+        try:
+            return self._checkout()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _checkout(self):
+        pool = self.pool
+        for attempt in range(self.CHECKOUT_ATTEMPTS):
+            con = pool.acquire()
+            if self._pool_pings or self._is_alive(con):
+                break
+            self._drop(pool, con)
+        else:
+            raise cx_Oracle.DatabaseError("no live Banner session after %s attempts" % self.CHECKOUT_ATTEMPTS)
+        # statements prepared on a session stay in its cache, so a repeated statement skips even the soft parse
+        con.stmtcachesize = self.statement_cache_size
+        return con
+
+    def release(self, con, healthy=True):
+        """give a session back to the pool, or drop it from the pool when it is no longer usable"""
+        try:
+            if healthy:
+                self.pool.release(con)
+            else:
+                self._drop(self.pool, con)
+        finally:
+            self._slots.release()
+
+    def _drop(self, pool, con):
+        with self._lock:
+            self._dropped += 1
+        try:
+            pool.drop(con)
+        except cx_Oracle.DatabaseError as e:
+            logging.getLogger('django').warning("could not drop dead banner session: %s" % e)
+
+    @staticmethod
+    def _is_alive(con):
+        try:
+            con.ping()
+        except cx_Oracle.DatabaseError:
+            return False
+        return True
+
+    @contextlib.contextmanager
+    def connection(self):
+        """context manager lending a pooled connection; sessions that fail a ping after an error are dropped"""
+        con = self.acquire()
+        healthy = True
+        try:
+            yield con
+        except cx_Oracle.DatabaseError:
+            healthy = self._is_alive(con)
+            raise
+        finally:
+            self.release(con, healthy=healthy)
+
+    def stats(self):
+        """a snapshot of the pool counters
+
+        :rtype: OrderedDict
+        :return: open and busy sessions from the pool plus acquire / wait / timeout counters from the gateway
+        """
+        pool = self._pool if self._pid == os.getpid() else None
+        with self._lock:
+            return OrderedDict([
+                ('min', self.min_sessions),
+                ('max', self.max_sessions),
+                ('increment', self.increment),
+                ('opened', pool.opened if pool is not None else 0),
+                ('busy', pool.busy if pool is not None else 0),
+                ('waiting', self._waiting),
+                ('acquired', self._acquired),
+                ('timeouts', self._timeouts),
+                ('dropped', self._dropped),
+                ('wait_seconds_total', self._wait_total),
+                ('wait_seconds_max', self._wait_max),
+            ])
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def gateway():
+    """the process-wide BannerGateway, built from settings the first time it is needed
+
+    :rtype: BannerGateway
+    """
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = BannerGateway.from_settings()
+    return _gateway
+
+
+@contextlib.contextmanager
+def oracle_cursor():
+    """context manager yielding a cursor on a pooled Banner session; both are returned when the block exits"""
+    with gateway().connection() as con:
+        cur = con.cursor()
+        try:
+            yield cur
+        finally:
+            cur.close()
+
+
+# short names BANNER_DATA_SOURCE may be set to, anything else is the dotted path of a cursor context manager
+DATA_SOURCES = {
+    'oracle': 'apps.classSchedule.banner.oracle_cursor',
+    'mirror': 'apps.classSchedule.mirror.cursor',
+    'fixture': 'apps.classSchedule.fixture_source.cursor',
+}
+
+
+def data_source():
+    """the cursor context manager BANNER_DATA_SOURCE points at
+
+    :rtype: callable
+    """
+    source = getattr(settings, 'BANNER_DATA_SOURCE', 'oracle')
+    return import_string(DATA_SOURCES.get(source, source))
+
+
+class MeteredCursor(object):
+    """a cursor that counts the rows fetched through it into classschedule_banner_rows_fetched_total"""
+
+    def __init__(self, cursor, function, view):
+        self.cursor = cursor
+        self.function = function
+        self.view = view
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+    def __setattr__(self, name, value):
+        if name in ('cursor', 'function', 'view'):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self.cursor, name, value)
+
+    def counted(self, rows):
+        metrics.BANNER_ROWS.inc(len(rows), function=self.function, view=self.view)
+        return rows
+
+    def fetchone(self):
+        row = self.cursor.fetchone()
+        if row is not None:
+            metrics.BANNER_ROWS.inc(function=self.function, view=self.view)
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        return self.counted(self.cursor.fetchmany(*args, **kwargs))
+
+    def fetchall(self):
+        return self.counted(self.cursor.fetchall())
+
+
+@contextlib.contextmanager
+def cursor(function=None):
+    """context manager yielding a cursor on the configured BANNER_DATA_SOURCE - pooled Banner sessions by
+    default, the local mirror of the Banner views or the fixtures stand-in
+
+    rows are fetched BANNER_ARRAYSIZE at a time, and BANNER_PREFETCH_ROWS come back with the execute itself where
+    the client supports it. the time the cursor is held, the rows fetched and the DatabaseErrors raised are
+    recorded in the metrics, labelled with function or else the oracle_models function the TimedCache is computing,
+    and with the view the request is answered by
+    """
+    function = function or metrics.current('function')
+    view = metrics.current('view')
+    started = time.perf_counter()
+    try:
+        with data_source()() as cur:
+            cur.arraysize = getattr(settings, 'BANNER_ARRAYSIZE', 500)
+            if hasattr(cur, 'prefetchrows'):
+                cur.prefetchrows = getattr(settings, 'BANNER_PREFETCH_ROWS', 500)
+            yield MeteredCursor(cur, function, view)
+    except cx_Oracle.DatabaseError:
+        metrics.BANNER_ERRORS.inc(function=function, view=view)
+        raise
+    finally:
+        metrics.BANNER_QUERY_SECONDS.observe(time.perf_counter() - started, function=function, view=view)
+
+
+def fetch_batches(cur):
+    """the rows of an executed cursor in lists of up to arraysize rows, each one a single round trip, so a large
+    result never has to be held in memory at once
+
+    :rtype: generator
+    """
+    while True:
+        batch = cur.fetchmany(cur.arraysize)
+        if not batch:
+            return
+        yield batch
+
+
+def fetch_all(cur):
+    """every row of an executed cursor, fetched arraysize rows at a time
+
+    :rtype: list
+    """
+    rows = []
+    for batch in fetch_batches(cur):
+        rows.extend(batch)
+    return rows
+
+
+def pool_sessions():
+    pool_stats = _gateway.stats() if _gateway is not None else None
+    if pool_stats is None:
+        return []
+    return [((state,), pool_stats[state]) for state in ('opened', 'busy', 'waiting', 'max')]
+
+
+metrics.Gauge('classschedule_banner_pool_sessions', "sessions of the Banner session pool in this process",
+              pool_sessions, ['state'])
@@ -0,0 +1,316 @@
+"""classSchedule/fixture_source.py - a stand-in for Banner built from generated or recorded fixtures
+
+Set ``BANNER_DATA_SOURCE=fixture`` to answer the oracle_models lookups from an in-memory SQLite copy of the SWV*
+views instead of Banner. The copy has the same columns as the mirror (see mirror.MIRRORED_VIEWS), so every lookup
+returns the tuples it would get from Banner. It is filled from ``BANNER_FIXTURES``, a JSON file written by
+``manage.py banner_fixtures``, or generated with ``BANNER_FIXTURE_SECTIONS`` sections in every term when no file is
+given.
+
+Each query can be slowed down by ``BANNER_FIXTURE_LATENCY`` seconds plus up to ``BANNER_FIXTURE_JITTER`` seconds
+and made to fail with a cx_Oracle.DatabaseError ``BANNER_FIXTURE_FAILURE_RATE`` of the time, so the caching and
+concurrency of the site can be measured without a Banner database.
+"""
+
+# python
+import contextlib
+import datetime
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# django
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.dateparse import parse_datetime
+
+# djClassSchedulePrj
+from apps.classSchedule import mirror
+
+SUBJECTS = [
+    ('ACC', 'Accounting'), ('AMS', 'American Studies'), ('ANT', 'Anthropology'), ('ART', 'Art'),
+    ('BIO', 'Biology'), ('BUA', 'Business Administration'), ('CHI', 'Chinese'), ('CHM', 'Chemistry'),
+    ('CLA', 'Classics'), ('COM', 'Communication'), ('CSC', 'Computer Science'), ('ECO', 'Economics'),
+    ('EDU', 'Education'), ('ENV', 'Environmental Studies'), ('FRE', 'French'), ('GEO', 'Geosciences'),
+    ('GER', 'German'), ('HIS', 'History'), ('HRD', 'Human Resource Development'), ('INB', 'International Business'),
+    ('ITA', 'Italian'), ('JPN', 'Japanese'), ('LIT', 'Literature'), ('MAR', 'Marine Science'),
+    ('MAT', 'Mathematics'), ('MGT', 'Management'), ('MUS', 'Music'), ('ORG', 'Organizational Studies'),
+    ('PHI', 'Philosophy'), ('PHY', 'Physics'), ('POL', 'Political Science'), ('PSY', 'Psychology'),
+    ('REL', 'Religious Studies'), ('RUS', 'Russian'), ('SOC', 'Sociology'), ('SPA', 'Spanish'),
+    ('THE', 'Theatre'), ('WGS', "Women's and Gender Studies"), ('WRI', 'Writing'), ('ZOO', 'Zoology'),
+]
+AREAS = [
+    ('A', 'Aesthetic Perspective'), ('C', 'Cultural Perspective'), ('E', 'Environmental Perspective'),
+    ('G', 'Global Perspective'), ('H', 'Historical Perspective'), ('S', 'Social Relations Perspective'),
+    ('N', 'Natural Sciences Perspective'), ('Q', 'Quantitative Perspective'),
+]
+SPECIALIZED = [
+    ('ZPOL', 'PEL Online'), ('ZPHY', 'PEL Hybrid'), ('ZPWK', 'PEL Weekend'), ('ZPEV', 'PEL Evening'),
+    ('ZRWR', 'Writing Intensive'), ('ZROL', 'Oral Competency'), ('ZRQR', 'Quantitative Reasoning'),
+    ('ZRIF', 'Information Fluency'), ('ZRHN', 'Honors'),
+]
+CAMPUSES = [('M', 'Main Campus'), ('T', 'Tampa'), ('G', 'Gainesville'), ('O', 'Online')]
+FIRST_NAMES = ['Alex', 'Blair', 'Casey', 'Dana', 'Emery', 'Finley', 'Gray', 'Harper', 'Jordan', 'Kendall',
+               'Logan', 'Morgan', 'Parker', 'Quinn', 'Reese', 'Riley', 'Rowan', 'Sawyer', 'Taylor', 'Wren']
+LAST_NAMES = ['Abbott', 'Barnes', 'Castillo', 'Dawson', 'Ellison', 'Foster', 'Garcia', 'Hughes', 'Ibarra',
+              'Jensen', 'Khan', 'Larsen', 'Moreno', 'Nguyen', 'Okafor', 'Patel', 'Quintero', 'Russo', 'Sato',
+              'Tran', 'Underwood', 'Vasquez', 'Whitaker', 'Yilmaz', 'Zimmerman']
+WORDS = ['theory', 'methods', 'practice', 'introduction', 'advanced', 'topics', 'seminar', 'analysis',
+         'systems', 'foundations', 'applied', 'modern', 'global', 'research', 'design', 'principles',
+         'culture', 'society', 'environment', 'history', 'ethics', 'data', 'policy', 'leadership']
+MEETINGS = [('MWF', '0800-0850'), ('MWF', '0900-0950'), ('MWF', '1000-1050'), ('MWF', '1100-1150'),
+            ('MWF', '1300-1350'), ('TR', '0830-0945'), ('TR', '1000-1115'), ('TR', '1330-1445'),
+            ('TR', '1500-1615'), ('M', '1800-2130'), ('T', '1800-2130'), ('W', '1800-2130'), ('R', '1800-2130'),
+            ('S', '0830-1630')]
+BUILDINGS = ['JAMES', 'GALBRAITH', 'SETH', 'COBB', 'FRANKLIN', 'ARMSTRONG']
+
+_lock = threading.Lock()
+_loaded_pid = None
+_keeper = None
+_local = threading.local()
+_random = random.Random()
+_stats = OrderedDict([('queries', 0), ('failures', 0), ('rows', 0), ('latency_seconds', 0.0)])
+
+
+class FixtureError(mirror.MirrorError):
+    """a failure injected by BANNER_FIXTURE_FAILURE_RATE, or a fixture query that could not run"""
+
+
+def term_codes(today=None):
+    """the (term, ptrm, ptrm_desc, start, end, kind) of the generated terms - this and next year's residential
+    fall / spring terms and pel terms, so the default terms of the results pages are among them"""
+    year = (today or datetime.date.today()).year
+    terms = []
+    for offset in (0, 1):
+        term_year = year + offset
+        terms.append(('%s10' % term_year, 'R2', 'Fall %s' % term_year, datetime.datetime(term_year, 8, 25),
+                      datetime.datetime(term_year, 12, 15), 'res'))
+        terms.append(('%s20' % term_year, 'R2', 'Spring %s' % term_year, datetime.datetime(term_year, 1, 20),
+                      datetime.datetime(term_year, 5, 10), 'res'))
+        for number in (3, 5):
+            start = datetime.datetime(term_year, 1 if number == 3 else 8, 10)
+            terms.append(('%s25' % term_year, 'P%s' % number, 'PEL Term %s %s' % (number, term_year), start,
+                          start + datetime.timedelta(weeks=8), 'pel'))
+    return terms
+
+
+def generate(sections=2000, seed=0, today=None):
+    """generate fixtures with the shapes and value formats of the Banner views
+
+    :param sections: sections in every term / ptrm, each with one or two meeting rows
+    :param seed: the seed of the random data, the same seed always gives the same fixtures
+    :rtype: OrderedDict
+    :return: view -> list of rows holding the mirror.MIRRORED_VIEWS columns of the view
+    """
+    rng = random.Random(seed)
+    views = OrderedDict((view, []) for view in mirror.MIRRORED_VIEWS)
+    views['SWVAREA_PSPT_WEB'] = list(AREAS)
+    views['SWVSPEC_SEARCH_WEB'] = list(SPECIALIZED)
+    section_columns = mirror.MIRRORED_VIEWS['SWVSECT_WEB'][0]
+
+    for term, ptrm, description, start, end, kind in term_codes(today):
+        code_row = (term, ptrm, description, start, end)
+        views['SWVPTRM_UP_WEB' if kind == 'pel' else 'SWVPTRM_UR_WEB'].append(code_row)
+        views['SWVPTRM_WEB'].append(code_row)
+        for subj, subj_desc in SUBJECTS:
+            views['SWVSUBJ_WEB'].append((term, subj, subj_desc, ptrm))
+        if kind == 'pel':
+            for camp, camp_desc in CAMPUSES:
+                views['SWVCAMP_UP_WEB'].append((term, ptrm, camp, camp_desc))
+
+        instructors = []
+        names = [(first, last) for last in LAST_NAMES for first in FIRST_NAMES]
+        for pidm, (first, last) in enumerate(rng.sample(names, min(max(sections // 6, 1), len(names)))):
+            name = '%s, %s' % (last, first)
+            instructors.append(name)
+            views['SWVINST_ASGN_PTRM_WEB'].append((term, ptrm, name, '%s%s@example.edu' % (first[0], last),
+                                                   first, 100000 + pidm))
+
+        numbers = {}
+        for number in range(sections):
+            subj, subj_desc = SUBJECTS[number % len(SUBJECTS)]
+            crse_numb = '%s%02d' % (rng.randint(1, 4), rng.randint(0, 99))
+            seq = numbers[(subj, crse_numb)] = numbers.get((subj, crse_numb), 0) + 1
+            title = ' '.join(rng.sample(WORDS, 3)).title()
+            capacity = rng.choice([12, 16, 20, 24, 30, 45])
+            enrl = rng.randint(0, capacity)
+            cross_listed = rng.random() < 0.1
+            primary = rng.choice(instructors)
+            others = rng.sample(instructors, 1) if rng.random() < 0.1 else []
+            instruct_all = '; '.join([primary] + others)
+            special = ' '.join(attr for attr, attr_desc in rng.sample(SPECIALIZED, rng.randint(0, 2))) or None
+            crse_text = ' '.join(rng.choice(WORDS) for word in range(rng.randint(40, 120))).capitalize() + '.'
+            camp = rng.choice(CAMPUSES)[0] if kind == 'pel' else 'M'
+            meetings = [('CLAS',) + rng.choice(MEETINGS)]
+            if subj in ('BIO', 'CHM', 'PHY', 'MAR') and rng.random() < 0.5:
+                meetings.append(('LAB', rng.choice(['M', 'T', 'W', 'R']), '1400-1650'))
+            for meet_schd, days, meet_time in meetings:
+                values = {
+                    'SUBJ_DESC': subj_desc, 'CRN': '%05d' % (10000 + number), 'SUBJ': subj, 'CRSE_NUMB': crse_numb,
+                    'SEQ_NUMB': '%02d' % seq, 'CAMP': camp, 'BILL_HRS': rng.choice([1, 2, 4, 4, 4]),
+                    'CRSE_TITLE': title, 'DAYS': days, 'MEET_TIME': meet_time, 'CAPACITY': capacity, 'ENRL': enrl,
+                    'REMAIN': capacity - enrl, 'INSTRUCT_ALL': instruct_all,
+                    'DATES': '%s-%s' % (start.strftime('%m/%d'), end.strftime('%m/%d')),
+                    'LOCATION': '%s %s' % (rng.choice(BUILDINGS), rng.randint(100, 350)),
+                    'PREREQ': 'Prerequisite: %s %s' % (subj, int(crse_numb) - 100) if crse_numb > '200' else None,
+                    'TEXT': 'Meets with %s %s' % (subj, crse_numb) if rng.random() < 0.1 else None,
+                    'COURSE': '%s %s' % (subj, crse_numb), 'MEET_SCHD': meet_schd, 'SESS': rng.choice(AREAS)[0],
+                    'BN_TERM': term, 'CRSE_TEXT': crse_text,
+                    'CAPACITY_XLST': capacity * 2 if cross_listed else None,
+                    'ENRL_XLST': enrl * 2 if cross_listed else None,
+                    'REMAIN_XLST': (capacity - enrl) * 2 if cross_listed else None,
+                    'SPECIAL': special, 'TERM': term, 'PTRM': ptrm, 'INSTRUCT_PRIM': 'Y',
+                }
+                views['SWVSECT_WEB'].append(tuple(values[column] for column in section_columns))
+                for other in others:
+                    # SWVSECT_WEB has a row for every instructor of a section, the searches only read the primary
+                    values.update(INSTRUCT_PRIM='N', INSTRUCT_ALL=other)
+                    views['SWVSECT_WEB'].append(tuple(values[column] for column in section_columns))
+    return views
+
+
+def record(path, batch_size=1000):
+    """write every view in mirror.MIRRORED_VIEWS, read from Banner, to a fixtures file
+
+    :rtype: OrderedDict
+    :return: view -> the number of rows recorded
+    """
+    views = OrderedDict()
+    for view in mirror.MIRRORED_VIEWS:
+        views[view] = [[mirror.plain(value) for value in row]
+                       for batch in mirror.oracle_batches(view, batch_size=batch_size) for row in batch]
+    write(path, views)
+    return OrderedDict((view, len(rows)) for view, rows in views.items())
+
+
+def write(path, views):
+    """write fixtures to a JSON file that BANNER_FIXTURES can point at"""
+    with open(path, 'w') as fixtures_file:
+        json.dump(OrderedDict((view, {'columns': mirror.MIRRORED_VIEWS[view][0], 'rows': rows})
+                              for view, rows in views.items()), fixtures_file, cls=DjangoJSONEncoder)
+
+
+def read(path):
+    """the fixtures in a file written by write()
+
+    :rtype: OrderedDict
+    :return: view -> list of rows, with the columns in mirror.MIRRORED_VIEWS order
+    """
+    with open(path) as fixtures_file:
+        recorded = json.load(fixtures_file, object_pairs_hook=OrderedDict)
+    views = OrderedDict()
+    for view, (columns, indexes) in mirror.MIRRORED_VIEWS.items():
+        fixture = recorded.get(view, {'columns': columns, 'rows': []})
+        positions = [fixture['columns'].index(column) for column in columns]
+        views[view] = [tuple(parse_datetime(row[position]) if column in mirror.COLUMN_TYPES and row[position]
+                             else row[position] for column, position in zip(columns, positions))
+                       for row in fixture['rows']]
+    return views
+
+
+def database():
+    """this thread's connection to the in-memory fixtures database, filled on first use in each process
+
+    :rtype: sqlite3.Connection
+    """
+    global _loaded_pid, _keeper
+    pid = os.getpid()
+    if _loaded_pid != pid:
+        with _lock:
+            if _loaded_pid != pid:
+                # the database lives as long as one connection to it is open, the keeper
+                _keeper = connect(pid)
+                started = time.time()
+                path = getattr(settings, 'BANNER_FIXTURES', '')
+                if path:
+                    views = read(path)
+                else:
+                    views = generate(sections=getattr(settings, 'BANNER_FIXTURE_SECTIONS', 2000))
+                for view, rows in views.items():
+                    mirror.load_view(view, [rows], db=_keeper)
+                logging.getLogger('django').info("banner fixtures loaded from %s - %s SWVSECT_WEB rows in %.3fs" % (
+                    path or 'generated data', len(views['SWVSECT_WEB']), time.time() - started))
+                _loaded_pid = pid
+    if getattr(_local, 'pid', None) != pid:
+        _local.connection = connect(pid)
+        _local.pid = pid
+    return _local.connection
+
+
+def connect(pid):
+    raw = sqlite3.connect('file:banner_fixtures_%s?mode=memory&cache=shared' % pid, uri=True,
+                          detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False, isolation_level=None)
+    raw.execute('PRAGMA read_uncommitted = ON')
+    return mirror.oracle_compatible(raw)
+
+
+def reset():
+    """drop the fixtures database, so the next query loads it again from the current settings"""
+    global _loaded_pid, _keeper
+    with _lock:
+        if _keeper is not None:
+            _keeper.close()
+        _keeper = None
+        _loaded_pid = None
+        _local.__dict__.clear()
+        reset_stats()
+
+
+class FixtureCursor(mirror.MirrorCursor):
+    """a MirrorCursor that applies the latency and failures configured in settings to every query"""
+
+    def execute(self, statement, parameters=None):
+        latency = getattr(settings, 'BANNER_FIXTURE_LATENCY', 0.0)
+        jitter = getattr(settings, 'BANNER_FIXTURE_JITTER', 0.0)
+        delay = latency + (_random.uniform(0, jitter) if jitter else 0.0)
+        if delay > 0:
+            time.sleep(delay)
+        failed = _random.random() < getattr(settings, 'BANNER_FIXTURE_FAILURE_RATE', 0.0)
+        with _lock:
+            _stats['queries'] += 1
+            _stats['latency_seconds'] += delay
+            if failed:
+                _stats['failures'] += 1
+        if failed:
+            raise FixtureError("ORA-03113: end-of-file on communication channel (injected by the fixture source)")
+        return super(FixtureCursor, self).execute(statement, parameters)
+
+    def fetchall(self):
+        results = super(FixtureCursor, self).fetchall()
+        with _lock:
+            _stats['rows'] += len(results)
+        return results
+
+    def fetchmany(self, size=None):
+        results = super(FixtureCursor, self).fetchmany(size)
+        with _lock:
+            _stats['rows'] += len(results)
+        return results
+
+
+@contextlib.contextmanager
+def cursor():
+    """context manager yielding a FixtureCursor - the BANNER_DATA_SOURCE used when it is set to fixture"""
+    cur = FixtureCursor(database().cursor())
+    try:
+        yield cur
+    finally:
+        cur.close()
+
+
+def stats():
+    """the queries run, failures injected, rows fetched and latency added since the last reset_stats()
+
+    :rtype: OrderedDict
+    """
+    with _lock:
+        return OrderedDict(_stats)
+
+
+def reset_stats():
+    for name in _stats:
+        _stats[name] = 0.0 if name == 'latency_seconds' else 0
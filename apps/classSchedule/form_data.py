@@ -0,0 +1,175 @@
+"""classSchedule/form_data.py - loads the drop down data of the course search form pages in one go"""
+
+# django
+from django.conf import settings
+from django.db import connections
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# djClassSchedulePrj
+from apps.classSchedule import metrics
+from apps.classSchedule.oracle_models import Campus
+from apps.classSchedule.oracle_models import Instructors
+from apps.classSchedule.oracle_models import PelSpecialized
+from apps.classSchedule.oracle_models import PelTerms
+from apps.classSchedule.oracle_models import PerspectiveAreas
+from apps.classSchedule.oracle_models import ResSpecialized
+from apps.classSchedule.oracle_models import ResTerms
+from apps.classSchedule.oracle_models import Subjects
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def executor():
+    """the process-wide thread pool the form lookups run on, FORM_DATA_WORKERS threads wide
+
+    :rtype: ThreadPoolExecutor
+    """
+    global _executor, _executor_pid
+    if _executor_pid != os.getpid():
+        with _executor_lock:
+            if _executor_pid != os.getpid():
+                # threads do not survive a fork, so a forked worker starts with its own pool
+                _executor = ThreadPoolExecutor(max_workers=getattr(settings, 'FORM_DATA_WORKERS', 6))
+                _executor_pid = os.getpid()
+    return _executor
+
+
+def load(lookup, args):
+    """lookup(*args) on a form executor thread, closing the database connections it opened there - django only
+    closes the ones of request threads"""
+    try:
+        return lookup(*args)
+    finally:
+        connections.close_all()
+
+
+class SearchFormData(object):
+    """the drop down data of a course search form page
+
+    the lookups already in the cache are read straight away, and the ones that are not run concurrently on the
+    form executor, so a cold page costs about as much as its slowest Banner query instead of the sum of all of them.
+    """
+
+    # search filter -> (attribute, code index, description index) of its drop down rows
+    CHOICES = {
+        'subject': ('subjects', 1, 2),
+        'area': ('perspective_areas', 0, 1),
+        'instructor': ('instructors', 2, 2),
+        'specialized': ('specialized', 0, 1),
+        'campus': ('campuses', 2, 3),
+    }
+
+    def __init__(self, lookups, only=None):
+        """
+        :param lookups: a list of (attribute, TimedCache function, args) to load onto this object
+        :param only: the attributes to load, defaults to every one
+        """
+        started = time.time()
+        lookups = [lookup for lookup in lookups if only is None or lookup[0] in only]
+        pending = []
+        for attribute, lookup, args in lookups:
+            entry = lookup.cached(*args)
+            if entry is not None:
+                setattr(self, attribute, entry[0])
+            else:
+                pending.append((attribute, executor().submit(metrics.carried(load), lookup, args)))
+        for attribute, future in pending:
+            setattr(self, attribute, future.result())
+        logging.getLogger('django').debug("search form data loaded - %s of %s lookups from Oracle in %.3fs" % (
+            len(pending), len(lookups), time.time() - started))
+
+    @staticmethod
+    def pel_lookups(term, ptrm):
+        """the (attribute, TimedCache function, args) of every drop down of course_search_pel.html
+
+        :param term: the pel term code
+        :param ptrm: the ptrm - ex: P5
+        :rtype: list
+        """
+        return [
+            ('selected_term_desc', PelTerms.get_selected_pel_term_desc, (term, ptrm)),
+            ('subjects', Subjects.get_all_subjects, (term, ptrm)),
+            ('perspective_areas', PerspectiveAreas.get_all_areas, ()),
+            ('instructors', Instructors.get_all_instructors, (term, ptrm)),
+            ('specialized', PelSpecialized.get_all_pel_specialized, ()),
+            ('campuses', Campus.get_campus, (term, ptrm)),
+        ]
+
+    @staticmethod
+    def res_lookups(term, ptrm):
+        """the (attribute, TimedCache function, args) of every drop down of course_search_res.html
+
+        :param term: the residential term code
+        :param ptrm: the ptrm code
+        :rtype: list
+        """
+        return [
+            ('selected_term_desc', ResTerms.get_selected_res_term_desc, (term, ptrm)),
+            ('subjects', Subjects.get_all_subjects, (term, ptrm)),
+            ('perspective_areas', PerspectiveAreas.get_all_areas, ()),
+            ('instructors', Instructors.get_all_instructors, (term, ptrm)),
+            ('specialized', ResSpecialized.get_all_res_specialized, ()),
+        ]
+
+    @classmethod
+    def pel(cls, term, ptrm, only=None):
+        """the drop downs of course_search_pel.html
+
+        :param term: the pel term code
+        :param ptrm: the ptrm - ex: P5
+        :param only: the attributes to load, defaults to every one
+        :rtype: SearchFormData
+        """
+        return cls(cls.pel_lookups(term, ptrm), only)
+
+    @classmethod
+    def res(cls, term, ptrm, only=None):
+        """the drop downs of course_search_res.html
+
+        :param term: the residential term code
+        :param ptrm: the ptrm code
+        :param only: the attributes to load, defaults to every one
+        :rtype: SearchFormData
+        """
+        return cls(cls.res_lookups(term, ptrm), only)
+
+    @staticmethod
+    def versions(lookups, only=None):
+        """when each lookup was stored in the cache, read without ever calling Oracle
+
+        :param lookups: pel_lookups() or res_lookups()
+        :param only: the attributes to read, defaults to every one
+        :rtype: list
+        :return: the stored_at time of each lookup, None for the ones not in the cache
+        """
+        entries = [lookup.cached(*args) for attribute, lookup, args in lookups if only is None or attribute in only]
+        return [entry[1] if entry is not None else None for entry in entries]
+
+    @classmethod
+    def results_attributes(cls, filters):
+        """the attributes a results page shows - the term description and the drop downs of the filters applied
+
+        :param filters: the search filter -> code of a results page
+        :rtype: list
+        """
+        return ['selected_term_desc'] + [cls.CHOICES[name][0] for name, code in filters.items()
+                                         if name in cls.CHOICES and code != '0']
+
+    def selected(self, name, code):
+        """the [code, description] of the choice code of the drop down of the search filter name
+
+        :rtype: list
+        """
+        if code == '0':
+            return ['0', 'All']
+        attribute, code_index, description_index = self.CHOICES[name]
+        for row in getattr(self, attribute, None) or []:
+            if str(row[code_index]) == code:
+                return [code, row[description_index]]
+        return [code, code]
@@ -0,0 +1,172 @@
+"""classSchedule/fulltext.py - ranked keyword search over the course titles and descriptions of a term
+
+The CRSE_TITLE, TEXT and CRSE_TEXT of every section of a term are split into words and kept in an inverted index,
+word -> {CRN: weighted frequency}. A search keeps the sections holding every word of the query and ranks them with
+BM25, a word of the title counting FIELD_WEIGHTS more than one of the descriptions. When the sections of a term are
+reloaded only the sections whose text changed are indexed again.
+"""
+
+# python
+import logging
+import math
+import re
+import threading
+import time
+
+# djClassSchedulePrj
+from apps.classSchedule.timed_cache import TermMap
+
+WORD = re.compile(r"[^\W_]+")
+
+STOP_WORDS = frozenset(
+    "a an and are as at be by for from has in into is it its of on or that the this to was will with".split())
+
+# the weight of a word in CRSE_TITLE, TEXT and CRSE_TEXT
+FIELD_WEIGHTS = (3.0, 1.0, 1.0)
+
+# the BM25 term frequency saturation and length normalization
+K1 = 1.2
+B = 0.75
+
+
+def words(text):
+    """the indexed words of text - lower case, without stop words and with a plural s dropped, so "ethics" finds
+    "ethic" and the other way round
+
+    :rtype: list
+    """
+    found = []
+    for word in WORD.findall(text.lower()) if text else []:
+        if word in STOP_WORDS:
+            continue
+        if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+            word = word[:-1]
+        found.append(word)
+    return found
+
+
+def frequencies(fields):
+    """the weighted frequency of every word of a document
+
+    :param fields: the (CRSE_TITLE, TEXT, CRSE_TEXT) of a section
+    :rtype: dict
+    """
+    found = {}
+    for weight, text in zip(FIELD_WEIGHTS, fields):
+        for word in words(text):
+            found[word] = found.get(word, 0.0) + weight
+    return found
+
+
+class TextIndex(object):
+    """the inverted index of the sections of one term / ptrm"""
+
+    def __init__(self, version=None):
+        self.version = version
+        self.documents = {}
+        self.postings = {}
+        self.lengths = {}
+        self.average_length = 0.0
+        self.reindexed = 0
+
+    def updated(self, documents, version=None):
+        """a copy of this index holding documents, where only the documents added, changed or removed are indexed
+        again. the postings of the other words are shared with this index, which readers may keep using while the
+        copy is made.
+
+        :param documents: CRN -> (CRSE_TITLE, TEXT, CRSE_TEXT) of every section of the term
+        :param version: when the documents were read from Banner
+        :rtype: TextIndex
+        """
+        changed = [crn for crn, fields in documents.items() if self.documents.get(crn) != fields]
+        removed = [crn for crn in self.documents if crn not in documents]
+        index = TextIndex(version)
+        index.documents = dict(documents)
+        index.postings = dict(self.postings)
+        index.lengths = dict(self.lengths)
+        copied = set()
+
+        def posting(word):
+            if word not in copied:
+                index.postings[word] = dict(self.postings.get(word, {}))
+                copied.add(word)
+            return index.postings[word]
+
+        for crn in changed + removed:
+            if crn in self.documents:
+                for word in frequencies(self.documents[crn]):
+                    posting(word).pop(crn, None)
+                del index.lengths[crn]
+        for crn in changed:
+            found = frequencies(documents[crn])
+            for word, frequency in found.items():
+                posting(word)[crn] = frequency
+            index.lengths[crn] = sum(found.values())
+        for word in copied:
+            if not index.postings[word]:
+                del index.postings[word]
+
+        index.average_length = sum(index.lengths.values()) / len(index.lengths) if index.lengths else 0.0
+        index.reindexed = len(changed) + len(removed)
+        return index
+
+    def __len__(self):
+        return len(self.documents)
+
+    def search(self, query):
+        """the CRNs of the sections holding every word of query, best match first
+
+        :rtype: list
+        :return: a list of CRNs, empty when query has no indexed words
+        """
+        query_words = set(words(query))
+        postings = [self.postings.get(word, {}) for word in query_words]
+        if not postings:
+            return []
+        postings.sort(key=len)
+        crns = set(postings[0])
+        for posting in postings[1:]:
+            crns.intersection_update(posting)
+
+        count = len(self.documents)
+        scores = dict.fromkeys(crns, 0.0)
+        for posting in postings:
+            idf = math.log(1 + (count - len(posting) + 0.5) / (len(posting) + 0.5))
+            for crn in crns:
+                frequency = posting[crn]
+                norm = K1 * (1 - B + B * self.lengths[crn] / (self.average_length or 1.0))
+                scores[crn] += idf * frequency * (K1 + 1) / (frequency + norm)
+        return sorted(crns, key=lambda crn: (-scores[crn], crn))
+
+
+class TextIndexCache(object):
+    """the most recent TextIndex of each term / ptrm held by this process, updated from the previous one when the
+    sections of the term are reloaded - at most max_terms of them"""
+
+    def __init__(self, max_terms=None):
+        self._indexes = TermMap(max_terms)
+        self._lock = threading.Lock()
+
+    def get(self, key, version, documents):
+        """the index of key for version, updated from documents() when the one held is of another version
+
+        :param key: a (term, ptrm) tuple
+        :param version: when the documents of the term were read from Banner
+        :param documents: a callable returning the CRN -> (CRSE_TITLE, TEXT, CRSE_TEXT) of the term
+        :rtype: TextIndex
+        """
+        index = self._indexes.get(key)
+        if index is not None and index.version == version:
+            return index
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is None or index.version != version:
+                started = time.time()
+                index = self._indexes[key] = (index or TextIndex()).updated(documents(), version)
+                logging.getLogger('django').debug("text index %s - %s of %s sections indexed in %.3fs" % (
+                    key, index.reindexed, len(index), time.time() - started))
+        return index
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
@@ -0,0 +1,41 @@
+"""banner_fixtures - writes the fixtures file the fixture data source (BANNER_DATA_SOURCE=fixture) is read from
+
+    python manage.py banner_fixtures /tmp/banner.json --sections 5000
+    python manage.py banner_fixtures /tmp/banner.json --record
+"""
+
+# django
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+# python
+import cx_Oracle
+
+# djClassSchedulePrj
+from apps.classSchedule import fixture_source
+
+
+class Command(BaseCommand):
+    help = "Write generated, or with --record real, SWV* view rows to a file BANNER_FIXTURES can point at"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="the JSON file to write")
+        parser.add_argument('--record', action='store_true',
+                            help="read the rows from Banner instead of generating them")
+        parser.add_argument('--sections', type=int, default=2000,
+                            help="generated sections in every term / ptrm (default 2000)")
+        parser.add_argument('--seed', type=int, default=0, help="seed of the generated data (default 0)")
+
+    def handle(self, *args, **options):
+        if options['record']:
+            try:
+                counts = fixture_source.record(options['path'])
+            except cx_Oracle.DatabaseError as e:
+                raise CommandError("could not record the Banner views: %s" % e)
+        else:
+            views = fixture_source.generate(sections=options['sections'], seed=options['seed'])
+            fixture_source.write(options['path'], views)
+            counts = dict((view, len(rows)) for view, rows in views.items())
+        for view, rows in counts.items():
+            self.stdout.write("%s - %s rows" % (view, rows))
+        self.stdout.write(self.style.SUCCESS("fixtures written to %s" % options['path']))
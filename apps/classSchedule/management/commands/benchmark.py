@@ -0,0 +1,304 @@
+"""benchmark - measures the five public views under concurrent load against a local data source
+
+every view is run in two scenarios: cold, where the caches are emptied before each round of concurrent requests,
+and warm, where they are filled first. the results are printed and can be saved as JSON and compared between
+commits:
+
+    python manage.py benchmark --output before.json
+    python manage.py benchmark --latency 0.02 --concurrency 16 --compare before.json --output after.json
+
+--rows measures the cached section rows of a term instead: their pickled size, the time to unpickle them on a
+cache hit and the memory they take once unpickled, as plain tuples and as SectionRows of SectionRecords.
+"""
+
+# python
+import datetime
+import json
+import logging
+import math
+import pickle
+import platform
+import resource
+import subprocess
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# django
+import django
+from django.conf import settings
+from django.core import urlresolvers
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.test import Client
+from django.test.utils import override_settings
+
+# djClassSchedulePrj
+from apps.classSchedule import banner
+from apps.classSchedule import fixture_source
+from apps.classSchedule import schedules
+from apps.classSchedule import timed_cache
+from apps.classSchedule import typeahead
+from apps.classSchedule.oracle_models import PelTerms
+from apps.classSchedule.oracle_models import ResTerms
+from apps.classSchedule.oracle_models import Section
+from apps.classSchedule.snapshot import SectionRows
+from apps.classSchedule.snapshot import section_records
+
+VIEWS = ['localsite', 'course_search_pel', 'course_search_res', 'course_search_results_pel',
+         'course_search_results_res']
+SCENARIOS = ['cold', 'warm']
+
+
+def percentile(values, percent):
+    """the nearest-rank percentile of values"""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    return ordered[max(int(math.ceil(percent / 100.0 * len(ordered))) - 1, 0)]
+
+
+def reset_caches():
+    """empty every cache a request can be answered from - the django cache, the local cache, the snapshots and the
+    indexes built from them"""
+    cache.clear()
+    timed_cache.local_cache().clear()
+    Section.snapshots.clear()
+    Section.text_indexes.clear()
+    typeahead.clear()
+    schedules.clear()
+
+
+class Command(BaseCommand):
+    help = "Measure latency, throughput, Banner queries, cache hit ratio and peak RSS of the public views"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--view', action='append', choices=VIEWS, dest='views',
+                            help="benchmark just this view, may be given more than once (default every view)")
+        parser.add_argument('--scenario', action='append', choices=SCENARIOS, dest='scenarios',
+                            help="run just the cold or the warm scenario (default both)")
+        parser.add_argument('--requests', type=int, default=100, help="requests per view and scenario (default 100)")
+        parser.add_argument('--concurrency', type=int, default=8, help="requests in flight at once (default 8)")
+        parser.add_argument('--source', default='fixture',
+                            help="the BANNER_DATA_SOURCE to run against (default fixture)")
+        parser.add_argument('--latency', type=float, default=None,
+                            help="seconds added to every fixture query (default BANNER_FIXTURE_LATENCY)")
+        parser.add_argument('--rows', action='store_true',
+                            help="measure the cached section rows of the first pel term instead of the views")
+        parser.add_argument('--output', help="save the results to this JSON file")
+        parser.add_argument('--compare', help="print the change against the results saved in this JSON file")
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError("--requests and --concurrency must be at least 1")
+        latency = options['latency']
+        if latency is None:
+            latency = getattr(settings, 'BANNER_FIXTURE_LATENCY', 0.0)
+
+        logger = logging.getLogger('django')
+        level = logger.level
+        if options['verbosity'] < 2:
+            logger.setLevel(logging.WARNING)
+        overrides = override_settings(
+            BANNER_DATA_SOURCE=options['source'], BANNER_FIXTURE_LATENCY=latency,
+            ALLOWED_HOSTS=list(settings.ALLOWED_HOSTS) + ['testserver'])
+        try:
+            with overrides:
+                if options['rows']:
+                    report = self.rows(options['requests'])
+                else:
+                    report = self.benchmark(options['views'] or VIEWS, options['scenarios'] or SCENARIOS,
+                                            options['requests'], options['concurrency'], options['source'],
+                                            latency)
+        finally:
+            logger.setLevel(level)
+
+        if options['compare'] and not options['rows']:
+            with open(options['compare']) as baseline_file:
+                self.compare(json.load(baseline_file), report)
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                json.dump(report, output_file, indent=2)
+            self.stdout.write(self.style.SUCCESS("results saved to %s" % options['output']))
+
+    def benchmark(self, views, scenarios, requests, concurrency, source, latency):
+        """run every scenario of every view
+
+        :rtype: OrderedDict
+        :return: the environment the benchmark ran in and a result per view and scenario
+        """
+        reset_caches()
+        pel_terms = PelTerms.get_pel_terms()
+        res_terms = ResTerms.get_res_terms()
+        if not pel_terms or not res_terms:
+            raise CommandError("no pel or residential terms could be read from the %s data source" % source)
+        self.pel_term = pel_terms[0][:2]
+        self.res_term = res_terms[0][:2]
+
+        report = OrderedDict([
+            ('created', datetime.datetime.now().isoformat()),
+            ('commit', self.commit()),
+            ('python', platform.python_version()),
+            ('django', django.get_version()),
+            ('source', source),
+            ('latency', latency),
+            ('requests', requests),
+            ('concurrency', concurrency),
+            ('results', []),
+        ])
+        for view in views:
+            for scenario in scenarios:
+                result = self.run(view, scenario, requests, concurrency, source)
+                report['results'].append(result)
+                self.stdout.write(
+                    "%-26s %-4s p50 %7.1fms  p95 %7.1fms  p99 %7.1fms  %7.1f req/s  %5s queries  %5.1f%% hits  "
+                    "%s errors" % (view, scenario, result['latency_ms']['p50'], result['latency_ms']['p95'],
+                                   result['latency_ms']['p99'], result['throughput'], result['banner_queries'],
+                                   result['hit_ratio'] * 100, result['errors']))
+        # the peak resident memory of the process never goes down, so it is only worth reporting for the whole run.
+        # ru_maxrss is in kilobytes on linux
+        report['peak_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        self.stdout.write("peak resident memory %s kB" % report['peak_rss_kb'])
+        return report
+
+    def rows(self, repeat):
+        """the pickled size, unpickle time and unpickled memory of the sections of the first pel term, as plain
+        tuples and as the SectionRows the section lookups cache
+
+        :rtype: OrderedDict
+        """
+        pel_terms = PelTerms.get_pel_terms()
+        if not pel_terms:
+            raise CommandError("no pel terms could be read")
+        term, ptrm = pel_terms[0][:2]
+        sections = Section.get_pel_sections(term, ptrm, subject='0', instructor='0', area='0', spec='0',
+                                            campus='0', open_only='0')
+        # fresh copies of the values, as they are fetched from Banner
+        tuples = [tuple(value.encode().decode() if isinstance(value, str) else value for value in section)
+                  for section in sections]
+        forms = OrderedDict([('tuples', tuples), ('section_rows', section_records(tuples))])
+        report = OrderedDict([('created', datetime.datetime.now().isoformat()), ('commit', self.commit()),
+                              ('python', platform.python_version()), ('term', term), ('ptrm', ptrm),
+                              ('rows', len(sections)), ('results', [])])
+        for form, rows in forms.items():
+            pickled = pickle.dumps(rows, pickle.HIGHEST_PROTOCOL)
+            started = time.perf_counter()
+            for _ in range(repeat):
+                pickle.loads(pickled)
+            loads_ms = (time.perf_counter() - started) / repeat * 1000
+
+            tracemalloc.start()
+            unpickled = pickle.loads(pickled)
+            memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            if list(unpickled) != list(rows):
+                raise CommandError("the %s rows did not unpickle to the rows that were pickled" % form)
+            if isinstance(unpickled, SectionRows) != (form == 'section_rows'):
+                raise CommandError("the %s rows unpickled as %s" % (form, type(unpickled).__name__))
+
+            report['results'].append(OrderedDict([('form', form), ('pickled_bytes', len(pickled)),
+                                                  ('loads_ms', loads_ms), ('memory_bytes', memory)]))
+            self.stdout.write("%-12s %6s rows  %9s pickled bytes  %7.3fms per unpickle  %9s bytes unpickled" % (
+                form, len(rows), len(pickled), loads_ms, memory))
+        return report
+
+    def path(self, view):
+        """the url of view, for the first pel or residential term"""
+        if view == 'localsite':
+            return urlresolvers.reverse(view)
+        return urlresolvers.reverse(view, args=self.pel_term if view.endswith('pel') else self.res_term)
+
+    def run(self, view, scenario, requests, concurrency, source):
+        """send requests to view, concurrency at a time
+
+        :rtype: OrderedDict
+        """
+        path = self.path(view)
+        clients = threading.local()
+
+        def request():
+            if not hasattr(clients, 'client'):
+                clients.client = Client()
+            started = time.perf_counter()
+            response = clients.client.get(path)
+            if response.streaming:
+                # a streamed page is only done once its last chunk is read
+                b''.join(response.streaming_content)
+            return time.perf_counter() - started, response.status_code
+
+        reset_caches()
+        if scenario == 'warm':
+            request()
+        queries = self.banner_queries(source)
+        timed_cache.reset_stats()
+        Section.snapshots.reset_stats()
+
+        timings = []
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            if scenario == 'cold':
+                # every round starts from empty caches, so each one measures a burst of concurrent misses
+                for first in range(0, requests, concurrency):
+                    reset_caches()
+                    round_size = min(concurrency, requests - first)
+                    timings.extend(future.result() for future in [executor.submit(request)
+                                                                  for _ in range(round_size)])
+            else:
+                timings.extend(executor.map(lambda _: request(), range(requests)))
+        elapsed = time.perf_counter() - started
+
+        lookups = timed_cache.stats()
+        snapshots = Section.snapshots.stats()
+        answered = sum(lookups.values()) + sum(snapshots.values())
+        latencies = [seconds * 1000 for seconds, status in timings]
+        return OrderedDict([
+            ('view', view),
+            ('scenario', scenario),
+            ('requests', len(timings)),
+            ('errors', sum(1 for seconds, status in timings if status != 200)),
+            ('latency_ms', OrderedDict([
+                ('p50', percentile(latencies, 50)),
+                ('p95', percentile(latencies, 95)),
+                ('p99', percentile(latencies, 99)),
+                ('mean', sum(latencies) / len(latencies)),
+                ('max', max(latencies)),
+            ])),
+            ('throughput', len(timings) / elapsed),
+            ('banner_queries', self.banner_queries(source) - queries),
+            ('hit_ratio', (answered - lookups['misses'] - snapshots['misses']) / answered if answered else 0.0),
+            ('timed_cache', lookups),
+            ('snapshots', snapshots),
+        ])
+
+    @staticmethod
+    def banner_queries(source):
+        """queries run by the fixture source, or Banner sessions borrowed from the pool for the other sources"""
+        if source == 'fixture':
+            return fixture_source.stats()['queries']
+        return banner.gateway().stats()['acquired']
+
+    @staticmethod
+    def commit():
+        try:
+            return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.SITE_ROOT,
+                                           stderr=subprocess.DEVNULL).decode().strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def compare(self, baseline, report):
+        """print the p95 latency and throughput change of every view and scenario found in both reports"""
+        before = dict(((result['view'], result['scenario']), result) for result in baseline['results'])
+        self.stdout.write("compared with %s (%s)" % (baseline.get('commit'), baseline.get('created')))
+        for result in report['results']:
+            old = before.get((result['view'], result['scenario']))
+            if old is None:
+                continue
+            p95 = (result['latency_ms']['p95'] - old['latency_ms']['p95']) / (old['latency_ms']['p95'] or 1)
+            throughput = (result['throughput'] - old['throughput']) / (old['throughput'] or 1)
+            style = self.style.ERROR if p95 > 0.1 else self.style.SUCCESS
+            self.stdout.write(style("%-26s %-4s p95 %+6.1f%%  throughput %+6.1f%%  queries %s -> %s" % (
+                result['view'], result['scenario'], p95 * 100, throughput * 100, old['banner_queries'],
+                result['banner_queries'])))
@@ -0,0 +1,52 @@
+"""sync_mirror - copies the Banner views the class schedule reads into the local SQLite mirror
+
+run it from cron at the interval the mirror may lag Banner by:
+
+    */5 * * * * python manage.py sync_mirror
+    python manage.py sync_mirror --view SWVSECT_WEB --batch-size 5000
+"""
+
+# python
+import datetime
+
+# django
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+# python
+import cx_Oracle
+
+# djClassSchedulePrj
+from apps.classSchedule import mirror
+
+
+class Command(BaseCommand):
+    help = "Copy the SWV* Banner views into the extra database read when BANNER_DATA_SOURCE=mirror"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--view', action='append', choices=list(mirror.MIRRORED_VIEWS), dest='views',
+                            help="sync just this view, may be given more than once (default every view)")
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="rows fetched from Banner and inserted at a time (default 1000)")
+        parser.add_argument('--status', action='store_true',
+                            help="show the generation of each view in the mirror instead of syncing")
+
+    def handle(self, *args, **options):
+        if options['status']:
+            for view, generation, synced_at, row_count in mirror.status():
+                self.stdout.write("%s - generation %s - %s rows - synced %s" % (
+                    view, generation, row_count, datetime.datetime.fromtimestamp(synced_at).isoformat(' ')))
+            return
+
+        failed = []
+        for view in options['views'] or mirror.MIRRORED_VIEWS:
+            try:
+                synced = mirror.sync([view], batch_size=options['batch_size'])
+            except cx_Oracle.DatabaseError as e:
+                failed.append(view)
+                self.stderr.write(self.style.ERROR("%s failed, the previous generation is kept: %s" % (view, e)))
+                continue
+            rows, seconds = synced[view]
+            self.stdout.write(self.style.SUCCESS("%s - %s rows in %.3fs" % (view, rows, seconds)))
+        if failed:
+            raise CommandError("%s views could not be synced: %s" % (len(failed), ', '.join(failed)))
@@ -0,0 +1,132 @@
+"""warm_cache - fills the cache with every Banner lookup the class schedule pages need
+
+run it as a post-deploy hook, after a cache flush or from cron:
+
+    python manage.py warm_cache --workers 4
+    python manage.py warm_cache --refresh --kind res
+"""
+
+# python
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# django
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+# djClassSchedulePrj
+from apps.classSchedule.oracle_models import Campus
+from apps.classSchedule.oracle_models import Instructors
+from apps.classSchedule.oracle_models import PelSpecialized
+from apps.classSchedule.oracle_models import PelTerms
+from apps.classSchedule.oracle_models import PerspectiveAreas
+from apps.classSchedule.oracle_models import ResSpecialized
+from apps.classSchedule.oracle_models import ResTerms
+from apps.classSchedule.oracle_models import Section
+from apps.classSchedule.oracle_models import Subjects
+
+
+class Command(BaseCommand):
+    help = ("Prefill the cache with the term lists, search form drop downs, full section sets, instructor indexes "
+            "and course descriptions of every term / ptrm in SWVPTRM_UP_WEB and SWVPTRM_UR_WEB")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4,
+                            help="lookups run in parallel, each on its own pooled Banner session (default 4)")
+        parser.add_argument('--kind', choices=['all', 'pel', 'res'], default='all',
+                            help="warm the pel terms, the residential terms or both (default all)")
+        parser.add_argument('--refresh', action='store_true',
+                            help="recompute every lookup, not just the ones missing from the cache")
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError("--workers must be at least 1")
+        started = time.time()
+        self.refresh = options['refresh']
+        self.results = []
+
+        # the term lists drive everything else, so they are warmed first
+        lookups = []
+        if options['kind'] in ('all', 'pel'):
+            pel_terms = self.report(*self.timed(PelTerms.get_pel_terms, ())) or []
+            lookups.append((PelSpecialized.get_all_pel_specialized, ()))
+            for term, ptrm in self.term_codes(pel_terms):
+                lookups.extend([
+                    (PelTerms.get_selected_pel_term_desc, (term, ptrm)),
+                    (Subjects.get_all_subjects, (term, ptrm)),
+                    (Instructors.get_all_instructors, (term, ptrm)),
+                    (Campus.get_campus, (term, ptrm)),
+                    (Section.get_term_sections, (term, ptrm)),
+                    (Section.get_term_seats, (term, ptrm)),
+                    (Section.get_instructor_index, (term, ptrm)),
+                    (Section.get_term_descriptions, (term, ptrm)),
+                ])
+        if options['kind'] in ('all', 'res'):
+            res_terms = self.report(*self.timed(ResTerms.get_res_terms, ())) or []
+            lookups.append((ResSpecialized.get_all_res_specialized, ()))
+            for term, ptrm in self.term_codes(res_terms):
+                lookups.extend([
+                    (ResTerms.get_selected_res_term_desc, (term, ptrm)),
+                    (Subjects.get_all_subjects, (term, ptrm)),
+                    (Instructors.get_all_instructors, (term, ptrm)),
+                    (Section.get_term_sections, (term, ptrm)),
+                    (Section.get_term_seats, (term, ptrm)),
+                    (Section.get_instructor_index, (term, ptrm)),
+                    (Section.get_term_descriptions, (term, ptrm)),
+                ])
+        # the keyword search index is kept in each web process and built there from the cached rows and
+        # descriptions warmed above, so the first keyword search of a term does not wait on Banner
+        lookups.append((PerspectiveAreas.get_all_areas, ()))
+
+        # pel and residential terms share subjects and instructors lookups for the same term / ptrm
+        unique = []
+        for lookup in lookups:
+            if lookup not in unique:
+                unique.append(lookup)
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            futures = [executor.submit(self.timed, lookup, args) for lookup, args in unique]
+            for future in futures:
+                self.report(*future.result())
+
+        results = self.results
+        failed = sum(1 for status, elapsed in results if status == 'failed')
+        warmed = sum(1 for status, elapsed in results if status == 'warmed')
+        slowest = max([elapsed for status, elapsed in results] or [0])
+        summary = "%s lookups - %s warmed - %s already cached - %s failed - slowest %.3fs - total %.3fs" % (
+            len(results), warmed, len(results) - warmed - failed, failed, slowest, time.time() - started)
+        self.stdout.write(self.style.ERROR(summary) if failed else self.style.SUCCESS(summary))
+        if failed:
+            raise CommandError("%s lookups could not be read from Banner" % failed)
+
+    @staticmethod
+    def term_codes(terms):
+        """the distinct (TERM, PTRM) pairs of SWVPTRM_UP_WEB / SWVPTRM_UR_WEB rows"""
+        codes = []
+        for term in terms:
+            if (term[0], term[1]) not in codes:
+                codes.append((term[0], term[1]))
+        return codes
+
+    def timed(self, lookup, args):
+        """warm lookup(*args), recomputing it unless it is cached and --refresh was not given
+
+        :rtype: tuple
+        :return: the lookup, its args, its value, cached / warmed / failed and the seconds it took
+        """
+        started = time.time()
+        entry = lookup.cached(*args) if not self.refresh else None
+        if entry is not None:
+            status = 'cached'
+        else:
+            entry = lookup.refresh(*args)
+            status = 'warmed' if entry[0] is not None else 'failed'
+        return lookup, args, entry[0], status, time.time() - started
+
+    def report(self, lookup, args, value, status, elapsed):
+        """print the progress line of a warmed lookup and hand its value back"""
+        self.results.append((status, elapsed))
+        style = self.style.ERROR if status == 'failed' else self.style.SUCCESS
+        self.stdout.write("[%s] %s%s %s %.3fs" % (
+            len(self.results), lookup.__qualname__, args, style(status), elapsed))
+        return value
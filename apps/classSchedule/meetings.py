@@ -0,0 +1,141 @@
+"""classSchedule/meetings.py - the weekly meeting pattern of a section as a bitmask
+
+A week is 7 days of 288 five-minute slots, and the meetings of a section are an int with a bit set for every slot
+it meets in - bit day * SLOTS_PER_DAY + slot, Monday first. Parsed once from DAYS and MEET_TIME when the sections of
+a term are loaded, the masks answer "meets only on these days", "within this window" and "not before" as one
+bitwise test per section, and tell whether two sections clash with a single AND.
+"""
+
+# python
+import re
+
+# the DAYS letters, Monday first
+DAY_LETTERS = 'MTWRFSU'
+SLOT_MINUTES = 5
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+WEEK = (1 << SLOTS_PER_DAY * len(DAY_LETTERS)) - 1
+
+# the choices of the meeting filters of the search forms
+DAY_CHOICES = (('M', 'Monday'), ('T', 'Tuesday'), ('W', 'Wednesday'), ('R', 'Thursday'), ('F', 'Friday'),
+               ('S', 'Saturday'), ('U', 'Sunday'))
+TIME_CHOICES = tuple(('%02d00' % hour, '%d:00 %s' % (hour % 12 or 12, 'am' if hour < 12 else 'pm'))
+                     for hour in range(6, 24))
+
+# 1400, 14:00, 2:00 pm or 2pm
+TIME = re.compile(r'^(\d{1,2}):?(\d{2})?\s*(?:([ap])\.?m\.?)?$', re.IGNORECASE)
+
+
+def minutes(text):
+    """the minutes after midnight of a time of day - ex: '1400', '14:00' or '2:00 pm'
+
+    :rtype: int
+    :return: minutes - None when text is not a time
+    """
+    match = TIME.match(str(text).strip()) if text else None
+    if match is None:
+        return None
+    hours, mins, half = match.groups()
+    if mins is None and half is None:
+        # a bare '9' could be morning or evening
+        return None
+    hours, mins = int(hours), int(mins or 0)
+    if half is not None:
+        if not 1 <= hours <= 12:
+            return None
+        hours = hours % 12 + (12 if half.lower() == 'p' else 0)
+    if hours > 24 or mins > 59 or hours * 60 + mins > 24 * 60:
+        return None
+    return hours * 60 + mins
+
+
+def time_code(text):
+    """a time of day as the HHMM the results urls hold - ex: '2:00 pm' is '1400'
+
+    :rtype: str
+    :return: code - '0' when text is not a time
+    """
+    found = minutes(text)
+    return '%02d%02d' % divmod(found, 60) if found is not None else '0'
+
+
+def day_letters(days):
+    """the DAYS letters of days in week order, without repeats or anything else - ex: 'F M-W' is 'MWF'
+
+    :rtype: str
+    """
+    found = set(str(days or '').upper())
+    return ''.join(letter for letter in DAY_LETTERS if letter in found)
+
+
+def slots(start, end):
+    """the mask of the slots of one day from start up to end minutes, every slot touched by the range included
+
+    :rtype: int
+    """
+    first = start // SLOT_MINUTES
+    last = -(-end // SLOT_MINUTES)
+    return ((1 << last) - 1) ^ ((1 << first) - 1) if last > first else 0
+
+
+def on_days(letters, day_mask):
+    """day_mask repeated on each day of letters
+
+    :rtype: int
+    """
+    mask = 0
+    for letter in letters:
+        mask |= day_mask << DAY_LETTERS.index(letter) * SLOTS_PER_DAY
+    return mask
+
+
+def meeting_mask(days, meet_time):
+    """the weekly mask of one meeting - ex: ('MWF', '0900-0950')
+
+    :rtype: int
+    :return: mask - 0 when the meeting has no days or no time, ex: TBA
+    """
+    letters = day_letters(days)
+    times = str(meet_time or '').split('-')
+    if not letters or len(times) != 2:
+        return 0
+    start, end = minutes(times[0]), minutes(times[1])
+    if start is None or end is None or end <= start:
+        return 0
+    return on_days(letters, slots(start, end))
+
+
+def section_masks(meetings):
+    """the weekly mask of every section, the meetings of each CRN combined
+
+    :param meetings: (CRN, DAYS, MEET_TIME) of every meeting
+    :rtype: dict
+    :return: CRN -> mask
+    """
+    masks = {}
+    for crn, days, meet_time in meetings:
+        masks[crn] = masks.get(crn, 0) | meeting_mask(days, meet_time)
+    return masks
+
+
+def allowed_mask(days='0', start='0', end='0'):
+    """the slots a section may meet in to pass the meeting filters of a search - on the days of days, not before
+    start and done by end, each '0' when not applied
+
+    :param days: DAYS letters - ex: 'MWF'
+    :param start: a time of day - ex: '0900'
+    :param end: a time of day - ex: '1700'
+    :rtype: int
+    :return: mask - None when no meeting filter is applied
+    """
+    if days == '0' and start == '0' and end == '0':
+        return None
+    first = minutes(start) if start != '0' else None
+    last = minutes(end) if end != '0' else None
+    window = slots(first if first is not None else 0, last if last is not None else 24 * 60)
+    return on_days(day_letters(days) if days != '0' else DAY_LETTERS, window)
+
+
+def fits(mask, allowed):
+    """the section of mask meets, and only in the slots of allowed - a section without set meeting times (TBA,
+    online or arranged, mask 0) never fits, so the day and time filters leave those out, as the forms say"""
+    return mask != 0 and not mask & (WEEK ^ allowed)
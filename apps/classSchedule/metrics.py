@@ -0,0 +1,202 @@
+"""classSchedule/metrics.py - counters and histograms of the Banner lookups, the caches and the views
+
+The metrics are kept in memory by each process and served in the Prometheus text format by the ``metrics`` view
+at /metrics. With several worker processes each scrape sees the worker that answered it, so scrape every worker or
+sum over the ``instance`` label.
+
+The request latency of a streamed results page runs until its last chunk is sent, as its sections are read from
+Banner while the page streams - a request is only observed once the server has finished sending it.
+"""
+
+# python
+import bisect
+import contextlib
+import functools
+import threading
+from collections import OrderedDict
+
+# the histogram buckets, in seconds, of query and request latency
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = []
+_context = threading.local()
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, escape(value)) for name, value in pairs)
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return '%d' % value
+    return repr(value)
+
+
+class Metric(object):
+    """a named family of samples, one per combination of label values"""
+
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._samples = OrderedDict()
+        _registry.append(self)
+
+    def key(self, labels):
+        try:
+            return tuple(str(labels[name]) for name in self.labels)
+        except KeyError as e:
+            raise ValueError("%s needs the label %s" % (self.name, e))
+
+    def render(self):
+        lines = ['# HELP %s %s' % (self.name, self.documentation), '# TYPE %s %s' % (self.name, self.kind)]
+        with self._lock:
+            samples = list(self._samples.items())
+        for values, sample in samples:
+            lines.extend(self.render_sample(values, sample))
+        return lines
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self._lock:
+            self._samples[key] = self._samples.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._samples.get(self.key(labels), 0)
+
+    def render_sample(self, values, sample):
+        return ['%s%s %s' % (self.name, format_labels(self.labels, values), format_value(sample))]
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super(Histogram, self).__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        with self._lock:
+            sample = self._samples.get(key)
+            if sample is None:
+                # a count per bucket (the last one is +Inf), then the sum of the values observed
+                sample = self._samples[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            sample[bisect.bisect_left(self.buckets, value)] += 1
+            sample[-1] += value
+
+    def count(self, **labels):
+        with self._lock:
+            sample = self._samples.get(self.key(labels))
+            return sum(sample[:-1]) if sample is not None else 0
+
+    def render_sample(self, values, sample):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), sample[:-1]):
+            cumulative += count
+            lines.append('%s_bucket%s %s' % (self.name, format_labels(self.labels, values, [('le', format_value(
+                float(bound)))]), cumulative))
+        lines.append('%s_sum%s %s' % (self.name, format_labels(self.labels, values), format_value(sample[-1])))
+        lines.append('%s_count%s %s' % (self.name, format_labels(self.labels, values), cumulative))
+        return lines
+
+
+class Gauge(Metric):
+    """a metric read when it is scraped - collect() returns the current value of every label combination"""
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, collect, labels=()):
+        super(Gauge, self).__init__(name, documentation, labels)
+        self.collect = collect
+
+    def render(self):
+        lines = ['# HELP %s %s' % (self.name, self.documentation), '# TYPE %s %s' % (self.name, self.kind)]
+        for values, value in self.collect():
+            lines.append('%s%s %s' % (self.name, format_labels(self.labels, values), format_value(value)))
+        return lines
+
+
+def render():
+    """every metric of this process in the Prometheus text exposition format
+
+    :rtype: str
+    """
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+@contextlib.contextmanager
+def labelled(**labels):
+    """label the metrics recorded by this thread inside the block, ex: with labelled(function='Section.get_x')"""
+    previous = dict((name, getattr(_context, name, None)) for name in labels)
+    for name, value in labels.items():
+        setattr(_context, name, value)
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            setattr(_context, name, value)
+
+
+def carried(fn):
+    """fn wrapped to record its metrics with the labels of the calling thread, for work handed to another thread
+
+    :rtype: function
+    """
+    labels = dict((name, value) for name, value in vars(_context).items() if value is not None)
+
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        with labelled(**labels):
+            return fn(*args, **kwargs)
+    return run
+
+
+def current(name, default='unknown'):
+    """the value labelled() set for name in this thread"""
+    value = getattr(_context, name, None)
+    return value if value is not None else default
+
+
+CACHE_LOOKUPS = Counter('classschedule_cache_lookups_total',
+                        "TimedCache lookups by how they were answered - hit, stale, miss or peek",
+                        ['function', 'outcome', 'view'])
+CACHE_STORED_BYTES = Counter('classschedule_cache_stored_bytes_total',
+                             "pickled bytes of the TimedCache entries written to the cache", ['function', 'view'])
+SNAPSHOT_LOOKUPS = Counter('classschedule_snapshot_lookups_total',
+                           "section snapshot lookups by how they were answered - hit, stale or miss",
+                           ['outcome', 'view'])
+BANNER_QUERY_SECONDS = Histogram('classschedule_banner_query_seconds',
+                                 "seconds a lookup held a Banner cursor, from borrowing a session to the last fetch",
+                                 ['function', 'view'])
+BANNER_ROWS = Counter('classschedule_banner_rows_fetched_total', "rows fetched from Banner", ['function', 'view'])
+BANNER_ERRORS = Counter('classschedule_banner_errors_total', "Banner queries that raised a DatabaseError",
+                        ['function', 'view'])
+REQUEST_SECONDS = Histogram('classschedule_request_seconds',
+                            "seconds taken to answer a request, until the last chunk of a streamed response",
+                            ['view', 'status'])
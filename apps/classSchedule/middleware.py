@@ -0,0 +1,57 @@
+"""classSchedule/middleware.py - request level instrumentation"""
+
+# python
+import time
+
+# django
+from django.core import urlresolvers
+
+# djClassSchedulePrj
+from apps.classSchedule import metrics
+
+
+class MetricsMiddleware(object):
+    """records how long each request took in classschedule_request_seconds, labelled by view name and status.
+    a streamed response is timed until its last chunk has been sent or the server closed it, since its rows are
+    only read from Banner while it is sent. the cache and Banner metrics recorded while answering a request are
+    labelled with its view name too"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        view = self.view_name(request)
+        with metrics.labelled(view=view):
+            response = self.get_response(request)
+
+        def observe():
+            metrics.REQUEST_SECONDS.observe(time.perf_counter() - started, view=view, status=response.status_code)
+
+        if response.streaming:
+            response.streaming_content = self.streamed(response.streaming_content, view, observe)
+        else:
+            observe()
+        return response
+
+    @staticmethod
+    def view_name(request):
+        """the url name request resolves to, known before the view runs so the metrics it records can carry it
+
+        :rtype: str
+        """
+        try:
+            match = urlresolvers.resolve(request.path_info, getattr(request, 'urlconf', None))
+        except urlresolvers.Resolver404:
+            return 'unresolved'
+        return match.url_name or 'unresolved'
+
+    @staticmethod
+    def streamed(content, view, observe):
+        """content, read with the view label set and calling observe once it is exhausted or closed"""
+        try:
+            with metrics.labelled(view=view):
+                for chunk in content:
+                    yield chunk
+        finally:
+            observe()
@@ -0,0 +1,290 @@
+"""classSchedule/mirror.py - a local SQLite copy of the Banner views the class schedule reads
+
+``sync()`` copies each SWV* view into the ``extra`` database as a new generation: the rows are bulk loaded into
+a staging table, indexed, and then swapped in for the live table inside one transaction, so readers always see
+either the previous or the new generation, never a half-loaded one. A view is loaded by one sync at a time, so a
+manual run overlapping the scheduled one fails that view instead of mixing its rows in. Run it on a schedule with
+``manage.py sync_mirror`` and set ``BANNER_DATA_SOURCE=mirror`` to point the oracle_models lookups at the copy.
+
+The oracle_models queries run unchanged against the mirror; NVL is registered as a SQL function and LIKE is made
+case sensitive to match Oracle. Unlike Oracle, SQLite sorts NULLs first in an ascending ORDER BY.
+"""
+
+# python
+import contextlib
+import logging
+import sqlite3
+import time
+import uuid
+from collections import OrderedDict
+
+# django
+from django.conf import settings
+from django.db import connections
+
+# python
+import cx_Oracle
+
+# djClassSchedulePrj
+from apps.classSchedule import banner
+from apps.classSchedule.snapshot import DETAIL_COLUMNS
+from apps.classSchedule.snapshot import FILTER_COLUMNS
+from apps.classSchedule.snapshot import SECTION_COLUMNS
+
+TERM_COLUMNS = ('TERM', 'PTRM', 'PTRM_DESC', 'PTRM_START', 'PTRM_END')
+
+# view -> (columns, indexed column groups); every column the oracle_models queries read or filter on
+MIRRORED_VIEWS = OrderedDict([
+    ('SWVSECT_WEB', (SECTION_COLUMNS + FILTER_COLUMNS + DETAIL_COLUMNS[1:] + ('TERM', 'PTRM', 'INSTRUCT_PRIM'),
+                     [('TERM', 'PTRM', 'INSTRUCT_PRIM', 'SUBJ'), ('TERM', 'PTRM', 'CRN')])),
+    ('SWVSUBJ_WEB', (('TERM', 'SUBJ', 'SUBJ_DESC', 'PTRM'), [('TERM', 'PTRM')])),
+    ('SWVINST_ASGN_PTRM_WEB', (('TERM', 'PTRM', 'PREF_NAME', 'CA_EMAIL', 'PREF_FIRST_NAME', 'PIDM'),
+                               [('TERM', 'PTRM')])),
+    ('SWVCAMP_UP_WEB', (('TERM', 'PTRM', 'CAMP', 'CAMP_DESC'), [('TERM', 'PTRM')])),
+    ('SWVPTRM_UP_WEB', (TERM_COLUMNS, [('TERM', 'PTRM')])),
+    ('SWVPTRM_UR_WEB', (TERM_COLUMNS, [('TERM', 'PTRM')])),
+    ('SWVPTRM_WEB', (TERM_COLUMNS, [('TERM', 'PTRM')])),
+    ('SWVAREA_PSPT_WEB', (('AREA', 'AREA_DESC'), [])),
+    ('SWVSPEC_SEARCH_WEB', (('ATTR', 'ATTR_DESC'), [('ATTR',)])),
+])
+
+# declared SQLite types; the sqlite backend converts timestamp columns back into datetimes when they are read
+COLUMN_TYPES = {'PTRM_START': 'timestamp', 'PTRM_END': 'timestamp'}
+
+GENERATIONS_TABLE = 'mirror_generations'
+
+# view -> the load holding it and until when, so two overlapping syncs never fill the same staging table
+LOCKS_TABLE = 'mirror_locks'
+
+
+class MirrorError(cx_Oracle.DatabaseError):
+    """a failed read of the mirror, raised as a cx_Oracle.DatabaseError so oracle_models handles it like any other
+    database failure"""
+
+
+def database():
+    """the raw sqlite3 connection of the mirror database for this thread
+
+    :rtype: sqlite3.Connection
+    """
+    connection = connections[getattr(settings, 'BANNER_MIRROR_DATABASE', 'extra')]
+    connection.ensure_connection()
+    return oracle_compatible(connection.connection)
+
+
+def oracle_compatible(raw):
+    """register NVL and make LIKE case sensitive on a sqlite3 connection so the oracle_models SQL runs on it
+
+    :rtype: sqlite3.Connection
+    :return: raw
+    """
+    raw.create_function('NVL', 2, lambda value, default: default if value is None else value)
+    raw.execute('PRAGMA case_sensitive_like = ON')
+    return raw
+
+
+class MirrorCursor(object):
+    """the part of the cx_Oracle cursor api the oracle_models lookups use, on top of a sqlite3 cursor"""
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.arraysize = cursor.arraysize
+        self.statement = None
+
+    def prepare(self, statement):
+        self.statement = statement
+
+    def execute(self, statement, parameters=None):
+        if statement is None:
+            statement = self.statement
+        try:
+            self.cursor.arraysize = self.arraysize
+            if parameters is None:
+                self.cursor.execute(statement)
+            else:
+                self.cursor.execute(statement, parameters)
+        except sqlite3.Error as e:
+            raise MirrorError("mirror query failed: %s" % e)
+        return self
+
+    def fetchone(self):
+        return self.cursor.fetchone()
+
+    def fetchmany(self, size=None):
+        return self.cursor.fetchmany(size if size is not None else self.arraysize)
+
+    def fetchall(self):
+        return self.cursor.fetchall()
+
+    def close(self):
+        self.cursor.close()
+
+
+@contextlib.contextmanager
+def cursor():
+    """context manager yielding a MirrorCursor - the BANNER_DATA_SOURCE used when it is set to mirror"""
+    try:
+        raw_cursor = database().cursor()
+    except sqlite3.Error as e:
+        raise MirrorError("mirror unavailable: %s" % e)
+    cur = MirrorCursor(raw_cursor)
+    try:
+        yield cur
+    finally:
+        cur.close()
+
+
+def plain(value):
+    """a bindable copy of an Oracle value - LOBs are read into strings"""
+    return value.read() if hasattr(value, 'read') else value
+
+
+def execute_immediate(db, statement, parameters=()):
+    """run one statement in its own write transaction
+
+    :rtype: int
+    :return: the number of rows it changed
+    """
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        changed = db.execute(statement, parameters).rowcount
+        db.execute('COMMIT')
+    except Exception:
+        db.execute('ROLLBACK')
+        raise
+    return changed
+
+
+@contextlib.contextmanager
+def view_lock(db, view, timeout):
+    """hold the load lock of view, a row of LOCKS_TABLE given up after timeout seconds in case its load died
+
+    :raises MirrorError: when another load of view holds it
+    """
+    token = uuid.uuid4().hex
+    db.execute('CREATE TABLE IF NOT EXISTS %s (view TEXT PRIMARY KEY, token TEXT, expires_at REAL)' % LOCKS_TABLE)
+    execute_immediate(db, 'DELETE FROM %s WHERE view = ? AND expires_at < ?' % LOCKS_TABLE, (view, time.time()))
+    if not execute_immediate(db, 'INSERT OR IGNORE INTO %s VALUES (?, ?, ?)' % LOCKS_TABLE,
+                             (view, token, time.time() + timeout)):
+        raise MirrorError("%s is already being loaded by another sync" % view)
+    try:
+        yield
+    finally:
+        execute_immediate(db, 'DELETE FROM %s WHERE view = ? AND token = ?' % LOCKS_TABLE, (view, token))
+
+
+def load_view(view, batches, db=None):
+    """load rows into the mirror as a new generation of view and swap it in for the current one. one load of a
+    view runs at a time, a second one raising MirrorError while the first still holds its lock
+
+    :param view: a key of MIRRORED_VIEWS
+    :param batches: an iterable of row lists, each row holding the MIRRORED_VIEWS columns of the view in order
+    :param db: the sqlite3 connection to load into, defaults to the mirror database
+    :rtype: int
+    :return: rows - the number of rows in the new generation
+    """
+    if db is None:
+        db = database()
+    db.execute('PRAGMA journal_mode = WAL')
+    with view_lock(db, view, getattr(settings, 'BANNER_MIRROR_LOCK_TIMEOUT', 3600)):
+        return load_locked_view(view, batches, db)
+
+
+def load_locked_view(view, batches, db):
+    """load_view, once the lock of view is held"""
+    logger = logging.getLogger('django')
+    columns, indexes = MIRRORED_VIEWS[view]
+    generation = int(time.time() * 1000)
+    staging = '%s__next' % view
+    db.execute('DROP TABLE IF EXISTS %s' % staging)
+    db.execute('CREATE TABLE %s (%s)' % (staging, ', '.join(
+        ('%s %s' % (column, COLUMN_TYPES.get(column, ''))).strip() for column in columns)))
+
+    insert = 'INSERT INTO %s VALUES (%s)' % (staging, ', '.join('?' * len(columns)))
+    rows = 0
+    try:
+        db.execute('BEGIN')
+        for batch in batches:
+            db.executemany(insert, [tuple(plain(value) for value in row) for row in batch])
+            rows += len(batch)
+        db.execute('COMMIT')
+    except Exception:
+        if db.in_transaction:
+            db.execute('ROLLBACK')
+        db.execute('DROP TABLE IF EXISTS %s' % staging)
+        raise
+
+    for number, index_columns in enumerate(indexes):
+        db.execute('CREATE INDEX ix_%s_%s_%s ON %s (%s)' % (
+            view, number, generation, staging, ', '.join(index_columns)))
+
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        db.execute('CREATE TABLE IF NOT EXISTS %s (view TEXT PRIMARY KEY, generation INTEGER, synced_at REAL, '
+                   'row_count INTEGER)' % GENERATIONS_TABLE)
+        db.execute('DROP TABLE IF EXISTS %s' % view)
+        db.execute('ALTER TABLE %s RENAME TO %s' % (staging, view))
+        db.execute('INSERT OR REPLACE INTO %s VALUES (?, ?, ?, ?)' % GENERATIONS_TABLE,
+                   (view, generation, time.time(), rows))
+        db.execute('COMMIT')
+    except Exception:
+        db.execute('ROLLBACK')
+        raise
+    logger.info("mirror %s - generation %s - %s rows swapped in" % (view, generation, rows))
+    return rows
+
+
+def oracle_batches(view, batch_size=1000):
+    """read the MIRRORED_VIEWS columns of a view from Banner, batch_size rows at a time
+
+    always reads Banner itself, whatever BANNER_DATA_SOURCE is set to
+    """
+    columns, indexes = MIRRORED_VIEWS[view]
+    with banner.gateway().connection() as con:
+        oracle_cursor = con.cursor()
+        try:
+            oracle_cursor.arraysize = batch_size
+            oracle_cursor.execute('SELECT %s FROM %s' % (', '.join(columns), view))
+            while True:
+                batch = oracle_cursor.fetchmany(batch_size)
+                if not batch:
+                    break
+                yield batch
+        finally:
+            oracle_cursor.close()
+
+
+def sync_view(view, batch_size=1000):
+    """copy one Banner view into the mirror as a new generation
+
+    :rtype: int
+    :return: rows - the number of rows copied
+    """
+    return load_view(view, oracle_batches(view, batch_size=batch_size))
+
+
+def sync(views=None, batch_size=1000):
+    """copy every view in MIRRORED_VIEWS, or just the views given, into the mirror
+
+    :rtype: OrderedDict
+    :return: view -> (rows, seconds) for every view synced
+    """
+    synced = OrderedDict()
+    for view in views or MIRRORED_VIEWS:
+        started = time.time()
+        rows = sync_view(view, batch_size=batch_size)
+        synced[view] = (rows, time.time() - started)
+    return synced
+
+
+def status():
+    """the generation, sync time and row count of each view in the mirror
+
+    :rtype: list
+    :return: a list of (view, generation, synced_at, row_count) tuples, empty before the first sync
+    """
+    try:
+        return database().execute('SELECT view, generation, synced_at, row_count FROM %s ORDER BY view' %
+                                  GENERATIONS_TABLE).fetchall()
+    except sqlite3.OperationalError:
+        return []
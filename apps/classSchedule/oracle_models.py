@@ -1,53 +1,39 @@
 # django
 from django.conf import settings
-from django.core.cache import cache
-import functools
 import logging
 
 
 # python
 import cx_Oracle
 
+# djClassSchedulePrj
+from apps.classSchedule import banner
+from apps.classSchedule import meetings
+from apps.classSchedule.fulltext import TextIndexCache
+from apps.classSchedule.queries import MAX_CRN_BINDS
+from apps.classSchedule.queries import section_query
+from apps.classSchedule.snapshot import CRN
+from apps.classSchedule.snapshot import CRSE_TITLE
+from apps.classSchedule.snapshot import DAYS
+from apps.classSchedule.snapshot import DETAIL_COLUMNS
+from apps.classSchedule.snapshot import FILTER_COLUMNS
+from apps.classSchedule.snapshot import MEET_TIME
+from apps.classSchedule.snapshot import SEAT_COLUMNS
+from apps.classSchedule.snapshot import SECTION_COLUMNS
+from apps.classSchedule.snapshot import SectionRows
+from apps.classSchedule.snapshot import SnapshotCache
+from apps.classSchedule.snapshot import TEXT
+from apps.classSchedule.snapshot import instructor_index
+from apps.classSchedule.snapshot import section_record
+from apps.classSchedule.snapshot import section_records
+from apps.classSchedule.timed_cache import TimedCache
 
 
-class TimedCache(object):
-
-    def __init__(self, time):
-        self.time = time
-
-    def __call__(self, fn, *args, **kwargs):
-        """This method creates a new function from the original that utilizes the time
-           set originally as the cache timer. It establishes a hash based on the function
-           name and arguments to uniquely identify the hash"""
-
-        def new_function(*args, **kwargs):
-            logger = logging.getLogger("django")
-            cache_name = self.create_cache_hash(fn.__name__, *args, **kwargs)
-            cache_result = cache.get(cache_name)
-            if cache_result is None:
-                cache_result = fn(*args, **kwargs)
-                cache.set(cache_name, cache_result, self.time)
-                logger.debug("%s returned from Oracle with arguments %s" % (fn.__name__, args))
-            else:
-                logger.debug("%s returned from Cache with arguments %s" % (fn.__name__, args))
-            return cache_result
-
-        return new_function
-
-    @staticmethod
-    def create_cache_hash(name, *args, **kwargs):
-        return hash(str(name) + str(args) + str(kwargs))
-
-    def __get__(self, obj, objtype):
-        """Support instance methods."""
-
-        return functools.partial(self.__call__, obj)
-
 
 class PelTerms:
 
     @staticmethod
-    @TimedCache(21600)
+    @TimedCache(21600, hard_time=86400)
     def get_pel_terms():
         """get the pel terms from banner
         displayed on localsite.html / localsite views / localsite def
@@ -57,22 +43,19 @@ class PelTerms:
         """
         logger = logging.getLogger('django')
         try:
-            con = cx_Oracle.Connection(settings.BANNER_CONNECTION_URL)
-            cursor = con.cursor()
-            query = 'SELECT TERM, PTRM, PTRM_DESC, PTRM_START, PTRM_END FROM SWVPTRM_UP_WEB'
-            cursor.execute(query)
-            results = cursor.fetchall()
-            cursor.close()
-            con.close()
+            with banner.cursor() as cursor:
+                query = 'SELECT TERM, PTRM, PTRM_DESC, PTRM_START, PTRM_END FROM SWVPTRM_UP_WEB'
+                cursor.execute(query)
+                results = cursor.fetchall()
             logger.info("get_pel_term called against Oracle")
         except cx_Oracle.DatabaseError as e:
-            print(e)
+            logger.error("get_pel_terms failed against Oracle: %s" % e)
             results = None
 
         return results
 
     @staticmethod
-    @TimedCache(21600)
+    @TimedCache(21600, hard_time=86400)
     def get_selected_pel_term_desc(term, ptrm):
         """get the selected pel term
         displayed on course_search_pel.html / localsite views / course_search_pel def
@@ -84,16 +67,13 @@ class PelTerms:
         """
         logger = logging.getLogger('django')
         try:
-            con = cx_Oracle.Connection(settings.BANNER_CONNECTION_URL)
-            cursor = con.cursor()
-            cursor.prepare("SELECT PTRM_DESC FROM SWVPTRM_UP_WEB WHERE TERM = :the_term AND PTRM = :the_ptrm")
-            cursor.execute(None, {'the_term': term, 'the_ptrm': ptrm})
-            result = cursor.fetchone()
-            cursor.close()
-            con.close()
+            with banner.cursor() as cursor:
+                cursor.prepare("SELECT PTRM_DESC FROM SWVPTRM_UP_WEB WHERE TERM = :the_term AND PTRM = :the_ptrm")
+                cursor.execute(None, {'the_term': term, 'the_ptrm': ptrm})
+                result = cursor.fetchone()
             logger.info("get_selected_pel_term_desc - term %s  - ptrm %s - against Oracle" % (term, ptrm))
         except cx_Oracle.DatabaseError as e:
-            print(e)
+            logger.error("get_selected_pel_term_desc failed against Oracle: %s" % e)
             result = None
         return result
 
@@ -101,7 +81,7 @@ class PelTerms:
 class ResTerms:
 
     @staticmethod
-    @TimedCache(21600)
+    @TimedCache(21600, hard_time=86400)
     def get_res_terms():
         """get the residential terms from banner
         displayed on localsite.html / localsite views / localsite def
@@ -111,21 +91,18 @@ class ResTerms:
         """
         logger = logging.getLogger('django')
         try:
-            con = cx_Oracle.Connection(settings.BANNER_CONNECTION_URL)
-            cursor = con.cursor()
-            query = 'SELECT TERM, PTRM, PTRM_DESC, PTRM_START, PTRM_END FROM SWVPTRM_UR_WEB'
-            cursor.execute(query)
-            results = cursor.fetchall()
-            cursor.close()
-            con.close()
+            with banner.cursor() as cursor:
+                query = 'SELECT TERM, PTRM, PTRM_DESC, PTRM_START, PTRM_END FROM SWVPTRM_UR_WEB'
+                cursor.execute(query)
+                results = cursor.fetchall()
             logger.debug("get_res_terms called against Oracle")
         except cx_Oracle.DatabaseError as e:
-            print(e)
+            logger.error("get_res_terms failed against Oracle: %s" % e)
             results = None
         return results
 
     @staticmethod
-    @TimedCache(21600)
+    @TimedCache(21600, hard_time=86400)
     def get_selected_res_term_desc(term, ptrm):
         """get the selected residential term
         displayed on course_search_res.html / localsite views / course_search_res def
@@ -135,16 +112,13 @@ class ResTerms:
         """
         logger = logging.getLogger('django')
         try:
-            con = cx_Oracle.Connection(settings.BANNER_CONNECTION_URL)
-            cursor = con.cursor()
-            cursor.prepare("SELECT PTRM_DESC FROM SWVPTRM_WEB WHERE TERM = :the_term AND PTRM = :the_ptrm")
-            cursor.execute(None, {'the_term': term, 'the_ptrm': ptrm})
-            result = cursor.fetchone()
-            cursor.close()
-            con.close()
+            with banner.cursor() as cursor:
+                cursor.prepare("SELECT PTRM_DESC FROM SWVPTRM_WEB WHERE TERM = :the_term AND PTRM = :the_ptrm")
+                cursor.execute(None, {'the_term': term, 'the_ptrm': ptrm})
+                result = cursor.fetchone()
             logger.debug("get_selected_res_term_desc - term %s  - ptrm %s - against Oracle" % (term, ptrm))
         except cx_Oracle.DatabaseError as e:
-            print(e)
+            logger.error("get_selected_res_term_desc failed against Oracle: %s" % e)
             result = None
 
         return result
@@ -153,7 +127,7 @@ class ResTerms:
 class Subjects:
 
     @staticmethod
-    @TimedCache(21600)
+    @TimedCache(21600, hard_time=86400)
     def get_all_subjects(term='', ptrm=''):
         """get all the subjects for a term and ptrm
         displayed on course_search_res.html / localsite views / course_search_res def
@@ -166,17 +140,14 @@ class Subjects:
         """
         logger = logging.getLogger('django')
         try:
-            con = cx_Oracle.Connection(settings.BANNER_CONNECTION_URL)
-            cursor = con.cursor()
-            cursor.prepare(
-                "SELECT TERM, SUBJ, NVL(SUBJ_DESC, 'n/a'), PTRM FROM SWVSUBJ_WEB WHERE TERM = :the_term AND PTRM = :the_ptrm")
-            cursor.execute(None, {'the_term': term, 'the_ptrm': ptrm})
-            results = cursor.fetchall()
-            cursor.close()
-            con.close()
+            with banner.cursor() as cursor:
+                cursor.prepare(
+                    "SELECT TERM, SUBJ, NVL(SUBJ_DESC, 'n/a'), PTRM FROM SWVSUBJ_WEB WHERE TERM = :the_term AND PTRM = :the_ptrm")
+                cursor.execute(None, {'the_term': term, 'the_ptrm': ptrm})
+                results = cursor.fetchall()
             logger.debug("get_all_subjects - term %s  - ptrm %s - against Oracle" % (term, ptrm))
         except cx_Oracle.DatabaseError as e:
-            print(e)
+            logger.error("get_all_subjects failed against Oracle: %s" % e)
             results = None
         return results
 
@@ -184,7 +155,7 @@ class Subjects:
 class PerspectiveAreas:
 
     @staticmethod
-    @TimedCache(21600)
+    @TimedCache(21600, hard_time=86400)
     def get_all_areas():
         """get all the prespective areas
         displayed on course_search_res.html / localsite views / course_search_res def
@@ -195,16 +166,13 @@ class PerspectiveAreas:
         """
         logger = logging.getLogger('django')
         try:
-            con = cx_Oracle.Connection(settings.BANNER_CONNECTION_URL)
-            cursor = con.cursor()
-            query = "SELECT AREA, AREA_DESC FROM SWVAREA_PSPT_WEB"
-            cursor.execute(query)
-            results = cursor.fetchall()
-            cursor.close()
-            con.close()
+            with banner.cursor() as cursor:
+                query = "SELECT AREA, AREA_DESC FROM SWVAREA_PSPT_WEB"
+                cursor.execute(query)
+                results = cursor.fetchall()
             logger.debug("get_all_areas called against Oracle")
         except cx_Oracle.DatabaseError as e:
-            print(e)
+            logger.error("get_all_areas failed against Oracle: %s" % e)
             results = None
         return results
 
@@ -212,7 +180,7 @@ class PerspectiveAreas:
 class Instructors:
 
     @staticmethod
-    @TimedCache(21600)
+    @TimedCache(21600, hard_time=86400)
     def get_all_instructors(term='', ptrm=''):
         """get all the instructors
         displayed on course_search_res.html / localsite views / course_search_res def
@@ -225,17 +193,14 @@ class Instructors:
         """
         logger = logging.getLogger('django')
         try:
-            con = cx_Oracle.Connection(settings.BANNER_CONNECTION_URL)
-            cursor = con.cursor()
-            cursor.prepare(
-                "SELECT TERM, PTRM, PREF_NAME, CA_EMAIL, PREF_FIRST_NAME, PIDM FROM SWVINST_ASGN_PTRM_WEB WHERE TERM = :the_term AND PTRM = :the_ptrm")
-            cursor.execute(None, {'the_term': term, 'the_ptrm': ptrm})
-            results = cursor.fetchall()
-            cursor.close()
-            con.close()
+            with banner.cursor() as cursor:
+                cursor.prepare(
+                    "SELECT TERM, PTRM, PREF_NAME, CA_EMAIL, PREF_FIRST_NAME, PIDM FROM SWVINST_ASGN_PTRM_WEB WHERE TERM = :the_term AND PTRM = :the_ptrm")
+                cursor.execute(None, {'the_term': term, 'the_ptrm': ptrm})
+                results = cursor.fetchall()
             logger.debug("get_all_instructors - term %s  - ptrm %s - against Oracle" % (term, ptrm))
         except cx_Oracle.DatabaseError as e:
-            print(e)
+            logger.error("get_all_instructors failed against Oracle: %s" % e)
             results = None
         return results
 
@@ -243,7 +208,7 @@ class Instructors:
 class PelSpecialized:
 
     @staticmethod
-    @TimedCache(21600)
+    @TimedCache(21600, hard_time=86400)
     def get_all_pel_specialized():
         """get all the pel specialized courses
         displayed on course_search_pel.html / localsite views / course_search_pel def
@@ -253,16 +218,13 @@ class PelSpecialized:
         """
         logger = logging.getLogger('django')
         try:
-            con = cx_Oracle.Connection(settings.BANNER_CONNECTION_URL)
-            cursor = con.cursor()
-            query = "SELECT ATTR, ATTR_DESC FROM SWVSPEC_SEARCH_WEB WHERE ATTR LIKE 'ZP%'"
-            cursor.execute(query)
-            results = cursor.fetchall()
-            cursor.close()
-            con.close()
+            with banner.cursor() as cursor:
+                query = "SELECT ATTR, ATTR_DESC FROM SWVSPEC_SEARCH_WEB WHERE ATTR LIKE 'ZP%'"
+                cursor.execute(query)
+                results = cursor.fetchall()
             logger.debug("get_all_pel_specialized called against Oracle")
         except cx_Oracle.DatabaseError as e:
-            print(e)
+            logger.error("get_all_pel_specialized failed against Oracle: %s" % e)
             results = None
         return results
 
@@ -270,7 +232,7 @@ class PelSpecialized:
 class ResSpecialized:
 
     @staticmethod
-    @TimedCache(21600)
+    @TimedCache(21600, hard_time=86400)
     def get_all_res_specialized():
         """get all the residential specialized courses
         displayled on course_search_res.html / localsite views / course_search_res def
@@ -280,16 +242,13 @@ class ResSpecialized:
         """
         logger = logging.getLogger('django')
         try:
-            con = cx_Oracle.Connection(settings.BANNER_CONNECTION_URL)
-            cursor = con.cursor()
-            query = "SELECT ATTR, ATTR_DESC FROM SWVSPEC_SEARCH_WEB WHERE ATTR LIKE 'ZR%'"
-            cursor.execute(query)
-            results = cursor.fetchall()
-            cursor.close()
-            con.close()
+            with banner.cursor() as cursor:
+                query = "SELECT ATTR, ATTR_DESC FROM SWVSPEC_SEARCH_WEB WHERE ATTR LIKE 'ZR%'"
+                cursor.execute(query)
+                results = cursor.fetchall()
             logger.debug("get_all_res_specialized called against Oracle")
         except cx_Oracle.DatabaseError as e:
-            print(e)
+            logger.error("get_all_res_specialized failed against Oracle: %s" % e)
             results = None
         return results
 
@@ -297,7 +256,7 @@ class ResSpecialized:
 class Campus:
 
     @staticmethod
-    @TimedCache(21600)
+    @TimedCache(21600, hard_time=86400)
     def get_campus(term='', ptrm=''):
         """get the campus locations
         displayed on course_search_pel.html / localsite views / course_search_pel def
@@ -309,28 +268,529 @@ class Campus:
         """
         logger = logging.getLogger('django')
         try:
-            con = cx_Oracle.Connection(settings.BANNER_CONNECTION_URL)
-            cursor = con.cursor()
-            cursor.prepare(
-                "SELECT TERM, PTRM, CAMP, CAMP_DESC FROM SWVCAMP_UP_WEB WHERE TERM = :the_term AND PTRM = :the_ptrm")
-            cursor.execute(None, {'the_term': term, 'the_ptrm': ptrm})
-            results = cursor.fetchall()
-            cursor.close()
-            con.close()
+            with banner.cursor() as cursor:
+                cursor.prepare(
+                    "SELECT TERM, PTRM, CAMP, CAMP_DESC FROM SWVCAMP_UP_WEB WHERE TERM = :the_term AND PTRM = :the_ptrm")
+                cursor.execute(None, {'the_term': term, 'the_ptrm': ptrm})
+                results = cursor.fetchall()
             logger.debug("get_campus - term %s  - ptrm %s - against Oracle" % (term, ptrm))
         except cx_Oracle.DatabaseError as e:
-            print(e)
+            logger.error("get_campus failed against Oracle: %s" % e)
             results = None
         return results
 
 
 class Section:
 
+    snapshots = SnapshotCache(getattr(settings, 'SECTION_SNAPSHOT_MAX_AGE', 1800),
+                              getattr(settings, 'SECTION_SNAPSHOT_HARD_MAX_AGE', 21600),
+                              seats_max_age=getattr(settings, 'SECTION_SEATS_MAX_AGE', 30),
+                              seats_hard_max_age=getattr(settings, 'SECTION_SEATS_HARD_MAX_AGE', 600))
+    text_indexes = TextIndexCache()
+
+    @staticmethod
+    @TimedCache(1800, hard_time=21600)
+    def get_term_sections(term='', ptrm=''):
+        """get every primary-instructor section of a term and ptrm, in results page order
+        loaded into the in-process SectionSnapshot used by get_pel_sections / get_res_sections
+        the seat counts in these rows are kept current by get_term_seats in between loads
+
+        :param term:
+        :param ptrm:
+        :rtype: list
+        :return: results - SectionRows of tuples with the SECTION_COLUMNS followed by the FILTER_COLUMNS
+        """
+        logger = logging.getLogger('django')
+        try:
+            with banner.cursor() as cursor:
+                statement, binds = section_query(SECTION_COLUMNS + FILTER_COLUMNS, term, ptrm)
+                cursor.prepare(statement)
+                cursor.execute(None, binds)
+                results = SectionRows(banner.fetch_all(cursor))
+            logger.debug("get_term_sections - term %s  - ptrm %s - against Oracle" % (term, ptrm))
+        except cx_Oracle.DatabaseError as e:
+            logger.error("get_term_sections failed against Oracle: %s" % e)
+            results = None
+        return results
+
+    @staticmethod
+    @TimedCache(30, hard_time=600)
+    def get_term_seats(term='', ptrm=''):
+        """get just the seat counts of every primary-instructor section of a term and ptrm
+        patched into the term SectionSnapshot far more often than the full rows are reloaded
+
+        :param term:
+        :param ptrm:
+        :rtype: list
+        :return: results - SectionRows of tuples with the SEAT_COLUMNS
+        """
+        logger = logging.getLogger('django')
+        try:
+            with banner.cursor() as cursor:
+                statement, binds = section_query(SEAT_COLUMNS, term, ptrm, ordered=False)
+                cursor.prepare(statement)
+                cursor.execute(None, binds)
+                results = SectionRows(banner.fetch_all(cursor))
+            logger.debug("get_term_seats - term %s  - ptrm %s - against Oracle" % (term, ptrm))
+        except cx_Oracle.DatabaseError as e:
+            logger.error("get_term_seats failed against Oracle: %s" % e)
+            results = None
+        return results
+
+    @staticmethod
+    @TimedCache(1800, hard_time=21600)
+    def get_instructor_index(term='', ptrm=''):
+        """get the CRNs each instructor of a term and ptrm teaches, co-taught sections included, so an instructor
+        search is a lookup instead of a substring scan of INSTRUCT_ALL. rebuilt on the get_term_sections schedule
+
+        :param term:
+        :param ptrm:
+        :rtype: dict
+        :return: results - the PREF_NAME of each instructor -> a tuple of CRNs
+        """
+        logger = logging.getLogger('django')
+        instructors = Instructors.get_all_instructors(term, ptrm)
+        if instructors is None:
+            return None
+        try:
+            with banner.cursor() as cursor:
+                cursor.prepare("SELECT CRN, INSTRUCT_ALL FROM SWVSECT_WEB WHERE TERM = :term AND PTRM = :ptrm")
+                cursor.execute(None, {'term': term, 'ptrm': ptrm})
+                results = instructor_index([instructor[2] for instructor in instructors], banner.fetch_all(cursor))
+            logger.debug("get_instructor_index - term %s  - ptrm %s - against Oracle" % (term, ptrm))
+        except cx_Oracle.DatabaseError as e:
+            logger.error("get_instructor_index failed against Oracle: %s" % e)
+            results = None
+        return results
+
+    @staticmethod
+    def instructor_crns(term='', ptrm='', instructor='0'):
+        """the CRNs an instructor teaches, from get_instructor_index
+
+        :rtype: tuple
+        :return: crns - None when instructor is '0' or not a name the index holds, and has to be matched as a
+                 substring of INSTRUCT_ALL
+        """
+        if instructor == '0':
+            return None
+        index = Section.get_instructor_index(term, ptrm)
+        return index.get(instructor) if index is not None else None
+
     @staticmethod
-    @TimedCache(60)
-    def get_pel_sections(term='', ptrm='', subject='', instructor='', area='', spec='', campus='', open_only=0):
+    def search_crns(term='', ptrm='', instructor='0', ranked=None):
+        """the CRNs a snapshot search is narrowed to - those of the instructor index and of the keyword search
+
+        :rtype: list
+        :return: crns - None when neither applies
+        """
+        crns = Section.instructor_crns(term, ptrm, instructor)
+        if ranked is None:
+            return crns
+        if crns is None:
+            return ranked
+        crns = set(crns)
+        return [crn for crn in ranked if crn in crns]
+
+    @staticmethod
+    def search_query(term='', ptrm='', subject='0', instructor='0', area='0', spec='0', campus='0', open_only='0'):
+        """the section_query of a results page search, where a '0' filter is not applied and a known instructor is
+        matched by the CRNs of get_instructor_index
+
+        :rtype: tuple
+        :return: (statement, binds)
+        """
+        crns = Section.instructor_crns(term, ptrm, instructor)
+        if crns is not None and len(crns) > MAX_CRN_BINDS:
+            crns = None
+        return section_query(term=term, ptrm=ptrm, subject=subject if subject != '0' else None,
+                             instructor=instructor if instructor != '0' and crns is None else None,
+                             area=area if area != '0' else None, spec=spec if spec != '0' else None,
+                             campus=campus if campus != '0' else None, crns=crns, open_only=open_only != "0")
+
+    @staticmethod
+    def get_term_snapshot(term='', ptrm=''):
+        """get the in-process SectionSnapshot of a term and ptrm, rebuilt in the background once it is older than
+        SECTION_SNAPSHOT_MAX_AGE seconds and with its seat counts patched once they are older than
+        SECTION_SEATS_MAX_AGE seconds. the rows and seats come through the shared cache, so worker processes build
+        their snapshots from a single Banner query
+
+        :param term:
+        :param ptrm:
+        :rtype: SectionSnapshot
+        :return: snapshot - the indexed sections, or None when Banner could not be read
+        """
+        def load():
+            rows, loaded_at = Section.get_term_sections.lookup(Section.snapshots.max_age, term, ptrm)
+            return (rows, loaded_at) if rows is not None else None
+
+        def seats():
+            rows, loaded_at = Section.get_term_seats.lookup(Section.snapshots.seats_max_age, term, ptrm)
+            return (rows, loaded_at) if rows is not None else None
+
+        return Section.snapshots.get((term, ptrm), load, source=Section.get_term_sections.cache_key(term, ptrm),
+                                     seats=seats)
+
+    @staticmethod
+    def get_term_rows(term='', ptrm=''):
+        """get the sections of a term and ptrm the results pages are answered from, with when they were read -
+        the rows of the term snapshot, or of get_term_sections when SECTION_SNAPSHOTS is turned off
+
+        :param term:
+        :param ptrm:
+        :rtype: tuple
+        :return: (rows, loaded_at) - (None, None) when Banner could not be read
+        """
+        if getattr(settings, 'SECTION_SNAPSHOTS', True):
+            snapshot = Section.get_term_snapshot(term, ptrm)
+            return (snapshot.rows, snapshot.loaded_at) if snapshot is not None else (None, None)
+        rows, loaded_at = Section.get_term_sections.lookup(Section.snapshots.max_age, term, ptrm)
+        return (rows, loaded_at) if rows is not None else (None, None)
+
+    @staticmethod
+    @TimedCache(86400, hard_time=604800)
+    def get_term_descriptions(term='', ptrm=''):
+        """get the course description of every section of a term and ptrm for the keyword search, kept for a day
+        like get_section_detail
+
+        :param term:
+        :param ptrm:
+        :rtype: dict
+        :return: results - CRN -> CRSE_TEXT
+        """
+        logger = logging.getLogger('django')
+        try:
+            with banner.cursor() as cursor:
+                statement, binds = section_query(('CRN', 'CRSE_TEXT'), term, ptrm, ordered=False)
+                cursor.prepare(statement)
+                cursor.execute(None, binds)
+                results = dict(banner.fetch_all(cursor))
+            logger.debug("get_term_descriptions - term %s - ptrm %s - against Oracle" % (term, ptrm))
+        except cx_Oracle.DatabaseError as e:
+            logger.error("get_term_descriptions failed against Oracle: %s" % e)
+            results = None
+        return results
+
+    @staticmethod
+    def get_text_index(term='', ptrm=''):
+        """get the TextIndex of the titles and descriptions of a term and ptrm, updated in place of the previous one
+        when the sections or the descriptions have been read again
+
+        :param term:
+        :param ptrm:
+        :rtype: TextIndex
+        :return: index - None when Banner could not be read
+        """
+        rows, loaded_at = Section.get_term_rows(term, ptrm)
+        descriptions, described_at = Section.get_term_descriptions.lookup(None, term, ptrm)
+        if rows is None or descriptions is None:
+            return None
+
+        def documents():
+            found = {}
+            for row in rows:
+                if row[CRN] not in found:
+                    found[row[CRN]] = (row[CRSE_TITLE], row[TEXT], descriptions.get(row[CRN]))
+            return found
+
+        return Section.text_indexes.get((term, ptrm), (loaded_at, described_at), documents)
+
+    @staticmethod
+    def keyword_crns(term='', ptrm='', keywords='0'):
+        """the CRNs of the sections whose title or description hold every word of keywords, best match first
+
+        :rtype: list
+        :return: crns - None when keywords is '0' or Banner could not be read
+        """
+        if keywords == '0':
+            return None
+        index = Section.get_text_index(term, ptrm)
+        return index.search(keywords) if index is not None else None
+
+    @staticmethod
+    def ranked(sections, crns):
+        """the sections of crns in the order of crns, meetings of a section kept in results page order
+
+        :param sections: a list of SectionRecords
+        :param crns: a list of CRNs, None to keep every section as is
+        :rtype: list
+        """
+        if crns is None or sections is None:
+            return sections
+        positions = dict((crn, position) for position, crn in enumerate(crns))
+        return sorted((section for section in sections if section.crn in positions),
+                      key=lambda section: positions[section.crn])
+
+    @staticmethod
+    def meeting_within(sections, meets):
+        """the sections meeting only in the slots of meets, a meetings.allowed_mask()
+
+        :param sections: a list of SectionRecords
+        :param meets: None to keep every section
+        :rtype: list
+        """
+        if meets is None or sections is None:
+            return sections
+        masks = meetings.section_masks((section[CRN], section[DAYS], section[MEET_TIME]) for section in sections)
+        return [section for section in sections if meetings.fits(masks[section[CRN]], meets)]
+
+    @staticmethod
+    def sections_versions(lookup, term='', ptrm='', **criteria):
+        """when the sections of a search were read from Banner, found without ever reading Banner - the load and
+        seat times of the term snapshot, or the time the search was cached when SECTION_SNAPSHOTS is turned off
+
+        :param lookup: query_pel_sections or query_res_sections
+        :param term:
+        :param ptrm:
+        :param criteria: the search arguments of lookup, and the keywords and meeting filters of the search
+        :rtype: list
+        :return: versions - [None] until the sections are loaded in this process
+        """
+        criteria = dict((name, code) for name, code in criteria.items() if name not in ('days', 'start', 'end'))
+        versions = []
+        if criteria.pop('keywords', '0') != '0':
+            for text_lookup in (Section.get_term_descriptions, Section.get_term_sections):
+                entry = text_lookup.cached(term, ptrm)
+                versions.append(entry[1] if entry is not None else None)
+        if not getattr(settings, 'SECTION_SNAPSHOTS', True):
+            entry = lookup.cached(term, ptrm, **criteria)
+            return versions + [entry[1] if entry is not None else None]
+        if criteria.get('instructor', '0') != '0':
+            entry = Section.get_instructor_index.cached(term, ptrm)
+            versions.append(entry[1] if entry is not None else None)
+        if Section.snapshots.peek((term, ptrm)) is None:
+            return versions + [None]
+        # a stale snapshot is refreshed in the background as it is for a search
+        snapshot = Section.get_term_snapshot(term, ptrm)
+        return versions + ([snapshot.loaded_at, snapshot.seats_at] if snapshot is not None else [None])
+
+    @staticmethod
+    def get_pel_sections(term='', ptrm='', subject='', instructor='', area='', spec='', campus='', open_only=0,
+                         keywords='0', days='0', start='0', end='0'):
         """
         displayed on course_search_results_pel.html / localsite views / course_search_results_pel def
+        answered from the term snapshot unless SECTION_SNAPSHOTS is turned off
+
+        :param term:
+        :param ptrm:
+        :param subject:
+        :param instructor:
+        :param area:
+        :param spec:
+        :param campus:
+        :param open_only:
+        :param keywords: words of the title or description, the sections are then ranked by how well they match
+        :param days: the DAYS letters the sections may only meet on - ex: MWF
+        :param start: the time of day the sections may not meet before - ex: 0900
+        :param end: the time of day the sections have to be done by - ex: 1700
+        :rtype: list
+        :return: results - a list containing all of the pel sections
+        """
+        ranked = Section.keyword_crns(term, ptrm, keywords)
+        if keywords != '0' and ranked is None:
+            return None
+        meets = meetings.allowed_mask(days, start, end)
+        if not getattr(settings, 'SECTION_SNAPSHOTS', True):
+            return Section.ranked(Section.meeting_within(Section.query_pel_sections(
+                term, ptrm, subject=subject, instructor=instructor, area=area, spec=spec, campus=campus,
+                open_only=open_only), meets), ranked)
+        snapshot = Section.get_term_snapshot(term, ptrm)
+        if snapshot is None:
+            return None
+        crns = Section.search_crns(term, ptrm, instructor, ranked)
+        return Section.ranked(snapshot.search(subject=subject if subject != '0' else None,
+                                              instructor=instructor if instructor != '0' and crns is None else None,
+                                              area=area if area != '0' else None,
+                                              spec=spec if spec != '0' else None,
+                                              campus=campus if campus != '0' else None,
+                                              crns=crns,
+                                              meets=meets,
+                                              open_only=open_only != "0"), ranked)
+
+    @staticmethod
+    def get_res_sections(term='', ptrm='', subject='', instructor='', area='', spec='', open_only=0,
+                         keywords='0', days='0', start='0', end='0'):
+        """
+        displayed on course_search_results_res.html / localsite views / course_search_results_res def
+        answered from the term snapshot unless SECTION_SNAPSHOTS is turned off
+
+        :param term:
+        :param ptrm:
+        :param subject:
+        :param instructor:
+        :param area:
+        :param spec:
+        :param open_only:
+        :param keywords: words of the title or description, the sections are then ranked by how well they match
+        :param days: the DAYS letters the sections may only meet on - ex: MWF
+        :param start: the time of day the sections may not meet before - ex: 0900
+        :param end: the time of day the sections have to be done by - ex: 1700
+        :return: results - a list of tuples containing the residential sections
+        :rtype: list
+        """
+        ranked = Section.keyword_crns(term, ptrm, keywords)
+        if keywords != '0' and ranked is None:
+            return None
+        meets = meetings.allowed_mask(days, start, end)
+        if not getattr(settings, 'SECTION_SNAPSHOTS', True):
+            return Section.ranked(Section.meeting_within(Section.query_res_sections(
+                term, ptrm, subject=subject, instructor=instructor, area=area, spec=spec, open_only=open_only),
+                meets), ranked)
+        snapshot = Section.get_term_snapshot(term, ptrm)
+        if snapshot is None:
+            return None
+        crns = Section.search_crns(term, ptrm, instructor, ranked)
+        return Section.ranked(snapshot.search(subject=subject if subject != '0' else None,
+                                              instructor=instructor if instructor != '0' and crns is None else None,
+                                              area=area if area != '0' else None,
+                                              spec=spec if spec != '0' else None,
+                                              crns=crns,
+                                              meets=meets,
+                                              open_only=open_only != "0"), ranked)
+
+    @staticmethod
+    def get_section(term='', ptrm='', crn=''):
+        """
+        the results table rows of one section, shown again in its course detail
+        answered from the term snapshot unless SECTION_SNAPSHOTS is turned off
+
+        :param term:
+        :param ptrm:
+        :param crn:
+        :rtype: list
+        :return: results - a list of SectionRecords, one per meeting of the section
+        """
+        if not getattr(settings, 'SECTION_SNAPSHOTS', True):
+            return Section.query_section(term, ptrm, crn)
+        snapshot = Section.get_term_snapshot(term, ptrm)
+        if snapshot is None:
+            return None
+        return snapshot.section(crn)
+
+    @staticmethod
+    @TimedCache(86400, hard_time=604800)
+    def get_section_detail(term='', ptrm='', crn=''):
+        """
+        the course description and the other columns only the course detail of a section shows, read when a
+        student opens it and kept for a day since they hardly ever change during a term
+
+        :param term:
+        :param ptrm:
+        :param crn:
+        :rtype: list
+        :return: results - a list of DETAIL_COLUMNS tuples, empty when the term has no section crn
+        """
+        logger = logging.getLogger('django')
+        try:
+            with banner.cursor() as cursor:
+                statement, binds = section_query(DETAIL_COLUMNS, term, ptrm, crn=crn, ordered=False)
+                cursor.prepare(statement)
+                cursor.execute(None, binds)
+                results = banner.fetch_all(cursor)
+            logger.debug("get_section_detail - term %s - ptrm %s - crn %s - against Oracle" % (term, ptrm, crn))
+        except cx_Oracle.DatabaseError as e:
+            logger.error("get_section_detail failed against Oracle: %s" % e)
+            results = None
+        return results
+
+    @staticmethod
+    def stream_pel_sections(term='', ptrm='', subject='', instructor='', area='', spec='', campus='', open_only=0,
+                            keywords='0', days='0', start='0', end='0'):
+        """the sections of get_pel_sections in batches of up to BANNER_ARRAYSIZE rows, for the streaming results
+        page. with SECTION_SNAPSHOTS off, a search missing from the cache is streamed straight from Banner, unless
+        it has keywords or meeting filters, which need every meeting of a section first.
+
+        :rtype: generator
+        :return: lists of SectionRecords
+        """
+        filters = (term, ptrm, subject, instructor, area, spec, campus, open_only)
+        in_process = dict(keywords=keywords, days=days, start=start, end=end)
+        if getattr(settings, 'SECTION_SNAPSHOTS', True) or set(in_process.values()) != {'0'} or \
+                Section.query_pel_sections.cached(*filters):
+            return Section.batches(Section.get_pel_sections(*filters, **in_process))
+        return Section.stream_query(Section.query_pel_sections, filters, Section.search_query(*filters))
+
+    @staticmethod
+    def stream_res_sections(term='', ptrm='', subject='', instructor='', area='', spec='', open_only=0,
+                            keywords='0', days='0', start='0', end='0'):
+        """the sections of get_res_sections in batches of up to BANNER_ARRAYSIZE rows, for the streaming results
+        page. with SECTION_SNAPSHOTS off, a search missing from the cache is streamed straight from Banner, unless
+        it has keywords or meeting filters, which need every meeting of a section first.
+
+        :rtype: generator
+        :return: lists of SectionRecords
+        """
+        filters = (term, ptrm, subject, instructor, area, spec, open_only)
+        in_process = dict(keywords=keywords, days=days, start=start, end=end)
+        if getattr(settings, 'SECTION_SNAPSHOTS', True) or set(in_process.values()) != {'0'} or \
+                Section.query_res_sections.cached(*filters):
+            return Section.batches(Section.get_res_sections(*filters, **in_process))
+        return Section.stream_query(Section.query_res_sections, filters, Section.search_query(
+            term, ptrm, subject, instructor, area, spec, open_only=open_only))
+
+    @staticmethod
+    def batches(sections):
+        size = getattr(settings, 'BANNER_ARRAYSIZE', 500)
+        for start in range(0, len(sections or []), size):
+            yield sections[start:start + size]
+
+    @staticmethod
+    def stream_query(lookup, filters, query):
+        """run a section search and yield its rows a batch at a time as they arrive from Banner, caching the
+        complete result under lookup(*filters) once the last batch is read. the pooled session is held until the
+        stream is read to the end or closed, and a DatabaseError is logged and raised to the page streaming it.
+
+        :param lookup: the TimedCache search function the result is cached for
+        :param filters: the arguments of lookup
+        :param query: the (statement, binds) of the search
+        :rtype: generator
+        """
+        logger = logging.getLogger('django')
+        statement, binds = query
+        results = SectionRows()
+        try:
+            with banner.cursor(lookup.__qualname__) as cursor:
+                cursor.prepare(statement)
+                cursor.execute(None, binds)
+                for batch in banner.fetch_batches(cursor):
+                    batch = [section_record(row) for row in batch]
+                    results.extend(batch)
+                    yield batch
+        except cx_Oracle.DatabaseError as e:
+            logger.error("%s failed against Oracle while streaming: %s" % (lookup.__name__, e))
+            raise
+        lookup.store(results, *filters)
+        logger.debug("%s - %s streamed from Oracle - %s rows" % (lookup.__name__, filters, len(results)))
+
+    @staticmethod
+    @TimedCache(60, hard_time=300)
+    def query_section(term='', ptrm='', crn=''):
+        """
+        queries Banner for the rows of one section, used by get_section when SECTION_SNAPSHOTS is off
+
+        :param term:
+        :param ptrm:
+        :param crn:
+        :rtype: list
+        :return: results - SectionRows of SectionRecords, one per meeting of the section
+        """
+        logger = logging.getLogger('django')
+        try:
+            with banner.cursor() as cursor:
+                statement, binds = section_query(term=term, ptrm=ptrm, crn=crn)
+                cursor.prepare(statement)
+                cursor.execute(None, binds)
+                results = section_records(banner.fetch_all(cursor))
+            logger.debug("query_section - term %s - ptrm %s - crn %s - against Oracle" % (term, ptrm, crn))
+        except cx_Oracle.DatabaseError as e:
+            logger.error("query_section failed against Oracle: %s" % e)
+            results = None
+        return results
+
+    @staticmethod
+    @TimedCache(60, hard_time=300)
+    def query_pel_sections(term='', ptrm='', subject='', instructor='', area='', spec='', campus='', open_only=0):
+        """
+        queries Banner for one pel search, used by get_pel_sections when SECTION_SNAPSHOTS is off
         :param term:
         :param ptrm:
         :param subject:
@@ -344,59 +804,24 @@ class Section:
         """
         logger = logging.getLogger('django')
         try:
-            con = cx_Oracle.Connection(settings.BANNER_CONNECTION_URL)
-            cursor = con.cursor()
-            query = "SELECT SUBJ_DESC, CRN, SUBJ, CRSE_NUMB, SEQ_NUMB, CAMP, BILL_HRS, CRSE_TITLE, DAYS, MEET_TIME, CAPACITY, ENRL, REMAIN, INSTRUCT_ALL, DATES, LOCATION, PREREQ, TEXT, "  # 0-017
-            query += "COURSE, MEET_SCHD, SESS, BN_TERM, CRSE_TEXT, CAPACITY_XLST, ENRL_XLST, REMAIN_XLST FROM SWVSECT_WEB "
-            query += "WHERE INSTRUCT_PRIM = 'Y' AND TERM = '{the_term}' AND PTRM = '{the_ptrm}' ".format(
-                the_term=term,
-                the_ptrm=ptrm,
-            )
-
-            if subject != '0':
-                query += "AND SUBJ LIKE '{the_subject}%' ".format(
-                    the_subject=subject
-                )
-
-            if instructor != '0':
-                query += "AND INSTRUCT_ALL LIKE '%{the_instructor}%' ".format(
-                    the_instructor=instructor
-                )
-            if area != '0':
-                query += "AND SESS = '{the_area}' ".format(
-                    the_area=area
-                )
-            if spec != '0':
-                query += "AND SPECIAL LIKE '%{the_spec}%' ".format(
-                    the_spec=spec
-                )
-
-            if campus != '0':
-                query += "AND CAMP = '{the_campus}' ".format(
-                    the_campus=campus
-                )
-
-            if open_only != "0":
-                query += "AND REMAIN > 0 "
-
-            query += "ORDER BY SUBJ_DESC, CRSE_NUMB, SEQ_NUMB, MEET_SCHD DESC"
-
-            cursor.execute(query)
-            results = cursor.fetchall()
-            cursor.close()
-            con.close()
-            logger.debug("get_pel_sections - term %s - pterm %s - subject %s - instructor %s - area %s - spec %s - campus %s - open_only %s called against Oracle" % (
+            # looked up before a session is borrowed, as the instructor index may need one of its own
+            statement, binds = Section.search_query(term, ptrm, subject, instructor, area, spec, campus, open_only)
+            with banner.cursor() as cursor:
+                cursor.prepare(statement)
+                cursor.execute(None, binds)
+                results = section_records(banner.fetch_all(cursor))
+            logger.debug("query_pel_sections - term %s - pterm %s - subject %s - instructor %s - area %s - spec %s - campus %s - open_only %s called against Oracle" % (
                 term, ptrm, subject, instructor, area, spec, campus, open_only))
         except cx_Oracle.DatabaseError as e:
-            print(e)
+            logger.error("query_pel_sections failed against Oracle: %s" % e)
             results = None
         return results
 
     @staticmethod
-    @TimedCache(60)
-    def get_res_sections(term='', ptrm='', subject='', instructor='', area='', spec='', open_only=0):
+    @TimedCache(60, hard_time=300)
+    def query_res_sections(term='', ptrm='', subject='', instructor='', area='', spec='', open_only=0):
         """
-        displayed on course_search_results_res.html / localsite views / course_search_results_res def
+        queries Banner for one residential search, used by get_res_sections when SECTION_SNAPSHOTS is off
 
         :param term:
         :param ptrm:
@@ -410,48 +835,18 @@ class Section:
         """
         logger = logging.getLogger('django')
         try:
-            con = cx_Oracle.Connection(settings.BANNER_CONNECTION_URL)
-            cursor = con.cursor()
-            query = "SELECT SUBJ_DESC, CRN, SUBJ, CRSE_NUMB, SEQ_NUMB, CAMP, BILL_HRS, CRSE_TITLE, DAYS, MEET_TIME, CAPACITY, ENRL, REMAIN, INSTRUCT_ALL, DATES, LOCATION, PREREQ, TEXT, "  # 0-017
-            query += "COURSE, MEET_SCHD, SESS, BN_TERM, CRSE_TEXT, CAPACITY_XLST, ENRL_XLST, REMAIN_XLST FROM SWVSECT_WEB "
-            query += "WHERE INSTRUCT_PRIM = 'Y' AND TERM = '{the_term}' AND PTRM = '{the_ptrm}' ".format(
-                the_term=term,
-                the_ptrm=ptrm,
-            )
-
-            if subject != '0':
-                query += "AND SUBJ LIKE '{the_subject}%' ".format(
-                    the_subject=subject
-                )
-
-            if instructor != '0':
-                query += "AND INSTRUCT_ALL LIKE '%{the_instructor}%' ".format(
-                    the_instructor=instructor
-                )
-            if area != '0':
-                query += "AND SESS = '{the_area}' ".format(
-                    the_area=area
-                )
-            if spec != '0':
-                query += "AND SPECIAL LIKE '%{the_spec}%' ".format(
-                    the_spec=spec
-                )
-
-            if open_only != "0":
-                query += "AND REMAIN > 0 "
-
-            query += "ORDER BY SUBJ_DESC, CRSE_NUMB, SEQ_NUMB, MEET_SCHD DESC"
-
-            cursor.execute(query)
-            results = cursor.fetchall()
-            cursor.close()
-            con.close()
+            # looked up before a session is borrowed, as the instructor index may need one of its own
+            statement, binds = Section.search_query(term, ptrm, subject, instructor, area, spec, open_only=open_only)
+            with banner.cursor() as cursor:
+                cursor.prepare(statement)
+                cursor.execute(None, binds)
+                results = section_records(banner.fetch_all(cursor))
             logger.debug(
-                ("get_res_sections - term %s - pterm %s - "
+                ("query_res_sections - term %s - pterm %s - "
                  "subject %s - instructor %s - area %s - "
                  "spec %s - open_only %s called against Oracle") % (
                     term, ptrm, subject, instructor, area, spec, open_only))
         except cx_Oracle.DatabaseError as e:
-            print(e)
+            logger.error("query_res_sections failed against Oracle: %s" % e)
             results = None
         return results
@@ -0,0 +1,83 @@
+"""classSchedule/queries.py - the SWVSECT_WEB statements, built with bind variables
+
+Every search value goes into a bind variable, never into the SQL text, so the text of a statement only depends on
+which filters a search uses. The pel and residential searches share at most 2^7 statement shapes, times the few
+padded sizes of a CRN list, which Oracle parses once and shares between sessions, and which the client statement
+cache of every pooled session (BANNER_STATEMENT_CACHE_SIZE) keeps prepared.
+"""
+
+# python
+import threading
+
+# djClassSchedulePrj
+from apps.classSchedule import metrics
+from apps.classSchedule.snapshot import SECTION_COLUMNS
+
+SECTION_ORDER = "ORDER BY SUBJ_DESC, CRSE_NUMB, SEQ_NUMB, MEET_SCHD DESC"
+
+# search filter -> (condition, how the bound value is built from the search value)
+SECTION_FILTERS = (
+    ('subject', "SUBJ LIKE :subject", '%s%%'),
+    ('instructor', "INSTRUCT_ALL LIKE :instructor", '%%%s%%'),
+    ('area', "SESS = :area", '%s'),
+    ('spec', "SPECIAL LIKE :spec", '%%%s%%'),
+    ('campus', "CAMP = :campus", '%s'),
+    ('crn', "CRN = :crn", '%s'),
+)
+
+# the most CRNs section_query() binds into one IN list - Oracle allows 1000 expressions in a list
+MAX_CRN_BINDS = 512
+
+_lock = threading.Lock()
+_statements = set()
+
+
+def section_query(columns=SECTION_COLUMNS, term='', ptrm='', subject=None, instructor=None, area=None, spec=None,
+                  campus=None, crn=None, crns=None, open_only=False, ordered=True):
+    """the statement and bind variables selecting the primary-instructor SWVSECT_WEB rows of a term / ptrm
+
+    a filter left as None is not applied. subject is a prefix match, instructor and spec are substring matches,
+    area, campus and crn are exact matches, crns keeps the sections of any of up to MAX_CRN_BINDS CRNs and open_only
+    keeps the sections with seats left.
+
+    :param columns: the SWVSECT_WEB columns to select
+    :param ordered: sort the rows in results page order
+    :rtype: tuple
+    :return: (statement, binds)
+    """
+    conditions = ["INSTRUCT_PRIM = 'Y'", "TERM = :term", "PTRM = :ptrm"]
+    binds = {'term': term, 'ptrm': ptrm}
+    values = {'subject': subject, 'instructor': instructor, 'area': area, 'spec': spec, 'campus': campus,
+              'crn': crn}
+    for name, condition, pattern in SECTION_FILTERS:
+        if values[name] is not None:
+            conditions.append(condition)
+            binds[name] = pattern % values[name]
+    if crns is not None:
+        # padded with NULLs to the next power of two, so lists of similar lengths share one statement text
+        size = 1 << max(len(crns) - 1, 0).bit_length()
+        names = ['crn_%d' % number for number in range(size)]
+        conditions.append("CRN IN (%s)" % ", ".join(':' + name for name in names))
+        binds.update(zip(names, list(crns) + [None] * (size - len(crns))))
+    if open_only:
+        conditions.append("REMAIN > 0")
+
+    statement = "SELECT %s FROM SWVSECT_WEB WHERE %s" % (", ".join(columns), " AND ".join(conditions))
+    if ordered:
+        statement += " " + SECTION_ORDER
+    with _lock:
+        _statements.add(statement)
+    return statement, binds
+
+
+def statement_texts():
+    """the number of distinct statement texts section_query() has built in this process
+
+    :rtype: int
+    """
+    with _lock:
+        return len(_statements)
+
+
+metrics.Gauge('classschedule_section_statement_texts', "distinct SWVSECT_WEB statement texts built in this process",
+              lambda: [((), statement_texts())])
@@ -0,0 +1,225 @@
+"""classSchedule/schedules.py - conflict-free timetables built from the courses a student wants to take
+
+Every section of a course is reduced to its weekly meetings mask (see meetings.py), and the sections of a course
+meeting at exactly the same times are one option - any of their CRNs can be picked. A schedule takes one option of
+every course, and two options clash when their masks share a bit. The schedules are searched depth first, the
+course with the fewest options still fitting first, and a branch is dropped as soon as a course has no option left
+or it can no longer beat the schedules already kept - the fewest days on campus, then the least time between the
+first and last meeting of each day. The sections of a term / ptrm share its DATES, so only the weekly meetings are
+compared.
+"""
+
+# python
+import bisect
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# djClassSchedulePrj
+from apps.classSchedule import meetings
+from apps.classSchedule.oracle_models import Section
+from apps.classSchedule.snapshot import SECTION_COLUMNS
+from apps.classSchedule.snapshot import SectionSnapshot
+from apps.classSchedule.timed_cache import TermMap
+
+CRN = SECTION_COLUMNS.index('CRN')
+SUBJ = SECTION_COLUMNS.index('SUBJ')
+CRSE_NUMB = SECTION_COLUMNS.index('CRSE_NUMB')
+DAYS = SECTION_COLUMNS.index('DAYS')
+MEET_TIME = SECTION_COLUMNS.index('MEET_TIME')
+
+# ACC 201 or ACC201
+COURSE = re.compile(r'^([A-Za-z]+)\s*(\d\w*)$')
+
+# the options tried before a search gives up and returns the best schedules found so far - a fifth of a second
+# for 8 courses of 50 distinct meeting times or so, where the best schedules are usually among the first found
+MAX_STEPS = 20000
+
+DAY_SLOTS = (1 << meetings.SLOTS_PER_DAY) - 1
+
+_lock = threading.Lock()
+_indexes = TermMap()
+
+
+def course_key(text):
+    """the SUBJ CRSE_NUMB key of a course as a student types it - ex: 'acc201' is 'ACC 201'
+
+    :rtype: str
+    :return: key - None when text is not a course
+    """
+    match = COURSE.match(' '.join(str(text).split()))
+    return '%s %s' % (match.group(1).upper(), match.group(2).upper()) if match else None
+
+
+def score(mask):
+    """how good a week of meetings is, lower is better - (days on campus, five-minute slots from the first to the
+    last meeting of each day). neither can go down as meetings are added, which is what lets a search stop early.
+
+    :rtype: tuple
+    """
+    days = span = 0
+    for day in range(len(meetings.DAY_LETTERS)):
+        slots = (mask >> day * meetings.SLOTS_PER_DAY) & DAY_SLOTS
+        if slots:
+            days += 1
+            span += slots.bit_length() - (slots & -slots).bit_length() + 1
+    return days, span
+
+
+def build(options, limit=10, max_steps=MAX_STEPS):
+    """the best limit schedules taking one option of every course, without two options meeting at the same time
+
+    the course with the fewest options left that fit the schedule so far is taken next, best option first, and a
+    branch is dropped as soon as a course has no option left or the schedule can no longer beat the ones kept
+
+    :param options: a list of the (mask, crns) options of each course
+    :param limit: the most schedules to return
+    :param max_steps: the most options to try
+    :rtype: tuple
+    :return: (schedules, complete) - schedules a list of (score, mask, choices) best first, where choices holds the
+             index of the option taken for each course, and complete False when max_steps ran out first
+    """
+    best = []
+    if limit < 1 or not options or not all(options):
+        return best, True
+    masks = [[mask for mask, crns in course] for course in options]
+    scores = {}
+
+    def scored(mask):
+        found = scores.get(mask)
+        if found is None:
+            found = scores[mask] = score(mask)
+        return found
+
+    remaining = [(course, sorted(range(len(masks[course])), key=lambda index: scored(masks[course][index])))
+                 for course in range(len(masks))]
+    chosen = [None] * len(options)
+    steps = [0]
+
+    def extend(mask, remaining):
+        if not remaining:
+            bisect.insort(best, (scored(mask), mask, tuple(chosen)))
+            del best[limit:]
+            return True
+        course, indexes = min(remaining, key=lambda item: len(item[1]))
+        others = [item for item in remaining if item[0] != course]
+        for index in indexes:
+            steps[0] += 1
+            if steps[0] > max_steps:
+                return False
+            taken = mask | masks[course][index]
+            bound = scored(taken)
+            if len(best) == limit and bound >= best[-1][0]:
+                continue
+            narrowed = []
+            for other, other_indexes in others:
+                fitting = [other_index for other_index in other_indexes if not masks[other][other_index] & taken]
+                if not fitting:
+                    break
+                if len(best) == limit:
+                    # whichever option of other is taken, the schedule ends up at least this bad
+                    bound = max(bound, min(scored(taken | masks[other][other_index]) for other_index in fitting))
+                    if bound >= best[-1][0]:
+                        break
+                narrowed.append((other, fitting))
+            else:
+                chosen[course] = index
+                if not extend(taken, narrowed):
+                    return False
+        return True
+
+    complete = extend(0, remaining)
+    return best, complete
+
+
+class CourseMeetings(object):
+    """the sections of every course of one term / ptrm, with the weekly meetings mask of each"""
+
+    def __init__(self, rows, version=None):
+        """
+        :param rows: the SECTION_COLUMNS rows of the term, in results page order
+        :param version: when the rows were read from Banner
+        """
+        self.version = version
+        self.masks = meetings.section_masks((row[CRN], row[DAYS], row[MEET_TIME]) for row in rows)
+        # course key -> CRN -> row ids, the rows of a section being one per meeting
+        self.courses = {}
+        for row_id, row in enumerate(rows):
+            key = '%s %s' % (row[SUBJ], row[CRSE_NUMB])
+            self.courses.setdefault(key, OrderedDict()).setdefault(row[CRN], []).append(row_id)
+
+    def __len__(self):
+        return len(self.courses)
+
+    def options(self, rows, course, open_only=False):
+        """the distinct weekly meetings of the sections of a course, each with the CRNs meeting at those times
+
+        :param rows: the current rows of the term - the seat counts may have been patched since this was built
+        :param course: a course key - ex: 'ACC 201'
+        :param open_only: leave out the sections without a seat left
+        :rtype: list
+        :return: a list of (mask, crns) tuples
+        """
+        found = OrderedDict()
+        for crn, row_ids in self.courses.get(course, {}).items():
+            if open_only and not SectionSnapshot.is_open(rows[row_ids[0]]):
+                continue
+            found.setdefault(self.masks[crn], []).append(crn)
+        return list(found.items())
+
+
+def term_meetings(term, ptrm):
+    """the CourseMeetings of a term / ptrm with the rows they were built from, rebuilt when its sections have been
+    reloaded
+
+    :rtype: tuple
+    :return: (course_meetings, rows) - (None, None) when Banner could not be read
+    """
+    rows, version = Section.get_term_rows(term, ptrm)
+    if rows is None:
+        return None, None
+    index = _indexes.get((term, ptrm))
+    if index is not None and index.version == version:
+        return index, rows
+    with _lock:
+        index = _indexes.get((term, ptrm))
+        if index is None or index.version != version:
+            started = time.time()
+            index = _indexes[(term, ptrm)] = CourseMeetings(rows, version)
+            logging.getLogger('django').debug("schedule index %s %s - %s courses built in %.3fs" % (
+                term, ptrm, len(index), time.time() - started))
+    return index, rows
+
+
+def schedules(rows, index, courses, open_only=False, limit=10):
+    """the best conflict-free schedules of courses, as the schedule builder returns them
+
+    :param rows: the current rows of the term
+    :param index: the CourseMeetings of the term
+    :param courses: the course keys to take
+    :param open_only: only use sections with a seat left
+    :param limit: the most schedules to return
+    :rtype: tuple
+    :return: (schedules, complete) - schedules a list of {'days', 'span_minutes', 'sections'} dicts best first,
+             each section a {'course', 'crns', 'meetings'} dict, and complete False when the search gave up early
+    """
+    options = [index.options(rows, course, open_only) for course in courses]
+    found, complete = build(options, limit)
+    results = []
+    for (days, span), mask, choices in found:
+        sections = []
+        for course, course_options, choice in zip(courses, options, choices):
+            crns = course_options[choice][1]
+            sections.append({'course': course, 'crns': crns,
+                             'meetings': [[rows[row_id][DAYS], rows[row_id][MEET_TIME]]
+                                          for row_id in index.courses[course][crns[0]]]})
+        results.append({'days': days, 'span_minutes': span * meetings.SLOT_MINUTES, 'sections': sections})
+    return results, complete
+
+
+def clear():
+    """forget the index of every term"""
+    with _lock:
+        _indexes.clear()
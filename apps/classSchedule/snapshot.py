@@ -0,0 +1,428 @@
+"""classSchedule/snapshot.py - in-process, indexed snapshots of the sections offered in a term / ptrm
+
+A snapshot holds every primary-instructor SWVSECT_WEB row for one term / ptrm, in the same order as the
+results pages (SUBJ_DESC, CRSE_NUMB, SEQ_NUMB, MEET_SCHD DESC), together with indexes on the columns the
+course search filters on. Every subject / instructor / area / specialized / campus / open_only combination is
+answered from memory, so Banner only sees one query per term per refresh.
+
+The descriptive columns change rarely and are reloaded on a long schedule. The seat counts change all the time,
+so between those reloads the SEAT_COLUMNS of the term are read on their own and patched into the snapshot.
+"""
+
+# python
+import copy
+import functools
+import logging
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+from collections import defaultdict
+from collections import namedtuple
+
+# djClassSchedulePrj
+from apps.classSchedule import meetings
+from apps.classSchedule import metrics
+from apps.classSchedule.timed_cache import KeyLocks
+from apps.classSchedule.timed_cache import OUTCOMES
+from apps.classSchedule.timed_cache import TermMap
+from apps.classSchedule.timed_cache import refresh_pool
+
+# the SWVSECT_WEB columns of a SectionRecord - the results table columns, in template order, followed by the
+# columns the searches sort and filter on and the cross-listed seat counts
+SECTION_COLUMNS = (
+    'SUBJ_DESC', 'CRN', 'SUBJ', 'CRSE_NUMB', 'SEQ_NUMB', 'CAMP', 'BILL_HRS', 'CRSE_TITLE', 'DAYS', 'MEET_TIME',
+    'CAPACITY', 'ENRL', 'REMAIN', 'INSTRUCT_ALL', 'DATES', 'LOCATION', 'PREREQ', 'TEXT', 'MEET_SCHD', 'SESS',
+    'CAPACITY_XLST', 'ENRL_XLST', 'REMAIN_XLST',
+)
+
+# the columns only the course detail shows, read one CRN at a time when a student opens it (detail.0 ... detail.3)
+DETAIL_COLUMNS = ('CRN', 'COURSE', 'BN_TERM', 'CRSE_TEXT')
+
+# the filter-only columns a snapshot load selects after SECTION_COLUMNS
+FILTER_COLUMNS = ('SPECIAL',)
+
+# the seat count columns refreshed on their own, keyed by CRN
+SEAT_COLUMNS = ('CRN', 'CAPACITY', 'ENRL', 'REMAIN', 'CAPACITY_XLST', 'ENRL_XLST', 'REMAIN_XLST')
+
+CRN = SECTION_COLUMNS.index('CRN')
+SUBJ = SECTION_COLUMNS.index('SUBJ')
+CAMP = SECTION_COLUMNS.index('CAMP')
+REMAIN = SECTION_COLUMNS.index('REMAIN')
+INSTRUCT_ALL = SECTION_COLUMNS.index('INSTRUCT_ALL')
+SESS = SECTION_COLUMNS.index('SESS')
+CRSE_TITLE = SECTION_COLUMNS.index('CRSE_TITLE')
+TEXT = SECTION_COLUMNS.index('TEXT')
+DAYS = SECTION_COLUMNS.index('DAYS')
+MEET_TIME = SECTION_COLUMNS.index('MEET_TIME')
+SEATS = tuple(SECTION_COLUMNS.index(column) for column in SEAT_COLUMNS[1:])
+
+# the columns whose few distinct values repeat across a whole term, kept once in memory
+INTERNED = tuple(SECTION_COLUMNS.index(column) for column in (
+    'SUBJ_DESC', 'SUBJ', 'CAMP', 'DAYS', 'MEET_TIME', 'DATES', 'MEET_SCHD', 'SESS'))
+
+
+class SectionRecord(namedtuple('SectionRecord', [column.lower() for column in SECTION_COLUMNS])):
+    """one SWVSECT_WEB row of SECTION_COLUMNS - a tuple with a named field per column, ex: section.crn"""
+
+    __slots__ = ()
+
+
+def intern(value):
+    return sys.intern(value) if type(value) is str else value
+
+
+def section_record(row):
+    """a SectionRecord of the first SECTION_COLUMNS values of row, with the INTERNED columns interned
+
+    :rtype: SectionRecord
+    """
+    values = list(row[:len(SECTION_COLUMNS)])
+    for index in INTERNED:
+        values[index] = intern(values[index])
+    return SectionRecord._make(values)
+
+
+def section_records(rows):
+    """
+    :param rows: SECTION_COLUMNS tuples, as fetched from Banner
+    :rtype: SectionRows
+    """
+    return SectionRows(section_record(row) for row in rows)
+
+
+class SectionRows(list):
+    """a list of SectionRecords or plain tuples as the section lookups cache it
+
+    the rows are pickled column by column, with equal strings made one object so that pickle writes every distinct
+    value once and refers back to it from then on. the cached rows are smaller, unpickling them allocates every
+    repeated subject, instructor, location or note once instead of once per row, and pickle reads a tuple per
+    column instead of a tuple per row.
+    """
+
+    def __reduce__(self):
+        return unpack_rows, (type(self[0]) if self else tuple, shared_columns(self))
+
+
+def shared_columns(rows):
+    """a tuple of the values of each column of rows, where equal strings are the same object
+
+    :rtype: list
+    """
+    values = {}
+    return [tuple([values.setdefault(value, value) if type(value) is str else value for value in column])
+            for column in zip(*rows)]
+
+
+def unpack_rows(row_type, columns):
+    """the SectionRows pickled as columns, made of row_type rows again
+
+    :rtype: SectionRows
+    """
+    return SectionRows(map(functools.partial(tuple.__new__, row_type), zip(*columns)))
+
+
+NAME_WORD = re.compile(r"[^\W_]+")
+
+
+def instructor_index(names, rows):
+    """the CRNs each instructor teaches, found the way INSTRUCT_ALL LIKE '%name%' finds them but once per term
+    instead of once per search. a name is only tested against the INSTRUCT_ALL values holding its first word, so a
+    name is not found inside a longer word of another one.
+
+    :param names: the PREF_NAME of every instructor of the term
+    :param rows: (CRN, INSTRUCT_ALL) pairs of every SWVSECT_WEB row of the term, the co-teachers' rows included
+    :rtype: dict
+    :return: name -> sorted tuple of CRNs, an empty one for an instructor without sections
+    """
+    by_word = defaultdict(list)
+    for name in set(name for name in names if name):
+        words = NAME_WORD.findall(name)
+        if words:
+            by_word[words[0]].append(name)
+    crns_by_instructors = defaultdict(set)
+    for crn, instruct_all in rows:
+        if instruct_all:
+            crns_by_instructors[instruct_all].add(crn)
+
+    index = dict((name, set()) for word_names in by_word.values() for name in word_names)
+    for instruct_all, crns in crns_by_instructors.items():
+        for word in set(NAME_WORD.findall(instruct_all)):
+            for name in by_word.get(word, []):
+                if name in instruct_all:
+                    index[name].update(crns)
+    return dict((name, tuple(sorted(crns))) for name, crns in index.items())
+
+
+class SectionSnapshot(object):
+    """the sections of one term / ptrm with dict-of-row-id indexes for each search filter"""
+
+    def __init__(self, term, ptrm, rows, loaded_at=None, source=None):
+        """
+        :param term:
+        :param ptrm:
+        :param rows: SECTION_COLUMNS + FILTER_COLUMNS tuples, already in results page order
+        :param loaded_at: when the rows were read from Banner, defaults to now
+        :param source: the cache key the rows were read from
+        """
+        self.term = term
+        self.ptrm = ptrm
+        self.loaded_at = loaded_at if loaded_at is not None else time.time()
+        self.source = source
+        self.seats_at = self.loaded_at
+        self.seats = None
+        self.rows = []
+        self._by_subject = defaultdict(list)
+        self._by_instructor = defaultdict(list)
+        self._by_area = defaultdict(list)
+        self._by_special = defaultdict(list)
+        self._by_campus = defaultdict(list)
+        self._by_crn = defaultdict(list)
+        self._open = []
+        self._by_meets = defaultdict(list)
+
+        width = len(SECTION_COLUMNS)
+        for row_id, row in enumerate(rows):
+            section = section_record(row)
+            special = row[width]
+            self.rows.append(section)
+            self._by_subject[section[SUBJ]].append(row_id)
+            self._by_instructor[section[INSTRUCT_ALL]].append(row_id)
+            self._by_area[section[SESS]].append(row_id)
+            self._by_special[special].append(row_id)
+            self._by_campus[section[CAMP]].append(row_id)
+            self._by_crn[section[CRN]].append(row_id)
+            if self.is_open(section):
+                self._open.append(row_id)
+        # the weekly meetings mask of each CRN, and the rows of each mask - a term only has a few distinct ones
+        self.meets = meetings.section_masks((section[CRN], section[DAYS], section[MEET_TIME])
+                                            for section in self.rows)
+        for row_id, section in enumerate(self.rows):
+            self._by_meets[self.meets[section[CRN]]].append(row_id)
+
+    @staticmethod
+    def is_open(section):
+        return section[REMAIN] is not None and section[REMAIN] > 0
+
+    def with_seats(self, seats, seats_at):
+        """a copy of this snapshot with the seat counts of seats patched into its rows
+
+        rows of a CRN missing from seats keep their counts, and sections added since the rows were loaded only
+        show up with the next full load. the indexes other than open are shared with this snapshot, which readers
+        may keep using while the copy is made.
+
+        :param seats: SEAT_COLUMNS tuples of the term
+        :param seats_at: when the seats were read from Banner
+        :rtype: SectionSnapshot
+        """
+        by_crn = dict((seat[0], tuple(seat[1:])) for seat in seats)
+        patched = copy.copy(self)
+        patched.rows = []
+        patched._open = []
+        for row_id, section in enumerate(self.rows):
+            seat = by_crn.get(section[CRN])
+            if seat is not None and tuple(section[index] for index in SEATS) != seat:
+                section = list(section)
+                for index, value in zip(SEATS, seat):
+                    section[index] = value
+                section = SectionRecord._make(section)
+            patched.rows.append(section)
+            if self.is_open(section):
+                patched._open.append(row_id)
+        patched.seats = seats
+        patched.seats_at = seats_at
+        return patched
+
+    def section(self, crn):
+        """the rows of one section, one per meeting, in results page order
+
+        :rtype: list
+        :return: a list of SectionRecords, empty when the term has no section crn
+        """
+        return [self.rows[row_id] for row_id in self._by_crn.get(crn, [])]
+
+    def __len__(self):
+        return len(self.rows)
+
+    @staticmethod
+    def _matching(index, predicate):
+        """row ids for every non-null index key that satisfies predicate (SQL LIKE never matches NULL)"""
+        ids = []
+        for key, row_ids in index.items():
+            if key is not None and predicate(key):
+                ids.extend(row_ids)
+        return ids
+
+    def search(self, subject=None, instructor=None, area=None, spec=None, campus=None, crns=None, meets=None,
+               open_only=False):
+        """the sections matching every filter given, in results page order
+
+        a filter left as None is not applied. the matching rules follow the SQL the results pages used to send:
+        subject is a prefix match on SUBJ, instructor and spec are substring matches on INSTRUCT_ALL and
+        SPECIAL, area and campus are exact matches on SESS and CAMP, crns keeps the sections of any of those CRNs,
+        meets keeps the sections meeting only in the slots of a meetings.allowed_mask() and open_only keeps
+        REMAIN > 0.
+
+        :rtype: list
+        :return: a list of SectionRecords
+        """
+        candidates = []
+        if subject is not None:
+            candidates.append(self._matching(self._by_subject, lambda key: key.startswith(subject)))
+        if instructor is not None:
+            candidates.append(self._matching(self._by_instructor, lambda key: instructor in key))
+        if area is not None:
+            candidates.append(self._by_area.get(area, []))
+        if spec is not None:
+            candidates.append(self._matching(self._by_special, lambda key: spec in key))
+        if campus is not None:
+            candidates.append(self._by_campus.get(campus, []))
+        if crns is not None:
+            candidates.append([row_id for crn in crns for row_id in self._by_crn.get(crn, [])])
+        if meets is not None:
+            candidates.append(self._matching(self._by_meets, lambda mask: meetings.fits(mask, meets)))
+        if open_only:
+            candidates.append(self._open)
+
+        if not candidates:
+            return list(self.rows)
+
+        candidates.sort(key=len)
+        row_ids = set(candidates[0])
+        for other in candidates[1:]:
+            if not row_ids:
+                break
+            row_ids.intersection_update(other)
+        return [self.rows[row_id] for row_id in sorted(row_ids)]
+
+
+class SnapshotCache(object):
+    """the most recent SectionSnapshot of each term / ptrm held by this process
+
+    a snapshot older than max_age seconds keeps being served while a background thread rebuilds it; only once it
+    is older than hard_max_age does the next caller wait for the rebuild. one thread per term / ptrm rebuilds at a
+    time, and when a rebuild fails the previous snapshot stays in place. a snapshot built from another source than
+    the caller asks for, which happens once the cached rows are invalidated, is rebuilt straight away.
+
+    the seat counts follow the same rules on their own seats_max_age / seats_hard_max_age schedule. at most
+    max_terms snapshots are kept, the least recently used one dropped first.
+    """
+
+    def __init__(self, max_age, hard_max_age, seats_max_age=None, seats_hard_max_age=None, max_terms=None):
+        self.max_age = max_age
+        self.hard_max_age = hard_max_age
+        self.seats_max_age = seats_max_age if seats_max_age is not None else max_age
+        self.seats_hard_max_age = seats_hard_max_age if seats_hard_max_age is not None else hard_max_age
+        self._snapshots = TermMap(max_terms)
+        self._locks = KeyLocks()
+        self._stats_lock = threading.Lock()
+        self._stats = OrderedDict([('hits', 0), ('stale', 0), ('misses', 0)])
+
+    def get(self, key, loader, source=None, seats=None):
+        """the snapshot for key, built from loader() when it is missing, too old or from another source
+
+        :param key: a (term, ptrm) tuple
+        :param loader: a callable returning the (rows, loaded_at) of the term, or None when Banner could not be read
+        :param source: the cache key loader() reads the rows from
+        :param seats: a callable returning the (SEAT_COLUMNS rows, loaded_at) of the term, or None when Banner could
+                      not be read. when given, the seat counts are patched in once they are older than seats_max_age
+        :rtype: SectionSnapshot
+        """
+        snapshot = self._snapshots.get(key)
+        age = time.time() - snapshot.loaded_at if snapshot is not None and snapshot.source == source else None
+        if age is None or age >= self.hard_max_age:
+            self._count('misses')
+            snapshot = self.rebuild(key, loader, source)
+        elif age >= self.max_age:
+            self._count('stale')
+            refresh_pool().submit(('snapshot',) + tuple(key), self.rebuild, key, loader, source)
+        else:
+            self._count('hits')
+
+        if snapshot is None or seats is None:
+            return snapshot
+        age = time.time() - snapshot.seats_at
+        if age >= self.seats_hard_max_age:
+            return self.patch_seats(key, seats, source)
+        if age >= self.seats_max_age:
+            refresh_pool().submit(('seats',) + tuple(key), self.patch_seats, key, seats, source)
+        return snapshot
+
+    def peek(self, key):
+        """the snapshot held for key as it is, without building, refreshing or counting a lookup
+
+        :rtype: SectionSnapshot
+        :return: snapshot - None before the first one is built
+        """
+        return self._snapshots.get(key)
+
+    def patch_seats(self, key, seats, source=None):
+        """patch the seat counts from seats() into the current snapshot of key, keeping it as is when they could
+        not be read or did not change"""
+        with self._locks.hold(key):
+            current = self._snapshots.get(key)
+            if current is None or current.source != source:
+                return current
+            if time.time() - current.seats_at < self.seats_max_age:
+                return current
+            loaded = seats()
+            if loaded is None or loaded[1] <= current.seats_at:
+                return current
+
+            started = time.time()
+            snapshot = current.with_seats(*loaded)
+            self._snapshots[key] = snapshot
+            logging.getLogger('django').debug("section snapshot %s seats patched - %s seats in %.3fs" % (
+                key, len(loaded[0]), time.time() - started))
+            return snapshot
+
+    def rebuild(self, key, loader, source=None):
+        """build a new snapshot for key from loader(), keeping the current one when the rows did not change"""
+        with self._locks.hold(key):
+            current = self._snapshots.get(key)
+            if current is not None and current.source != source:
+                current = None
+            if current is not None and time.time() - current.loaded_at < self.max_age:
+                return current
+            return self._rebuild(key, loader, source, current)
+
+    def _rebuild(self, key, loader, source, current):
+        loaded = loader()
+        if loaded is None:
+            return current if current is not None else self._snapshots.get(key)
+        rows, loaded_at = loaded
+        if current is not None and current.loaded_at == loaded_at:
+            return current
+
+        started = time.time()
+        snapshot = SectionSnapshot(key[0], key[1], rows, loaded_at=loaded_at, source=source)
+        if current is not None and current.seats is not None and current.seats_at > loaded_at:
+            # the seats patched into the current snapshot are newer than the rows just loaded
+            snapshot = snapshot.with_seats(current.seats, current.seats_at)
+        self._snapshots[key] = snapshot
+        logging.getLogger('django').debug("section snapshot %s rebuilt - %s rows in %.3fs" % (
+            key, len(snapshot), time.time() - started))
+        return snapshot
+
+    def _count(self, outcome):
+        with self._stats_lock:
+            self._stats[outcome] += 1
+        metrics.SNAPSHOT_LOOKUPS.inc(outcome=OUTCOMES[outcome], view=metrics.current('view'))
+
+    def stats(self):
+        """how get() was answered since the last reset_stats(): with a fresh snapshot (hits), with a stale one while
+        it is rebuilt (stale) or after building one (misses)
+
+        :rtype: OrderedDict
+        """
+        with self._stats_lock:
+            return OrderedDict(self._stats)
+
+    def reset_stats(self):
+        with self._stats_lock:
+            for outcome in self._stats:
+                self._stats[outcome] = 0
+
+    def clear(self):
+        self._snapshots.clear()
@@ -1,5 +1,55 @@
+import datetime
+import io
+import itertools
+import json
+import os
+import pickle
+import random
+import tempfile
+import threading
+import time
+from unittest import mock
+
+import cx_Oracle
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
 from django.core.urlresolvers import resolve
+from django.test import SimpleTestCase
 from django.test import TestCase
+from django.test import override_settings
+
+from apps.classSchedule import banner
+from apps.classSchedule.banner import BannerGateway
+from apps.classSchedule.banner import parse_connection_url
+from apps.classSchedule import fixture_source
+from apps.classSchedule import meetings
+from apps.classSchedule import metrics
+from apps.classSchedule import mirror
+from apps.classSchedule import schedules
+from apps.classSchedule import timed_cache
+from apps.classSchedule.form_data import SearchFormData
+from apps.classSchedule.fulltext import TextIndex
+from apps.classSchedule.oracle_models import Instructors
+from apps.classSchedule.oracle_models import PelTerms
+from apps.classSchedule.oracle_models import ResTerms
+from apps.classSchedule.oracle_models import Section
+from apps.classSchedule.oracle_models import Subjects
+from apps.classSchedule.queries import section_query
+from apps.classSchedule.queries import statement_texts
+from apps.classSchedule.snapshot import DETAIL_COLUMNS
+from apps.classSchedule.snapshot import SECTION_COLUMNS
+from apps.classSchedule.snapshot import SectionRecord
+from apps.classSchedule.snapshot import SectionSnapshot
+from apps.classSchedule.snapshot import section_records
+from apps.classSchedule.snapshot import SnapshotCache
+from apps.classSchedule.snapshot import instructor_index
+from apps.classSchedule.timed_cache import TimedCache
+from apps.classSchedule.typeahead import PrefixIndex
+from apps.classSchedule.timed_cache import LocalCache
+from apps.classSchedule.timed_cache import invalidate
+from apps.classSchedule.timed_cache import local_cache
 
 from apps.classSchedule.views import course_search_pel
 from apps.classSchedule.views import course_search_res
@@ -36,48 +86,945 @@ class LocalsitePageTest(TestCase):
         self.assertTemplateUsed(response, 'course_search_res.html')
 
     def test_course_search_results_res_url_resolves_to_page_view(self):
-        found = resolve('/course/search/results/res/')
+        found = resolve('/course/search/results/res/201510/R2/')
         self.assertEqual(found.func, course_search_results_res)
 
     def test_course_search_results_res_uses_correct_template(self):
-        response = self.client.get('/course/search/results/res/')
+        response = self.client.get('/course/search/results/res/201510/R2/')
         self.assertTemplateUsed(response, 'course_search_results_res.html')
 
     def test_course_search_results_pel_url_resolves_to_page_view(self):
-        found = resolve('/course/search/results/pel/')
+        found = resolve('/course/search/results/pel/201525/P3/')
         self.assertEqual(found.func, course_search_results_pel)
 
     def test_course_search_results_pel_uses_correct_template(self):
-        response = self.client.get('/course/search/results/pel/')
+        response = self.client.get('/course/search/results/pel/201525/P3/')
         self.assertTemplateUsed(response, 'course_search_results_pel.html')
 
+    def test_course_search_results_are_cacheable_and_leave_the_session_alone(self):
+        response = self.client.get('/course/search/results/pel/201525/P3/?subject=ACC&open_only=1')
+        self.assertIn('public', response['Cache-Control'])
+        self.assertNotIn('Vary', response)
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+
+    def test_course_search_results_redirect_to_the_canonical_url(self):
+        response = self.client.get('/course/search/results/pel/201525/P3/?open_only=on&area=0&subject=ACC|Accounting')
+        self.assertEqual(response.status_code, 301)
+        self.assertEqual(response['location'], '/course/search/results/pel/201525/P3/?subject=ACC&open_only=1')
+        response = self.client.get('/course/search/results/res/')
+        self.assertEqual(response.status_code, 302)
+        self.assertRegex(response['location'], r'^/course/search/results/res/\d+10/R2/$')
+
+    def test_canonical_results_urls_are_not_redirected_whatever_the_parameter_order(self):
+        response = self.client.get('/course/search/results/pel/201525/P3/?open_only=1&days=MWF&subject=ACC')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get('/course/search/results/pel/201525/P3/?subject=ACC&subject=ANT')
+        self.assertEqual(response['location'], '/course/search/results/pel/201525/P3/?subject=ANT')
+
     def test_course_search_pel_redirects_after_POST(self):
         response = self.client.post(
             '/course/search/pel/201525/P3/',
             data={
-                'subject': ['0', 'All'],
-                'area': ['0', 'All'],
-                'instructor': ['0', 'All'],
-                'specialized': ['0', 'All'],
-                'campus': ['0', 'All'],
+                'subject': 'ACC|Accounting',
+                'area': '0|All',
+                'instructor': 'Smith, Jane|Smith, Jane',
+                'specialized': '0|All',
+                'campus': '0|All',
                 'open_only': '0',
 
             }
         )
         self.assertEqual(response.status_code, 302)
-        self.assertEqual(response['location'], '/course/search/results/pel/')
+        self.assertEqual(response['location'],
+                         '/course/search/results/pel/201525/P3/?subject=ACC&instructor=Smith%2C+Jane')
 
     def test_course_search_res_redirects_after_POST(self):
         response = self.client.post(
             '/course/search/res/201510/R2/',
             data={
-                'subject': ['0', 'All'],
-                'area': ['0', 'All'],
-                'instructor': ['0', 'All'],
-                'specialized': ['0', 'All'],
-                'open_only': '0',
+                'subject': '0|All',
+                'area': '0|All',
+                'instructor': '0|All',
+                'specialized': '0|All',
+                'open_only': 'on',
 
             }
         )
         self.assertEqual(response.status_code, 302)
-        self.assertEqual(response['location'], '/course/search/results/res/')
+        self.assertEqual(response['location'], '/course/search/results/res/201510/R2/?open_only=1')
+
+    def test_keywords_are_part_of_the_results_url(self):
+        response = self.client.post('/course/search/res/201510/R2/', data={'keywords': '  marine   biology '})
+        self.assertEqual(response['location'], '/course/search/results/res/201510/R2/?keywords=marine+biology')
+
+    def test_meeting_filters_are_part_of_the_results_url(self):
+        response = self.client.post('/course/search/pel/201510/R2/',
+                                    data={'days': ['F', 'M', 'W'], 'start': '9:00 am', 'end': '0'})
+        self.assertEqual(response['location'], '/course/search/results/pel/201510/R2/?days=MWF&start=0900')
+        response = self.client.get('/course/search/results/pel/201510/R2/?days=fm&end=5pm')
+        self.assertEqual(response['location'], '/course/search/results/pel/201510/R2/?days=MF&end=1700')
+
+
+class BannerGatewayTest(SimpleTestCase):
+    def test_connection_url_is_split_into_user_password_and_dsn(self):
+        self.assertEqual(parse_connection_url('user/secret@banner.example.edu:1521/PROD'),
+                         ('user', 'secret', 'banner.example.edu:1521/PROD'))
+
+    def test_connection_url_password_may_contain_at_sign(self):
+        self.assertEqual(parse_connection_url('user/p@ss@localhost:1521/XE'), ('user', 'p@ss', 'localhost:1521/XE'))
+
+    def test_dead_sessions_are_dropped_until_a_live_one_is_checked_out(self):
+        class Session(object):
+            def __init__(self, alive):
+                self.alive = alive
+
+            def ping(self):
+                if not self.alive:
+                    raise cx_Oracle.DatabaseError("ORA-03113: end-of-file on communication channel")
+
+        class Pool(object):
+            def __init__(self, sessions):
+                self.sessions = sessions
+                self.dropped = []
+
+            def acquire(self):
+                return self.sessions.pop(0)
+
+            def drop(self, con):
+                self.dropped.append(con)
+
+            def release(self, con):
+                pass
+
+        pool = Pool([Session(False), Session(False), Session(True)])
+        gateway = BannerGateway('user/secret@localhost:1521/XE', max_sessions=1)
+        gateway._pool, gateway._pid = pool, os.getpid()
+        with gateway.connection() as con:
+            self.assertTrue(con.alive)
+        self.assertEqual(len(pool.dropped), 2)
+
+        pool.sessions = [Session(False)] * BannerGateway.CHECKOUT_ATTEMPTS
+        with self.assertRaises(cx_Oracle.DatabaseError):
+            gateway.acquire()
+        self.assertEqual(len(pool.dropped), 2 + BannerGateway.CHECKOUT_ATTEMPTS)
+
+
+def make_section(crn, subj='ACC', crse_numb='201', camp='M', remain=5, instruct_all='Smith, Jane', sess='AH',
+                 special=None, **columns):
+    """build a SWVSECT_WEB snapshot row with sensible defaults for the columns a test does not care about"""
+    values = dict.fromkeys(SECTION_COLUMNS)
+    values.update(SUBJ_DESC=subj, CRN=crn, SUBJ=subj, CRSE_NUMB=crse_numb, SEQ_NUMB='01', CAMP=camp,
+                  REMAIN=remain, INSTRUCT_ALL=instruct_all, SESS=sess)
+    values.update(columns)
+    return tuple(values[column] for column in SECTION_COLUMNS) + (special,)
+
+
+class SectionSnapshotTest(SimpleTestCase):
+    def setUp(self):
+        self.snapshot = SectionSnapshot('201710', 'R2', [
+            make_section('10001', subj='ACC', special='ZRQ1'),
+            make_section('10002', subj='ANT', remain=0, instruct_all='Smith, Jane; Doe, John'),
+            make_section('10003', subj='BIO', camp='T', instruct_all=None, sess='NS', special='ZPS1 ZRQ1'),
+            make_section('10004', subj='BIO', remain=None, sess='NS'),
+        ])
+
+    def crns(self, sections):
+        return [section[SECTION_COLUMNS.index('CRN')] for section in sections]
+
+    def test_no_filters_returns_every_section_in_order(self):
+        self.assertEqual(self.crns(self.snapshot.search()), ['10001', '10002', '10003', '10004'])
+
+    def test_subject_is_a_prefix_match(self):
+        self.assertEqual(self.crns(self.snapshot.search(subject='A')), ['10001', '10002'])
+
+    def test_instructor_and_spec_are_substring_matches(self):
+        self.assertEqual(self.crns(self.snapshot.search(instructor='Doe')), ['10002'])
+        self.assertEqual(self.crns(self.snapshot.search(spec='ZRQ1')), ['10001', '10003'])
+
+    def test_instructor_index_covers_co_taught_sections(self):
+        index = instructor_index(['Smith, Jane', 'Doe, John', 'Doe, Jo', 'Roe, Ann'], [
+            ('10001', 'Smith, Jane'), ('10002', 'Smith, Jane; Doe, John'), ('10002', 'Doe, John'),
+            ('10003', None), ('10004', 'Doe, Jo'), ('10005', 'Moe, Johnny')])
+        self.assertEqual(index, {'Smith, Jane': ('10001', '10002'), 'Doe, John': ('10002',),
+                                 'Doe, Jo': ('10002', '10004'), 'Roe, Ann': ()})
+        self.assertEqual(self.crns(self.snapshot.search(crns=index['Doe, John'])), ['10002'])
+
+    def test_filters_are_combined(self):
+        self.assertEqual(self.crns(self.snapshot.search(area='NS', campus='M')), ['10004'])
+        self.assertEqual(self.crns(self.snapshot.search(subject='BIO', open_only=True)), ['10003'])
+
+    def test_open_only_skips_full_and_unknown_seat_counts(self):
+        self.assertEqual(self.crns(self.snapshot.search(open_only=True)), ['10001', '10003'])
+
+    def test_meeting_filters_keep_the_sections_meeting_only_in_the_allowed_slots(self):
+        snapshot = SectionSnapshot('201710', 'R2', [
+            make_section('10001', DAYS='MW', MEET_TIME='0900-1015'),
+            make_section('10002', DAYS='TR', MEET_TIME='1800-2050'),
+            make_section('10003', DAYS='TBA', MEET_TIME='TBA'),
+            make_section('10004', DAYS='MW', MEET_TIME='0900-1015'),
+        ])
+        self.assertEqual(self.crns(snapshot.search(meets=meetings.allowed_mask(days='MWF'))), ['10001', '10004'])
+        self.assertEqual(self.crns(snapshot.search(meets=meetings.allowed_mask(start='1200'))), ['10002'])
+        self.assertEqual(self.crns(snapshot.search(meets=meetings.allowed_mask(end='1700'))), ['10001', '10004'])
+        self.assertEqual(self.crns(snapshot.search(meets=meetings.allowed_mask('TR', '0800', '2000'))), [])
+        self.assertEqual(len(snapshot.search(meets=None)), 4)
+
+    def test_sections_are_looked_up_by_crn(self):
+        self.assertEqual(self.crns(self.snapshot.section('10003')), ['10003'])
+        self.assertEqual(self.snapshot.section('99999'), [])
+
+    def test_rows_are_records_with_named_fields(self):
+        section = self.snapshot.search(subject='BIO')[0]
+        self.assertIsInstance(section, SectionRecord)
+        self.assertEqual((section.crn, section.camp), ('10003', 'T'))
+        self.assertEqual(section.subj_desc, section[SECTION_COLUMNS.index('SUBJ_DESC')])
+
+    def test_cached_rows_pickle_back_into_records_sharing_repeated_values(self):
+        rows = section_records([make_section(crn, instruct_all=''.join(['Smith, ', 'Jane']))[:-1]
+                                for crn in ('10001', '10002', '10003')])
+        unpickled = pickle.loads(pickle.dumps(rows, pickle.HIGHEST_PROTOCOL))
+        self.assertEqual(unpickled, rows)
+        self.assertIsInstance(unpickled[0], SectionRecord)
+        self.assertIs(unpickled[0].instruct_all, unpickled[2].instruct_all)
+        self.assertEqual(pickle.loads(pickle.dumps(section_records([]))), [])
+
+    def test_seats_are_patched_into_a_copy(self):
+        patched = self.snapshot.with_seats([('10001', 20, 20, 0, None, None, None),
+                                            ('10002', 20, 18, 2, None, None, None)], time.time())
+        self.assertEqual(self.crns(patched.search(open_only=True)), ['10002', '10003'])
+        self.assertEqual(self.crns(patched.search(subject='A', open_only=True)), ['10002'])
+        self.assertEqual(patched.rows[0][SECTION_COLUMNS.index('ENRL')], 20)
+        self.assertEqual(self.crns(self.snapshot.search(open_only=True)), ['10001', '10003'])
+
+    def test_seats_refresh_without_reloading_the_rows(self):
+        snapshots = SnapshotCache(3600, 7200, seats_max_age=30, seats_hard_max_age=60)
+        loads = []
+
+        def load():
+            loads.append(1)
+            return [make_section('10001', remain=5)], time.time() - 120
+
+        def seats():
+            return [('10001', 20, 20, 0, None, None, None)], time.time()
+
+        snapshot = snapshots.get(('201710', 'R2'), load, source='rows', seats=seats)
+        self.assertEqual(snapshot.search(open_only=True), [])
+        self.assertEqual(len(snapshots.get(('201710', 'R2'), load, source='rows', seats=seats)), 1)
+        self.assertEqual(len(loads), 1)
+
+    def test_only_the_most_recently_used_terms_are_kept(self):
+        snapshots = SnapshotCache(3600, 7200, max_terms=2)
+        loads = []
+
+        def loader(term):
+            def load():
+                loads.append(term)
+                return [make_section('10001')], time.time()
+            return load
+
+        for term in ('201710', '201720', '201710', '999990', '201710', '201720'):
+            snapshots.get((term, 'R2'), loader(term))
+        self.assertEqual(loads, ['201710', '201720', '999990', '201720'])
+        self.assertEqual(len(snapshots._snapshots), 2)
+
+
+class PrefixIndexTest(SimpleTestCase):
+    def setUp(self):
+        self.index = PrefixIndex([
+            make_section('10001', subj='ACC', crse_numb='201', CRSE_TITLE='Principles of Accounting'),
+            make_section('10002', subj='ACC', crse_numb='201', CRSE_TITLE='Principles of Accounting'),
+            make_section('10003', subj='ANT', crse_numb='110', CRSE_TITLE='Cultural Anthropology'),
+            make_section('20001', subj='BIO', crse_numb='101', CRSE_TITLE='Intro to Biology'),
+        ])
+
+    def values(self, query, limit=10):
+        return [(suggestion['type'], suggestion['value']) for suggestion in self.index.lookup(query, limit)]
+
+    def test_subjects_courses_titles_and_crns_are_matched_by_prefix(self):
+        self.assertEqual(self.values('a'), [('subject', 'ACC'), ('subject', 'ANT'), ('course', 'ACC 201'),
+                                            ('course', 'ANT 110')])
+        self.assertEqual(self.values('acc 2'), [('course', 'ACC 201')])
+        self.assertEqual(self.values('ACC201'), [('course', 'ACC 201')])
+        self.assertEqual(self.values('  biolo'), [('course', 'BIO 101')])
+        self.assertEqual(self.values('1000'), [('section', '10001'), ('section', '10002'), ('section', '10003')])
+
+    def test_results_are_bounded(self):
+        self.assertEqual(len(self.values('a', limit=3)), 3)
+        self.assertEqual(self.values('', limit=3), [])
+        self.assertEqual(self.values('zzz'), [])
+
+
+class TextIndexTest(SimpleTestCase):
+    def setUp(self):
+        self.index = TextIndex().updated({
+            '10001': ('Business Ethics', None, 'Moral questions of the firm.'),
+            '10002': ('Marine Biology', 'Meets with BIO 301', 'Life in the oceans and its ethics.'),
+            '10003': ('Marine Ecology', None, None),
+        }, version=1)
+
+    def test_every_word_must_match_and_titles_rank_first(self):
+        self.assertEqual(self.index.search('ethics'), ['10001', '10002'])
+        self.assertEqual(self.index.search('Marine ethic'), ['10002'])
+        self.assertEqual(self.index.search('marine'), ['10003', '10002'])
+        self.assertEqual(self.index.search('the'), [])
+        self.assertEqual(self.index.search('chemistry'), [])
+
+    def test_only_changed_sections_are_indexed_again(self):
+        updated = self.index.updated({
+            '10001': ('Business Ethics', None, 'Moral questions of the firm.'),
+            '10002': ('Marine Biology', 'Meets with BIO 301', 'Life in the oceans.'),
+            '10004': ('Ocean Chemistry', None, None),
+        }, version=2)
+        self.assertEqual(updated.reindexed, 3)
+        self.assertEqual(updated.search('ethics'), ['10001'])
+        self.assertEqual(updated.search('marine'), ['10002'])
+        self.assertEqual(updated.search('ocean'), ['10004', '10002'])
+        self.assertIs(updated.postings['firm'], self.index.postings['firm'])
+        self.assertEqual(self.index.search('ethics'), ['10001', '10002'])
+
+
+class MeetingMaskTest(SimpleTestCase):
+    def test_times_are_read_in_any_of_the_usual_spellings(self):
+        self.assertEqual([meetings.minutes(text) for text in ['1400', '14:00', '2:00 pm', '2pm', '12am', '905']],
+                         [840, 840, 840, 840, 0, 545])
+        self.assertEqual([meetings.minutes(text) for text in ['9', '13pm', '2460', 'TBA', None]], [None] * 5)
+        self.assertEqual(meetings.time_code('9:30 PM'), '2130')
+
+    def test_meetings_set_a_slot_for_every_five_minutes_of_each_day(self):
+        mask = meetings.meeting_mask('MW', '0900-0950')
+        self.assertEqual(bin(mask).count('1'), 20)
+        self.assertEqual(mask, meetings.meeting_mask('WM', '9:00 am-9:50 am'))
+        self.assertEqual(meetings.meeting_mask('TBA', 'TBA'), 0)
+        self.assertEqual(meetings.section_masks([('10001', 'M', '0900-0950'), ('10001', 'W', '0900-0950')]),
+                         {'10001': mask})
+
+    def test_sections_fit_only_inside_the_allowed_days_and_window(self):
+        mask = meetings.meeting_mask('TR', '1300-1415')
+        self.assertTrue(meetings.fits(mask, meetings.allowed_mask(days='TRF')))
+        self.assertTrue(meetings.fits(mask, meetings.allowed_mask(start='1300', end='1415')))
+        self.assertFalse(meetings.fits(mask, meetings.allowed_mask(start='1330')))
+        self.assertFalse(meetings.fits(mask, meetings.allowed_mask(days='T')))
+        self.assertFalse(meetings.fits(0, meetings.allowed_mask(days='MTWRFSU')))
+        self.assertIsNone(meetings.allowed_mask())
+
+
+class SchedulesTest(SimpleTestCase):
+    def options(self, *courses):
+        return [[(meetings.meeting_mask(days, meet_time), [crn]) for crn, days, meet_time in course]
+                for course in courses]
+
+    def test_courses_are_read_as_typed(self):
+        self.assertEqual([schedules.course_key(text) for text in ['acc 201', ' ACC201 ', 'bio  10L', 'ACC', '']],
+                         ['ACC 201', 'ACC 201', 'BIO 10L', None, None])
+
+    def test_schedules_never_clash_and_the_most_compact_come_first(self):
+        options = self.options(
+            [('10001', 'MWF', '0900-0950'), ('10002', 'TR', '0930-1045'), ('10003', 'MW', '1800-2050')],
+            [('20001', 'MWF', '0900-0950'), ('20002', 'MWF', '1000-1050'), ('20003', 'TR', '1100-1215')],
+            [('30001', 'TR', '0930-1045'), ('30002', 'TBA', 'TBA')])
+        found, complete = schedules.build(options, limit=10)
+        self.assertTrue(complete)
+        picked = [[options[course][choice][1][0] for course, choice in enumerate(choices)]
+                  for score, mask, choices in found]
+        self.assertEqual(picked[:2], [['10002', '20003', '30002'], ['10001', '20002', '30002']])
+        self.assertEqual(len(picked), 10)
+        self.assertFalse([choice for choice in picked if '20001' in choice and '10001' in choice])
+        self.assertFalse([choice for choice in picked if '30001' in choice and '10002' in choice])
+        self.assertEqual([score for score, mask, choices in found], sorted(score for score, mask, choices in found))
+
+    def test_the_best_schedules_are_the_best_of_every_combination(self):
+        rng = random.Random(7)
+        times = [('MWF', '%02d00-%02d50' % (hour, hour)) for hour in range(8, 14)] + [
+            ('TR', meet_time) for meet_time in ['0800-0915', '0930-1045', '1100-1215', '1230-1345']]
+        options = self.options(*[[(str(crn),) + rng.choice(times) for crn in range(rng.randint(2, 6))]
+                                 for course in range(4)])
+        every = []
+        for choices in itertools.product(*[range(len(course)) for course in options]):
+            picked = [options[course][choice][0] for course, choice in enumerate(choices)]
+            mask = 0
+            for option in picked:
+                mask = mask | option if not mask & option else None
+                if mask is None:
+                    break
+            if mask is not None:
+                every.append(schedules.score(mask))
+        found, complete = schedules.build(options, limit=5)
+        self.assertEqual([score for score, mask, choices in found], sorted(every)[:5])
+
+    def test_a_search_gives_up_after_max_steps(self):
+        options = self.options(*[[(str(crn), 'MTWRF', '%02d00-%02d50' % (hour, hour)) for crn, hour in
+                                  enumerate(range(8, 20))] for course in range(5)])
+        found, complete = schedules.build(options, limit=3, max_steps=50)
+        self.assertFalse(complete)
+        self.assertTrue(found)
+
+    def test_sections_meeting_at_the_same_times_are_one_option(self):
+        rows = [make_section('10001', DAYS='MWF', MEET_TIME='0900-0950'),
+                make_section('10002', DAYS='MWF', MEET_TIME='0900-0950', remain=0),
+                make_section('10003', DAYS='TR', MEET_TIME='0930-1045', remain=0),
+                make_section('10004', DAYS='M', MEET_TIME='1400-1650')]
+        index = schedules.CourseMeetings([row[:-1] for row in rows])
+        self.assertEqual([crns for mask, crns in index.options(rows, 'ACC 201')],
+                         [['10001', '10002'], ['10003'], ['10004']])
+        self.assertEqual([crns for mask, crns in index.options(rows, 'ACC 201', open_only=True)],
+                         [['10001'], ['10004']])
+        self.assertEqual(index.options(rows, 'BIO 101'), [])
+
+
+class TimedCacheTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        local_cache().clear()
+        self.calls = []
+
+    def slow_lookup(self, term):
+        self.calls.append(term)
+        time.sleep(0.2)
+        return [term]
+
+    def test_concurrent_misses_call_the_function_once(self):
+        lookup = TimedCache(60)(self.slow_lookup)
+        threads = [threading.Thread(target=lookup, args=('201710',)) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.calls, ['201710'])
+        self.assertEqual(lookup('201710'), ['201710'])
+
+    def test_miss_waits_for_the_worker_holding_the_lease(self):
+        lookup = TimedCache(60)(self.slow_lookup)
+        cache_name = lookup.cache_key('201710')
+        cache.add('%s:lease' % cache_name, 'another-worker', 5)
+        threading.Timer(0.2, lambda: cache.set(cache_name, (['from-another-worker'], time.time()), 60)).start()
+        self.assertEqual(lookup('201710'), ['from-another-worker'])
+        self.assertEqual(self.calls, [])
+
+    def test_stale_entry_is_served_while_it_refreshes_in_the_background(self):
+        lookup = TimedCache(60, hard_time=600)(self.slow_lookup)
+        cache_name = lookup.cache_key('201710')
+        cache.set(cache_name, (['stale'], time.time() - 120), 600)
+        started = time.time()
+        self.assertEqual(lookup('201710'), ['stale'])
+        self.assertLess(time.time() - started, 0.2)
+
+        deadline = time.time() + 5
+        while cache.get(cache_name)[0] == ['stale'] and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(lookup('201710'), ['201710'])
+        self.assertEqual(self.calls, ['201710'])
+
+    def test_peeking_at_a_stale_entry_does_not_refresh_it(self):
+        lookup = TimedCache(60, hard_time=600)(self.slow_lookup)
+        cache.set(lookup.cache_key('201710'), (['stale'], time.time() - 120), 600)
+        self.assertIsNone(lookup.cached('201710'))
+        time.sleep(0.1)
+        self.assertEqual(self.calls, [])
+        self.assertEqual(cache.get(lookup.cache_key('201710'))[0], ['stale'])
+
+    def test_peeks_are_not_counted_as_hits(self):
+        lookup = TimedCache(60)(lambda term: [term])
+        lookup('201710')
+        timed_cache.reset_stats()
+        self.assertEqual(lookup.cached('201710')[0], ['201710'])
+        self.assertEqual(timed_cache.stats()['hits'], 0)
+        self.assertEqual(lookup('201710'), ['201710'])
+        self.assertEqual(timed_cache.stats()['hits'], 1)
+
+    def test_failed_refresh_keeps_the_stale_entry(self):
+        lookup = TimedCache(60, hard_time=600)(lambda term: None)
+        cache_name = lookup.cache_key('201710')
+        stored_at = time.time() - 120
+        cache.set(cache_name, (['stale'], stored_at), 600)
+        self.assertEqual(lookup('201710'), ['stale'])
+        time.sleep(0.2)
+        self.assertEqual(cache.get(cache_name), (['stale'], stored_at))
+
+    def test_cache_keys_are_stable_and_name_the_function(self):
+        lookup = TimedCache(60, family='Section')(self.slow_lookup)
+        self.assertEqual(lookup.cache_key('201710'), lookup.cache_key(term='201710'))
+        self.assertTrue(lookup.cache_key('201710').startswith('timedcache:2:Section:'))
+        self.assertNotEqual(lookup.cache_key('201710'), TimedCache(60, family='Section')(len).cache_key('201710'))
+
+    def test_invalidate_drops_only_the_given_family_and_term(self):
+
+        def sections(term, ptrm):
+            self.calls.append((term, ptrm))
+            return [term, ptrm]
+
+        def subjects(term, ptrm):
+            self.calls.append(('subjects', term, ptrm))
+            return [term, ptrm]
+        sections = TimedCache(60, family='Section')(sections)
+        subjects = TimedCache(60, family='Subjects')(subjects)
+        for lookup in (sections, subjects):
+            lookup('201710', 'R2')
+            lookup('201720', 'R2')
+        del self.calls[:]
+
+        invalidate('Section', '201710', 'R2')
+        for lookup in (sections, subjects):
+            lookup('201710', 'R2')
+            lookup('201720', 'R2')
+        self.assertEqual(self.calls, [('201710', 'R2')])
+
+        invalidate(term='201720', ptrm='R2')
+        sections('201720', 'R2')
+        subjects('201720', 'R2')
+        self.assertEqual(self.calls, [('201710', 'R2'), ('201720', 'R2'), ('subjects', '201720', 'R2')])
+
+    def test_hot_lookups_are_served_from_the_local_cache(self):
+        lookup = TimedCache(60)(self.slow_lookup)
+        self.assertEqual(lookup('201710'), ['201710'])
+        cache.clear()
+        self.assertEqual(lookup('201710'), ['201710'])
+        self.assertEqual(self.calls, ['201710'])
+
+    def test_shared_entries_are_kept_locally_without_pickling_them_again(self):
+        lookup = TimedCache(60)(self.slow_lookup)
+        lookup('201710')
+        local_cache().clear()
+        with mock.patch('apps.classSchedule.timed_cache.pickle.dumps', side_effect=AssertionError):
+            self.assertEqual(lookup('201710'), ['201710'])
+        self.assertEqual(local_cache().get(lookup.cache_key('201710'))[0], ['201710'])
+        self.assertEqual(self.calls, ['201710'])
+
+
+class LocalCacheTest(SimpleTestCase):
+    def test_least_recently_used_entries_are_evicted_first(self):
+        local = LocalCache(max_entries=2, max_bytes=1024 * 1024)
+        expires_at = time.time() + 60
+        local.set('a', 'A', expires_at)
+        local.set('b', 'B', expires_at)
+        local.get('a')
+        local.set('c', 'C', expires_at)
+        self.assertEqual((local.get('a'), local.get('b'), local.get('c')), ('A', None, 'C'))
+
+    def test_byte_budget_and_expiry_are_enforced(self):
+        local = LocalCache(max_entries=100, max_bytes=8 * 1024)
+        local.set('big', 'x' * 2048, time.time() + 60)
+        local.set('expired', 'x', time.time() - 1)
+        self.assertEqual(len(local), 0)
+        for index in range(20):
+            local.set(index, 'x' * 512, time.time() + 60)
+        self.assertLessEqual(local.size, 8 * 1024)
+        self.assertIsNone(local.get(0))
+        self.assertEqual(local.get(19), 'x' * 512)
+
+
+class SearchFormDataTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        local_cache().clear()
+
+    def test_missing_lookups_run_concurrently(self):
+        lookups = []
+        for name in ('subjects', 'instructors', 'campuses'):
+            lookup = TimedCache(60, family='FormDataTest')(lambda term, ptrm, name=name: time.sleep(0.3) or [name])
+            lookups.append((name, lookup, ('201710', 'R2')))
+        started = time.time()
+        form_data = SearchFormData(lookups)
+        self.assertLess(time.time() - started, 0.8)
+        self.assertEqual((form_data.subjects, form_data.campuses), (['subjects'], ['campuses']))
+
+        started = time.time()
+        self.assertEqual(SearchFormData(lookups).instructors, ['instructors'])
+        self.assertLess(time.time() - started, 0.1)
+
+
+@override_settings(BANNER_DATA_SOURCE='mirror')
+class MirrorTest(SimpleTestCase):
+    allow_database_queries = True
+
+    def setUp(self):
+        cache.clear()
+        local_cache().clear()
+        mirror.load_view('SWVSUBJ_WEB', [[('201710', 'ACC', 'Accounting', 'R2'), ('201710', 'BIO', None, 'R2')],
+                                         [('201720', 'ACC', 'Accounting', 'R2')]])
+
+    def test_lookups_read_the_mirror(self):
+        self.assertEqual(Subjects.get_all_subjects('201710', 'R2'),
+                         [('201710', 'ACC', 'Accounting', 'R2'), ('201710', 'BIO', 'n/a', 'R2')])
+
+    def test_a_new_generation_replaces_the_old_one(self):
+        mirror.load_view('SWVSUBJ_WEB', [[('201710', 'ANT', 'Anthropology', 'R2')]])
+        self.assertEqual(Subjects.get_all_subjects('201710', 'R2'), [('201710', 'ANT', 'Anthropology', 'R2')])
+        self.assertIn('SWVSUBJ_WEB', [view for view, generation, synced_at, row_count in mirror.status()])
+
+    def test_a_failed_load_keeps_the_current_generation(self):
+        def batches():
+            yield [('201710', 'ANT', 'Anthropology', 'R2')]
+            raise cx_Oracle.DatabaseError('ORA-03113: end-of-file on communication channel')
+        with self.assertRaises(cx_Oracle.DatabaseError):
+            mirror.load_view('SWVSUBJ_WEB', batches())
+        self.assertEqual(len(Subjects.get_all_subjects('201710', 'R2')), 2)
+
+    def test_a_view_is_loaded_by_one_sync_at_a_time(self):
+        with mirror.view_lock(mirror.database(), 'SWVSUBJ_WEB', 60):
+            with self.assertRaises(cx_Oracle.DatabaseError):
+                mirror.load_view('SWVSUBJ_WEB', [[('201710', 'ANT', 'Anthropology', 'R2')]])
+        self.assertEqual(len(Subjects.get_all_subjects('201710', 'R2')), 2)
+
+        with mirror.view_lock(mirror.database(), 'SWVSUBJ_WEB', -1):
+            # a lock past its timeout is taken over
+            self.assertEqual(mirror.load_view('SWVSUBJ_WEB', [[('201710', 'ANT', 'Anthropology', 'R2')]]), 1)
+
+
+class SectionQueryTest(SimpleTestCase):
+    def test_search_values_are_bound_not_inlined(self):
+        statement, binds = section_query(term='201710', ptrm='R2', subject='ACC', instructor="O'Neil", campus='M')
+        self.assertNotIn('ACC', statement)
+        self.assertNotIn("O'Neil", statement)
+        self.assertEqual(binds, {'term': '201710', 'ptrm': 'R2', 'subject': 'ACC%', 'instructor': "%O'Neil%",
+                                 'campus': 'M'})
+
+    def test_searches_with_the_same_filters_share_one_statement(self):
+        statement, binds = section_query(term='201710', ptrm='R2', subject='ACC', open_only=True)
+        texts = statement_texts()
+        for term, subject in [('201720', 'BIO'), ('201810', 'A'), ('201710', 'CHM')]:
+            self.assertEqual(section_query(term=term, ptrm='R2', subject=subject, open_only=True)[0], statement)
+        self.assertEqual(statement_texts(), texts)
+
+    def test_crn_lists_are_padded_to_a_few_statement_texts(self):
+        statement, binds = section_query(term='201710', ptrm='R2', crns=('10001', '10002', '10003'))
+        self.assertEqual(section_query(term='201710', ptrm='R2', crns=('10004', '10005', '10006', '10007'))[0],
+                         statement)
+        self.assertEqual(sorted(binds.items())[:5], [('crn_0', '10001'), ('crn_1', '10002'), ('crn_2', '10003'),
+                                                     ('crn_3', None), ('ptrm', 'R2')])
+
+
+@override_settings(BANNER_DATA_SOURCE='fixture', BANNER_FIXTURES='', BANNER_FIXTURE_SECTIONS=60)
+class FixtureSourceTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        local_cache().clear()
+        Section.snapshots.clear()
+        fixture_source.reset()
+
+    def tearDown(self):
+        fixture_source.reset()
+
+    def test_lookups_return_the_banner_tuple_shapes(self):
+        term, ptrm, description, start, end = PelTerms.get_pel_terms()[0]
+        self.assertIsInstance(start, datetime.datetime)
+        sections = Section.get_pel_sections(term, ptrm, subject='0', instructor='0', area='0', spec='0',
+                                            campus='0', open_only='0')
+        self.assertGreaterEqual(len(sections), 60)
+        self.assertEqual(len(sections[0]), len(SECTION_COLUMNS))
+
+    def test_warm_cache_leaves_nothing_for_the_searches_to_read(self):
+        call_command('warm_cache', stdout=io.StringIO())
+        queries = fixture_source.stats()['queries']
+        terms = [term[:2] for term in PelTerms.get_pel_terms() + ResTerms.get_res_terms()]
+        self.assertTrue(terms)
+        for term, ptrm in terms:
+            self.assertIsNotNone(Section.get_term_snapshot(term, ptrm))
+            self.assertIsNotNone(Section.get_instructor_index(term, ptrm))
+            self.assertIsNotNone(Section.get_term_descriptions(term, ptrm))
+        self.assertEqual(fixture_source.stats()['queries'], queries)
+
+    def test_results_page_renders_fixture_sections(self):
+        term, ptrm = PelTerms.get_pel_terms()[0][:2]
+        response = self.client.get('/course/search/results/pel/%s/%s/' % (term, ptrm))
+        self.assertContains(response, 'data-title="CRN"')
+
+    @override_settings(BANNER_ARRAYSIZE=25)
+    def test_streamed_results_page_matches_the_rendered_page(self):
+        for query in ['', '?subject=ZZZ']:
+            for view, (term, ptrm) in [('pel', PelTerms.get_pel_terms()[0][:2]),
+                                       ('res', ResTerms.get_res_terms()[0][:2])]:
+                url = '/course/search/results/%s/%s/%s/%s' % (view, term, ptrm, query)
+                streamed = self.client.get(url)
+                self.assertTrue(streamed.streaming)
+                with override_settings(SEARCH_RESULTS_STREAMING=False):
+                    rendered = self.client.get(url)
+                self.assertEqual(b''.join(streamed.streaming_content).split(), rendered.content.split())
+
+    @override_settings(SECTION_SNAPSHOTS=False, BANNER_ARRAYSIZE=10)
+    def test_database_errors_while_streaming_are_not_hidden(self):
+        term, ptrm = PelTerms.get_pel_terms()[0][:2]
+        url = '/course/search/results/pel/%s/%s/' % (term, ptrm)
+        fetch_batches = banner.fetch_batches
+
+        def failing(after):
+            def batches(cur):
+                yield from itertools.islice(fetch_batches(cur), after)
+                raise cx_Oracle.DatabaseError('ORA-03113: end-of-file on communication channel')
+            return batches
+
+        with mock.patch('apps.classSchedule.banner.fetch_batches', failing(0)):
+            with self.assertRaises(cx_Oracle.DatabaseError):
+                self.client.get(url)
+        with mock.patch('apps.classSchedule.banner.fetch_batches', failing(2)):
+            response = self.client.get(url)
+            page = b''.join(response.streaming_content).decode()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(page.count('data-title="CRN"'), 20)
+        self.assertIn('could not be read in full', page)
+        self.assertIn('</html>', page)
+
+    def test_unchanged_pages_answer_conditional_requests_with_304(self):
+        pel_term, pel_ptrm = PelTerms.get_pel_terms()[0][:2]
+        res_term, res_ptrm = ResTerms.get_res_terms()[0][:2]
+        for snapshots in (True, False):
+            with override_settings(SECTION_SNAPSHOTS=snapshots):
+                for url in ['/', '/course/search/pel/%s/%s/' % (pel_term, pel_ptrm),
+                            '/course/search/res/%s/%s/' % (res_term, res_ptrm),
+                            '/course/search/results/pel/%s/%s/?subject=ACC' % (pel_term, pel_ptrm),
+                            '/course/search/results/res/%s/%s/' % (res_term, res_ptrm)]:
+                    for _ in range(2):
+                        response = self.client.get(url)
+                        if response.streaming:
+                            b''.join(response.streaming_content)
+                    self.assertIn('ETag', response, url)
+                    queries = fixture_source.stats()['queries']
+                    unchanged = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+                    self.assertEqual(unchanged.status_code, 304, url)
+                    self.assertEqual(unchanged['ETag'], response['ETag'])
+                    self.assertEqual(fixture_source.stats()['queries'], queries)
+                    if 'Last-Modified' in response:
+                        unchanged = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+                        self.assertEqual(unchanged.status_code, 304, url)
+
+        etag = self.client.get('/')['ETag']
+        PelTerms.get_pel_terms.refresh()
+        self.assertEqual(self.client.get('/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_keyword_searches_rank_the_sections_matching_every_word(self):
+        term, ptrm = PelTerms.get_pel_terms()[0][:2]
+        sections = Section.get_pel_sections(term, ptrm, '0', '0', '0', '0', '0', '0')
+        word = sections[0].crse_title.split()[0]
+        descriptions = Section.get_term_descriptions(term, ptrm)
+        expected = set(section.crn for section in sections if word.lower() in
+                       (section.crse_title + ' ' + (descriptions[section.crn] or '')).lower().split())
+
+        for snapshots in (True, False):
+            with override_settings(SECTION_SNAPSHOTS=snapshots):
+                found = Section.get_pel_sections(term, ptrm, '0', '0', '0', '0', '0', '0', keywords=word)
+                self.assertTrue(expected)
+                self.assertEqual(set(section.crn for section in found), expected)
+                crns = [section.crn for section in found]
+                self.assertEqual(sorted(set(crns), key=crns.index), Section.keyword_crns(term, ptrm, word))
+
+        url = '/course/search/results/pel/%s/%s/?keywords=%s' % (term, ptrm, word)
+        with override_settings(SEARCH_RESULTS_STREAMING=False):
+            self.assertContains(self.client.get(url), 'data-title="CRN"', count=len(found))
+
+    def test_meeting_filters_match_the_parsed_meeting_times(self):
+        term, ptrm = PelTerms.get_pel_terms()[0][:2]
+        sections = Section.get_pel_sections(term, ptrm, '0', '0', '0', '0', '0', '0')
+        for days, start, end in [('TR', '0', '0'), ('0', '0900', '0'), ('MWF', '0800', '1700'), ('0', '0', '1200')]:
+            allowed = meetings.allowed_mask(days, start, end)
+            masks = meetings.section_masks((section.crn, section.days, section.meet_time) for section in sections)
+            expected = [section for section in sections if meetings.fits(masks[section.crn], allowed)]
+            self.assertTrue(expected)
+            for snapshots in (True, False):
+                with override_settings(SECTION_SNAPSHOTS=snapshots):
+                    self.assertEqual(Section.get_pel_sections(term, ptrm, '0', '0', '0', '0', '0', '0', days=days,
+                                                              start=start, end=end), expected)
+
+        url = '/course/search/results/pel/%s/%s/?days=TR' % (term, ptrm)
+        for streaming in (True, False):
+            with override_settings(SEARCH_RESULTS_STREAMING=streaming, SECTION_SNAPSHOTS=False):
+                response = self.client.get(url)
+                content = b''.join(response.streaming_content) if response.streaming else response.content
+                self.assertIn(b'Meets Only On', content)
+
+    @override_settings(SCHEDULE_RESULTS=5)
+    def test_schedules_take_a_section_of_every_course_without_clashes(self):
+        term, ptrm = PelTerms.get_pel_terms()[0][:2]
+        sections = Section.get_pel_sections(term, ptrm, '0', '0', '0', '0', '0', '0')
+        courses = []
+        for section in sections:
+            course = '%s %s' % (section.subj, section.crse_numb)
+            if course not in courses:
+                courses.append(course)
+        url = '/course/schedules/%s/%s/' % (term, ptrm)
+        masks = meetings.section_masks((section.crn, section.days, section.meet_time) for section in sections)
+        by_crn = dict((section.crn, section) for section in sections)
+
+        queries = fixture_source.stats()['queries']
+        response = self.client.get(url, {'course': [course.lower() for course in courses[:3]], 'open_only': '1'})
+        self.assertEqual(fixture_source.stats()['queries'], queries)
+        found = response.json()
+        self.assertEqual(found['courses'], courses[:3])
+        self.assertTrue(found['complete'])
+        self.assertTrue(0 < len(found['schedules']) <= 5)
+        for schedule in found['schedules']:
+            self.assertEqual([section['course'] for section in schedule['sections']], courses[:3])
+            mask = 0
+            for section in schedule['sections']:
+                self.assertTrue(all(by_crn[crn].remain > 0 for crn in section['crns']))
+                self.assertFalse(mask & masks[section['crns'][0]])
+                mask |= masks[section['crns'][0]]
+
+        self.assertEqual(self.client.get(url, {'course': 'ACC'}).status_code, 400)
+        self.assertEqual(self.client.get(url).status_code, 400)
+        self.assertEqual(self.client.get(url, {'course': courses[0], 'limit': 'x'}).status_code, 400)
+        missing = self.client.get(url, {'course': [courses[0], 'ZZZ 999']})
+        self.assertEqual((missing.status_code, missing.json()['missing']), (404, ['ZZZ 999']))
+
+    @override_settings(TYPEAHEAD_RESULTS=5)
+    def test_typeahead_suggests_courses_without_reading_banner(self):
+        term, ptrm = PelTerms.get_pel_terms()[0][:2]
+        section = Section.get_pel_sections(term, ptrm, '0', '0', '0', '0', '0', '0')[0]
+        url = '/course/typeahead/%s/%s/' % (term, ptrm)
+        self.client.get(url, {'q': section.subj})
+
+        queries = fixture_source.stats()['queries']
+        response = self.client.get(url, {'q': '%s %s' % (section.subj.lower(), section.crse_numb)})
+        self.assertEqual(response.json()['results'][0]['value'], '%s %s' % (section.subj, section.crse_numb))
+        self.assertEqual(len(self.client.get(url, {'q': section.crn[0]}).json()['results']), 5)
+        self.assertEqual(len(self.client.get(url, {'q': section.crn[0], 'limit': 2}).json()['results']), 2)
+        self.assertEqual(fixture_source.stats()['queries'], queries)
+        self.assertEqual(self.client.get(url, {'q': 'a', 'limit': 'x'}).status_code, 400)
+
+    def test_course_detail_is_loaded_on_demand(self):
+        term, ptrm = PelTerms.get_pel_terms()[0][:2]
+        section = Section.get_pel_sections(term, ptrm, '0', '0', '0', '0', '0', '0')[0]
+        crn = section[SECTION_COLUMNS.index('CRN')]
+        detail = Section.get_section_detail(term, ptrm, crn)[0]
+        self.assertEqual(detail[DETAIL_COLUMNS.index('CRN')], crn)
+        self.assertEqual(len(section), len(SECTION_COLUMNS))
+
+        queries = fixture_source.stats()['queries']
+        response = self.client.get('/course/detail/%s/%s/%s/' % (term, ptrm, crn))
+        self.assertContains(response, detail[DETAIL_COLUMNS.index('CRSE_TEXT')])
+        self.assertEqual(fixture_source.stats()['queries'], queries)
+        for snapshots in (True, False):
+            with override_settings(SECTION_SNAPSHOTS=snapshots):
+                self.assertEqual(self.client.get('/course/detail/%s/%s/99999/' % (term, ptrm)).status_code, 404)
+
+    def test_bound_search_matches_the_snapshot_search(self):
+        term, ptrm = PelTerms.get_pel_terms()[0][:2]
+        instructor = Instructors.get_all_instructors(term, ptrm)[0][2]
+        searches = [('0', '0', '0', '0', '0', '0'), ('A', '0', '0', '0', '0', '1'), ('0', '0', 'N', 'ZRWR', 'M', '0'),
+                    ('0', instructor, '0', '0', '0', '0'), ('0', instructor[:4], '0', '0', '0', '0')]
+        for subject, instructor, area, spec, campus, open_only in searches:
+            with override_settings(SECTION_SNAPSHOTS=False):
+                queried = Section.get_pel_sections(term, ptrm, subject, instructor, area, spec, campus, open_only)
+            self.assertEqual(queried, Section.get_pel_sections(term, ptrm, subject, instructor, area, spec, campus,
+                                                               open_only))
+
+    def test_instructor_searches_are_answered_from_the_index(self):
+        term, ptrm = PelTerms.get_pel_terms()[0][:2]
+        index = Section.get_instructor_index(term, ptrm)
+        rows = Section.get_term_sections(term, ptrm)
+        for instructor in [name for name, crns in index.items() if crns][:10]:
+            sections = Section.get_pel_sections(term, ptrm, '0', instructor, '0', '0', '0', '0')
+            self.assertEqual([section.crn for section in sections],
+                             [row[SECTION_COLUMNS.index('CRN')] for row in rows
+                              if instructor in row[SECTION_COLUMNS.index('INSTRUCT_ALL')]])
+            statement, binds = Section.search_query(term, ptrm, instructor=instructor)
+            self.assertNotIn('INSTRUCT_ALL LIKE', statement)
+            self.assertEqual(set(binds.values()) - {term, ptrm, None}, set(index[instructor]))
+
+    @override_settings(SECTION_SNAPSHOTS=False, BANNER_ARRAYSIZE=25)
+    def test_sections_stream_in_batches_and_are_cached_once_read(self):
+        term, ptrm = PelTerms.get_pel_terms()[0][:2]
+        search = (term, ptrm, '0', '0', '0', '0', '0', '0')
+        batches = list(Section.stream_pel_sections(*search))
+        self.assertTrue(all(len(batch) <= 25 for batch in batches))
+        self.assertGreater(len(batches), 2)
+        self.assertIsNotNone(Section.query_pel_sections.cached(*search))
+        queries = fixture_source.stats()['queries']
+        self.assertEqual([row for batch in batches for row in batch], Section.get_pel_sections(*search))
+        self.assertEqual(fixture_source.stats()['queries'], queries)
+
+    def test_recorded_fixtures_are_read_back(self):
+        views = fixture_source.generate(sections=5)
+        with tempfile.NamedTemporaryFile(suffix='.json') as fixtures_file:
+            fixture_source.write(fixtures_file.name, views)
+            self.assertEqual(fixture_source.read(fixtures_file.name), views)
+
+    @override_settings(BANNER_FIXTURE_FAILURE_RATE=1.0)
+    def test_injected_failures_surface_as_database_errors(self):
+        self.assertIsNone(PelTerms.get_pel_terms())
+        self.assertEqual(fixture_source.stats()['failures'], 1)
+
+    @override_settings(BANNER_FIXTURE_LATENCY=0.05)
+    def test_injected_latency(self):
+        started = time.time()
+        PelTerms.get_pel_terms()
+        self.assertGreaterEqual(time.time() - started, 0.05)
+        self.assertEqual(fixture_source.stats()['queries'], 1)
+
+    def test_benchmark_reports_every_scenario(self):
+        with tempfile.NamedTemporaryFile(suffix='.json') as output_file:
+            call_command('benchmark', views=['localsite'], requests=4, concurrency=2, output=output_file.name,
+                         stdout=io.StringIO())
+            report = json.load(output_file)
+        self.assertEqual([result['scenario'] for result in report['results']], ['cold', 'warm'])
+        cold, warm = report['results']
+        self.assertEqual(cold['errors'], 0)
+        self.assertGreater(cold['banner_queries'], 0)
+        self.assertEqual(warm['banner_queries'], 0)
+        self.assertEqual(warm['hit_ratio'], 1.0)
+        self.assertGreater(report['peak_rss_kb'], 0)
+        self.assertNotIn('peak_rss_kb', warm)
+
+    def test_benchmark_measures_the_cached_rows(self):
+        with tempfile.NamedTemporaryFile(suffix='.json') as output_file:
+            call_command('benchmark', rows=True, requests=2, output=output_file.name, stdout=io.StringIO())
+            report = json.load(output_file)
+        tuples, section_rows = report['results']
+        self.assertLess(section_rows['pickled_bytes'], tuples['pickled_bytes'])
+        self.assertLess(section_rows['memory_bytes'], tuples['memory_bytes'])
+
+
+@override_settings(BANNER_DATA_SOURCE='fixture', BANNER_FIXTURES='', BANNER_FIXTURE_SECTIONS=20)
+class MetricsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        local_cache().clear()
+        fixture_source.reset()
+
+    def tearDown(self):
+        fixture_source.reset()
+
+    def test_lookups_and_views_are_exposed(self):
+        labels = dict(function='PelTerms.get_pel_terms', view='localsite')
+        misses = metrics.CACHE_LOOKUPS.value(outcome='miss', **labels)
+        rows = metrics.BANNER_ROWS.value(**labels)
+        self.client.get('/')
+        self.client.get('/')
+        self.assertEqual(metrics.CACHE_LOOKUPS.value(outcome='miss', **labels), misses + 1)
+        self.assertEqual(metrics.BANNER_ROWS.value(**labels), rows + 4)
+
+        response = self.client.get('/metrics')
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        self.assertContains(response, '# TYPE classschedule_banner_query_seconds histogram')
+        self.assertContains(response, 'classschedule_banner_query_seconds_count{function="PelTerms.get_pel_terms",'
+                                      'view="localsite"}')
+        self.assertContains(response, 'classschedule_cache_lookups_total{function="PelTerms.get_pel_terms",'
+                                      'outcome="hit",view="localsite"}')
+        self.assertContains(response, 'classschedule_request_seconds_bucket{view="localsite",status="200",le="+Inf"}')
+
+    def test_streamed_pages_are_timed_until_their_last_chunk(self):
+        term, ptrm = PelTerms.get_pel_terms()[0][:2]
+        labels = dict(view='course_search_results_pel', status=200)
+        observed = metrics.REQUEST_SECONDS.count(**labels)
+        response = self.client.get('/course/search/results/pel/%s/%s/' % (term, ptrm))
+        self.assertTrue(response.streaming)
+        self.assertEqual(metrics.REQUEST_SECONDS.count(**labels), observed)
+        b''.join(response.streaming_content)
+        self.assertEqual(metrics.REQUEST_SECONDS.count(**labels), observed + 1)
+
+    def test_form_lookups_loaded_on_other_threads_carry_the_view(self):
+        term, ptrm = PelTerms.get_pel_terms()[0][:2]
+        labels = dict(function='Subjects.get_all_subjects', view='course_search_pel')
+        misses = metrics.CACHE_LOOKUPS.value(outcome='miss', **labels)
+        queries = metrics.BANNER_QUERY_SECONDS.count(**labels)
+        self.assertEqual(self.client.get('/course/search/pel/%s/%s/' % (term, ptrm)).status_code, 200)
+        self.assertEqual(metrics.CACHE_LOOKUPS.value(outcome='miss', **labels), misses + 1)
+        self.assertEqual(metrics.BANNER_QUERY_SECONDS.count(**labels), queries + 1)
+
+    @override_settings(BANNER_FIXTURE_FAILURE_RATE=1.0)
+    def test_database_errors_are_counted(self):
+        labels = dict(function='ResTerms.get_res_terms', view='unknown')
+        errors = metrics.BANNER_ERRORS.value(**labels)
+        self.assertIsNone(ResTerms.get_res_terms())
+        self.assertEqual(metrics.BANNER_ERRORS.value(**labels), errors + 1)
+
+    def test_metrics_are_limited_to_the_allowed_addresses(self):
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.1.2.3').status_code, 403)
@@ -0,0 +1,557 @@
+"""classSchedule/timed_cache.py - the TimedCache decorator the oracle_models lookups are cached with"""
+
+# django
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+import contextlib
+import functools
+import hashlib
+import inspect
+import logging
+import os
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# djClassSchedulePrj
+from apps.classSchedule import metrics
+
+
+class KeyLocks(object):
+    """one lock per cache key, kept only while some thread holds or waits for it"""
+
+    def __init__(self):
+        self._guard = threading.Lock()
+        self._locks = {}
+
+    @contextlib.contextmanager
+    def hold(self, key):
+        with self._guard:
+            entry = self._locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._guard:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[key]
+
+
+class RefreshPool(object):
+    """a bounded pool of background threads that refresh stale cache entries
+
+    a key is only ever queued once at a time, and once max_pending keys are queued or running further refreshes
+    are turned away - the stale value keeps being served and the next request asks again.
+    """
+
+    def __init__(self, workers, max_pending):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._executor = None
+        self._pid = None
+
+    def submit(self, key, fn, *args, **kwargs):
+        """run fn(*args, **kwargs) in the background unless key is already being refreshed
+
+        :rtype: bool
+        :return: whether the refresh was queued
+        """
+        fn = metrics.carried(fn)
+        with self._lock:
+            if self._pid != os.getpid():
+                # threads do not survive a fork, so a forked worker starts with its own pool
+                self._executor = ThreadPoolExecutor(max_workers=self.workers)
+                self._pending = set()
+                self._pid = os.getpid()
+            if key in self._pending or len(self._pending) >= self.max_pending:
+                return False
+            self._pending.add(key)
+            executor = self._executor
+
+        def run():
+            try:
+                fn(*args, **kwargs)
+            except Exception:
+                logging.getLogger('django').exception("background refresh of %s failed" % (key,))
+            finally:
+                # django only closes the database connections of request threads, like the mirror's opened here
+                connections.close_all()
+                with self._lock:
+                    self._pending.discard(key)
+
+        executor.submit(run)
+        return True
+
+
+class LocalCache(object):
+    """a bounded, in-process LRU cache that sits in front of the shared django cache
+
+    it holds at most max_entries entries and max_bytes pickled bytes, evicting the least recently used entries
+    first. a single value bigger than an eighth of max_bytes is never kept so one large lookup cannot flush the
+    small, hot ones.
+    """
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        """the value cached under key, or None once it expired or was evicted"""
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            value, expires_at, size = item
+            if time.time() >= expires_at:
+                del self._entries[key]
+                self.size -= size
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, expires_at, size=None):
+        """keep value under key until expires_at (an epoch time) unless it is too big for the budget
+
+        :param size: the pickled bytes of value when the caller already knows them, measured here otherwise
+        """
+        if time.time() >= expires_at:
+            return
+        if size is None:
+            size = len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        if size > self.max_bytes // 8:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= old[2]
+            self._entries[key] = (value, expires_at, size)
+            self.size += size
+            while self._entries and (len(self._entries) > self.max_entries or self.size > self.max_bytes):
+                self.size -= self._entries.popitem(last=False)[1][2]
+
+    def delete(self, key):
+        with self._lock:
+            item = self._entries.pop(key, None)
+            if item is not None:
+                self.size -= item[2]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class TermMap(object):
+    """the per term / ptrm objects a process keeps in memory, at most max_entries of them, the least recently used
+    one dropped to make room - the term and ptrm come from the url, so a made up one must not stay around for good
+    """
+
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries if max_entries is not None else getattr(settings, 'TERMS_KEPT', 24)
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._entries:
+                return default
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = value
+            while len(self._entries) > max(self.max_entries, 1):
+                self._entries.popitem(last=False)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_local_cache = None
+_refresh_pool = None
+_singleton_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = OrderedDict([('hits', 0), ('stale', 0), ('misses', 0)])
+
+# the outcome label of each stats() counter in the classschedule_cache_lookups_total metric. peeks - fresh entries
+# read by cached(), which never computes - only have the label: the lookup that usually follows one is counted
+OUTCOMES = {'hits': 'hit', 'stale': 'stale', 'misses': 'miss', 'peeks': 'peek'}
+
+
+def count(outcome, function):
+    if outcome in _stats:
+        with _stats_lock:
+            _stats[outcome] += 1
+    metrics.CACHE_LOOKUPS.inc(function=function, outcome=OUTCOMES[outcome], view=metrics.current('view'))
+
+
+def stats():
+    """how TimedCache lookups in this process were answered since the last reset_stats(): fresh from the cache
+    (hits), stale from the cache while refreshing (stale) or by calling the function (misses)
+
+    :rtype: OrderedDict
+    """
+    with _stats_lock:
+        return OrderedDict(_stats)
+
+
+def reset_stats():
+    with _stats_lock:
+        for outcome in _stats:
+            _stats[outcome] = 0
+
+
+def local_cache():
+    """the process-wide LocalCache, sized by TIMED_CACHE_LOCAL_ENTRIES and TIMED_CACHE_LOCAL_BYTES
+
+    :rtype: LocalCache
+    """
+    global _local_cache
+    if _local_cache is None:
+        with _singleton_lock:
+            if _local_cache is None:
+                _local_cache = LocalCache(getattr(settings, 'TIMED_CACHE_LOCAL_ENTRIES', 512),
+                                          getattr(settings, 'TIMED_CACHE_LOCAL_BYTES', 16 * 1024 * 1024))
+    return _local_cache
+
+
+def local_cache_usage():
+    cache_in_use = _local_cache
+    if cache_in_use is None:
+        return []
+    return [(('entries',), len(cache_in_use)), (('bytes',), cache_in_use.size)]
+
+
+metrics.Gauge('classschedule_local_cache_usage', "entries and pickled bytes held by this process's LocalCache",
+              local_cache_usage, ['measure'])
+
+
+def refresh_pool():
+    """the process-wide RefreshPool, sized by TIMED_CACHE_REFRESH_WORKERS and TIMED_CACHE_REFRESH_QUEUE
+
+    :rtype: RefreshPool
+    """
+    global _refresh_pool
+    if _refresh_pool is None:
+        with _singleton_lock:
+            if _refresh_pool is None:
+                _refresh_pool = RefreshPool(getattr(settings, 'TIMED_CACHE_REFRESH_WORKERS', 4),
+                                            getattr(settings, 'TIMED_CACHE_REFRESH_QUEUE', 32))
+    return _refresh_pool
+
+
+def generation_keys(family, term=None, ptrm=None):
+    """the cache keys of the generation tokens an entry of family (for term / ptrm) is keyed under"""
+    keys = ['timedcache:gen:family:%s' % family]
+    if term is not None or ptrm is not None:
+        keys.append('timedcache:gen:term:%s:%s' % (term, ptrm))
+        keys.append('timedcache:gen:family:%s:term:%s:%s' % (family, term, ptrm))
+    return keys
+
+
+def new_generation():
+    return uuid.uuid4().hex[:12]
+
+
+def generations(keys):
+    """the current generation token behind each key, starting a new generation for keys the cache lost
+
+    tokens are kept in the local cache for TIMED_CACHE_GENERATION_TTL seconds, so an invalidate() in another
+    worker takes up to that long to reach this one
+
+    :rtype: list
+    """
+    local = local_cache()
+    found = {}
+    for key in keys:
+        token = local.get(key)
+        if token is not None:
+            found[key] = token
+    missing = [key for key in keys if key not in found]
+    if missing:
+        found.update(cache.get_many(missing))
+        expires_at = time.time() + getattr(settings, 'TIMED_CACHE_GENERATION_TTL', 5)
+        for key in missing:
+            if key not in found:
+                token = new_generation()
+                if not cache.add(key, token, None):
+                    token = cache.get(key, token)
+                found[key] = token
+            # a token is a short string, about as many bytes as characters
+            local.set(key, found[key], expires_at, len(str(found[key])))
+    return [found[key] for key in keys]
+
+
+def invalidate(family=None, term=None, ptrm=None):
+    """drop every TimedCache entry of a function family, of a term / ptrm, or of a family within a term / ptrm
+
+    nothing is deleted - the generation token the entries are keyed under is replaced, so every worker starts
+    missing on them and the cache evicts them in its own time. for example invalidate('Section', '201710', 'R2')
+    drops all Section results for 201710 / R2 and leaves every other entry alone.
+
+    :param family: the class name of the oracle_models lookups, ex: Section, or the family given to TimedCache
+    :param term:
+    :param ptrm:
+    """
+    if family is None and term is None and ptrm is None:
+        raise ValueError("invalidate needs a family, a term / ptrm or both")
+    if family is None:
+        key = 'timedcache:gen:term:%s:%s' % (term, ptrm)
+    else:
+        key = generation_keys(family, term, ptrm)[-1]
+    cache.set(key, new_generation(), None)
+    local_cache().delete(key)
+    logging.getLogger("django").info("timed cache invalidated - family %s - term %s - ptrm %s" % (
+        family, term, ptrm))
+
+
+class TimedCache(object):
+
+    def __init__(self, time, hard_time=None, lease=None, family=None):
+        """
+        :param time: seconds a result is fresh and served straight from the cache
+        :param hard_time: turns on stale-while-revalidate - a result older than time but younger than hard_time
+                          is still served while a background thread refreshes it. without it a result is
+                          dropped after time seconds and the next caller waits for Oracle
+        :param lease: seconds one worker process may spend computing a missing entry before the others stop
+                      waiting for it, defaults to settings.TIMED_CACHE_LEASE_TIMEOUT
+        :param family: the name invalidate() drops this function's entries by, defaults to the name of the
+                       class the function is defined on
+        """
+        self.time = time
+        self.hard_time = hard_time
+        self.lease = lease
+        self.family = family
+        self.key_locks = KeyLocks()
+
+    def __call__(self, fn, *args, **kwargs):
+        """This method creates a new function from the original that utilizes the time
+           set originally as the cache timer. It establishes a hash based on the function
+           name and arguments to uniquely identify the hash.
+
+           Concurrent misses on the same key are coalesced: inside a process one thread computes the value
+           while the others wait on a lock, and across processes the computing worker holds a lease in the
+           cache that the other workers poll behind until the value shows up or the lease runs out.
+
+           The new function also gets a lookup(max_age, *args, **kwargs) attribute returning the cached
+           (value, stored_at) pair, recomputed when it is older than max_age seconds, a
+           cached(*args, **kwargs) attribute returning the cached pair or None without ever calling Oracle, a
+           refresh(*args, **kwargs) attribute recomputing the entry right away, a
+           store(value, *args, **kwargs) attribute caching a value computed elsewhere for a call and a
+           cache_key(*args, **kwargs) attribute returning the key a call is cached under."""
+        signature = inspect.signature(fn)
+        family = self.family or fn.__qualname__.split('.')[0]
+
+        def cache_key(*args, **kwargs):
+            return self.cache_key(fn, family, signature, args, kwargs)
+
+        @functools.wraps(fn)
+        def new_function(*args, **kwargs):
+            return self.lookup(cache_key(*args, **kwargs), fn, args, kwargs)[0]
+
+        def lookup(max_age, *args, **kwargs):
+            return self.lookup(cache_key(*args, **kwargs), fn, args, kwargs, max_age=max_age)
+
+        def cached(*args, **kwargs):
+            return self.lookup(cache_key(*args, **kwargs), fn, args, kwargs, compute=False)
+
+        def refresh(*args, **kwargs):
+            cache_name = cache_key(*args, **kwargs)
+            with self.key_locks.hold(cache_name):
+                return self.compute_once(cache_name, fn, args, kwargs, self.time)
+
+        def store(value, *args, **kwargs):
+            return self.store(cache_key(*args, **kwargs), value, fn.__qualname__)
+
+        new_function.lookup = lookup
+        new_function.cached = cached
+        new_function.refresh = refresh
+        new_function.store = store
+        new_function.cache_key = cache_key
+        return new_function
+
+    def cache_key(self, fn, family, signature, args, kwargs):
+        """a key that is the same in every worker process for the same call, built from TIMED_CACHE_VERSION, the
+        function's qualified name, its arguments with defaults filled in and the generation tokens of its family
+        and, for functions taking a term and ptrm, of that term / ptrm"""
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        arguments = list(bound.arguments.items())
+        if 'term' in bound.arguments and 'ptrm' in bound.arguments:
+            keys = generation_keys(family, bound.arguments['term'], bound.arguments['ptrm'])
+        else:
+            keys = generation_keys(family)
+        name = '|'.join([fn.__module__, fn.__qualname__] + generations(keys))
+        return 'timedcache:%s:%s:%s' % (getattr(settings, 'TIMED_CACHE_VERSION', 1), family,
+                                        self.create_cache_hash(name, *arguments))
+
+    def lookup(self, cache_name, fn, args, kwargs, max_age=None, compute=True):
+        """the cached (value, stored_at) of fn(*args, **kwargs)
+
+        :param cache_name: the key of the call
+        :param max_age: seconds the entry may have been cached for, defaults to the soft ttl. past it the entry
+                        is refreshed in the background when stale-while-revalidate is on and the entry is
+                        younger than hard_time, and recomputed before returning otherwise
+        :param compute: when False, None is returned instead of calling fn for a missing or expired entry
+        :rtype: tuple
+        """
+        logger = logging.getLogger("django")
+        if max_age is None:
+            max_age = self.time
+        entry = self.get_entry(cache_name)
+        if entry is not None:
+            if time.time() - entry[1] < max_age:
+                logger.debug("%s returned from Cache with arguments %s" % (fn.__name__, args))
+                count('hits' if compute else 'peeks', fn.__qualname__)
+                return entry
+            if not compute:
+                # a peek never starts a refresh
+                return None
+            if self.hard_time is not None:
+                refresh_pool().submit(cache_name, self.refresh, cache_name, fn, args, kwargs)
+                logger.debug("%s returned stale from Cache with arguments %s" % (fn.__name__, args))
+                count('stale', fn.__qualname__)
+                return entry
+        if not compute:
+            return None
+
+        with self.key_locks.hold(cache_name):
+            entry = self.get_entry(cache_name)
+            if entry is not None and time.time() - entry[1] < max_age:
+                logger.debug("%s returned from Cache after waiting with arguments %s" % (fn.__name__, args))
+                count('hits', fn.__qualname__)
+                return entry
+            count('misses', fn.__qualname__)
+            return self.compute_once(cache_name, fn, args, kwargs, max_age)
+
+    def lease_timeout(self):
+        if self.lease is not None:
+            return self.lease
+        return getattr(settings, 'TIMED_CACHE_LEASE_TIMEOUT', 30)
+
+    def get_entry(self, cache_name):
+        """the (value, stored_at) cached under cache_name, from the local cache when this process has it and from
+        the django cache otherwise. entries read from the django cache are kept locally until their soft ttl."""
+        entry = local_cache().get(cache_name)
+        if entry is None:
+            entry, size = self.get_shared(cache_name)
+            if entry is not None:
+                local_cache().set(cache_name, entry, entry[1] + self.time, size)
+        return entry
+
+    @staticmethod
+    def get_shared(cache_name):
+        """the (value, stored_at) cached under cache_name in the django cache and its pickled size. the django
+        cache holds (value, stored_at, size), so an entry is only pickled once to be measured, when it is stored.
+
+        :rtype: tuple
+        :return: (entry, size) - (None, None) when nothing is cached, size None when it was not stored with one
+        """
+        entry = cache.get(cache_name)
+        if entry is None:
+            return None, None
+        return tuple(entry[:2]), entry[2] if len(entry) > 2 else None
+
+    def store(self, cache_name, value, function='unknown'):
+        """cache value with the time it was computed, locally and in the django cache; None, what the lookups
+        return on a database error, is never cached so the next caller tries again"""
+        entry = (value, time.time())
+        if value is not None:
+            size = len(pickle.dumps(entry, pickle.HIGHEST_PROTOCOL))
+            cache.set(cache_name, entry + (size,), self.hard_time if self.hard_time is not None else self.time)
+            local_cache().set(cache_name, entry, entry[1] + self.time, size)
+            metrics.CACHE_STORED_BYTES.inc(size, function=function, view=metrics.current('view'))
+        return entry
+
+    @staticmethod
+    def call(fn, args, kwargs):
+        """call fn with the Banner queries it runs labelled with its name"""
+        with metrics.labelled(function=fn.__qualname__):
+            return fn(*args, **kwargs)
+
+    def compute_once(self, cache_name, fn, args, kwargs, max_age):
+        """call fn and cache its result, unless another process holds the lease for cache_name, in which case
+        wait for that process to cache an entry younger than max_age. if the lease runs out first, fn is called
+        here after all."""
+        logger = logging.getLogger("django")
+        lease_name = '%s:lease' % cache_name
+        lease_timeout = self.lease_timeout()
+        token = uuid.uuid4().hex
+
+        if not cache.add(lease_name, token, lease_timeout):
+            deadline = time.time() + lease_timeout
+            delay = 0.05
+            while time.time() < deadline:
+                time.sleep(delay)
+                entry, size = self.get_shared(cache_name)
+                if entry is not None and time.time() - entry[1] < max_age:
+                    local_cache().set(cache_name, entry, entry[1] + self.time, size)
+                    logger.debug("%s returned from Cache after another worker's lease with arguments %s" % (
+                        fn.__name__, args))
+                    return entry
+                if cache.get(lease_name) is None and cache.add(lease_name, token, lease_timeout):
+                    break
+                delay = min(delay * 2, 0.5)
+            else:
+                logger.warning("%s lease expired with arguments %s - querying Oracle anyway" % (fn.__name__, args))
+
+        try:
+            entry = self.store(cache_name, self.call(fn, args, kwargs), fn.__qualname__)
+            logger.debug("%s returned from Oracle with arguments %s" % (fn.__name__, args))
+        finally:
+            if cache.get(lease_name) == token:
+                cache.delete(lease_name)
+        return entry
+
+    def refresh(self, cache_name, fn, args, kwargs):
+        """recompute a stale entry in the background. the stale entry stays in place when another worker is
+        already refreshing it or when the refresh fails, until hard_time finally expires it"""
+        logger = logging.getLogger("django")
+        lease_name = '%s:lease' % cache_name
+        token = uuid.uuid4().hex
+        if not cache.add(lease_name, token, self.lease_timeout()):
+            return
+        try:
+            value = self.call(fn, args, kwargs)
+            if value is None:
+                logger.warning("%s refresh failed with arguments %s - serving the stale value" % (fn.__name__, args))
+                return
+            self.store(cache_name, value, fn.__qualname__)
+            logger.debug("%s refreshed from Oracle with arguments %s" % (fn.__name__, args))
+        finally:
+            if cache.get(lease_name) == token:
+                cache.delete(lease_name)
+
+    @staticmethod
+    def create_cache_hash(name, *args, **kwargs):
+        """a sha1 digest of the name and arguments, which unlike hash() is the same in every process"""
+        raw = str(name) + repr(args) + repr(sorted(kwargs.items()))
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def __get__(self, obj, objtype):
+        """Support instance methods."""
+
+        return functools.partial(self.__call__, obj)
@@ -0,0 +1,143 @@
+"""classSchedule/typeahead.py - the prefix index behind the course typeahead
+
+Every subject code, "SUBJ CRSE_NUMB" course key, word of a course title and CRN of a term / ptrm is kept in a
+sorted list, so the suggestions for what a student has typed so far are a binary search and a short walk along the
+list. The index of a term is built from the sections already loaded for the results pages, once per load, and
+answers every keystroke without reading Banner.
+"""
+
+# python
+import bisect
+import logging
+import re
+import threading
+import time
+
+# djClassSchedulePrj
+from apps.classSchedule.oracle_models import Section
+from apps.classSchedule.snapshot import SECTION_COLUMNS
+from apps.classSchedule.timed_cache import TermMap
+
+SUBJ_DESC = SECTION_COLUMNS.index('SUBJ_DESC')
+CRN = SECTION_COLUMNS.index('CRN')
+SUBJ = SECTION_COLUMNS.index('SUBJ')
+CRSE_NUMB = SECTION_COLUMNS.index('CRSE_NUMB')
+SEQ_NUMB = SECTION_COLUMNS.index('SEQ_NUMB')
+CRSE_TITLE = SECTION_COLUMNS.index('CRSE_TITLE')
+
+# the kinds of suggestion, in the order they are offered
+KINDS = ('subject', 'course', 'title', 'section')
+
+WORD = re.compile(r"\S+")
+
+_lock = threading.Lock()
+_indexes = TermMap()
+
+
+def normalize(text):
+    """text as it is looked up - lower case with single spaces"""
+    return ' '.join(str(text).lower().split())
+
+
+class PrefixIndex(object):
+    """suggestions of one term / ptrm, found by the prefix of any of their keys"""
+
+    def __init__(self, rows, version=None):
+        """
+        :param rows: the SECTION_COLUMNS rows of the term, in results page order
+        :param version: when the rows were read from Banner
+        """
+        self.version = version
+        self.suggestions = []
+        found = {}
+        keys = dict((kind, set()) for kind in KINDS)
+
+        def suggestion(kind, value, label):
+            number = found.get((kind, value))
+            if number is None:
+                number = found[(kind, value)] = len(self.suggestions)
+                self.suggestions.append({'type': kind, 'value': value, 'label': label})
+            return number
+
+        for row in rows:
+            subject = suggestion('subject', row[SUBJ], '%s - %s' % (row[SUBJ], row[SUBJ_DESC]))
+            keys['subject'].add((normalize(row[SUBJ]), subject))
+
+            course_key = '%s %s' % (row[SUBJ], row[CRSE_NUMB])
+            course = suggestion('course', course_key, '%s - %s' % (course_key, row[CRSE_TITLE]))
+            keys['course'].add((normalize(course_key), course))
+            keys['course'].add((normalize(course_key).replace(' ', ''), course))
+            if row[CRSE_TITLE]:
+                # every word of a title starts a key, so "intro" finds "Principles of Introductory ..."
+                title = normalize(row[CRSE_TITLE])
+                for word in WORD.finditer(title):
+                    keys['title'].add((title[word.start():], course))
+
+            section = suggestion('section', row[CRN], '%s - %s %s-%s %s' % (
+                row[CRN], row[SUBJ], row[CRSE_NUMB], row[SEQ_NUMB], row[CRSE_TITLE]))
+            keys['section'].add((normalize(row[CRN]), section))
+
+        self.keys = {}
+        self.numbers = {}
+        for kind, pairs in keys.items():
+            pairs = sorted(pairs)
+            self.keys[kind] = [key for key, number in pairs]
+            self.numbers[kind] = [number for key, number in pairs]
+
+    def __len__(self):
+        return len(self.suggestions)
+
+    def lookup(self, query, limit=10):
+        """the suggestions with a key starting with query, subjects first, then courses by key, courses by title
+        and sections, each in key order
+
+        :param query: what has been typed so far
+        :param limit: the most suggestions to return
+        :rtype: list
+        :return: a list of {'type', 'value', 'label'} dicts
+        """
+        prefix = normalize(query)
+        results = []
+        if not prefix or limit < 1:
+            return results
+        seen = set()
+        for kind in KINDS:
+            keys, numbers = self.keys[kind], self.numbers[kind]
+            position = bisect.bisect_left(keys, prefix)
+            while position < len(keys) and keys[position].startswith(prefix):
+                number = numbers[position]
+                if number not in seen:
+                    seen.add(number)
+                    results.append(self.suggestions[number])
+                    if len(results) >= limit:
+                        return results
+                position += 1
+        return results
+
+
+def term_index(term, ptrm):
+    """the PrefixIndex of a term / ptrm, rebuilt when its sections have been reloaded
+
+    :rtype: PrefixIndex
+    :return: index - None when Banner could not be read
+    """
+    rows, version = Section.get_term_rows(term, ptrm)
+    if rows is None:
+        return None
+    index = _indexes.get((term, ptrm))
+    if index is not None and index.version == version:
+        return index
+    with _lock:
+        index = _indexes.get((term, ptrm))
+        if index is None or index.version != version:
+            started = time.time()
+            index = _indexes[(term, ptrm)] = PrefixIndex(rows, version)
+            logging.getLogger('django').debug("typeahead index %s %s - %s suggestions built in %.3fs" % (
+                term, ptrm, len(index), time.time() - started))
+    return index
+
+
+def clear():
+    """forget the index of every term"""
+    with _lock:
+        _indexes.clear()
@@ -16,11 +16,30 @@ urlpatterns = [
         {'template_name': 'course_search_res.html'}, name='course_search_res'),
 
     # course search results res
-    url(r'^course/search/results/res/$', views.course_search_results_res,
+    url(r'^course/search/results/res/(?P<term>\d+)/(?P<ptrm>\w*)/$', views.course_search_results_res,
         {'template_name': 'course_search_results_res.html'}, name='course_search_results_res'),
 
     # course search results pel
-    url(r'^course/search/results/pel/$', views.course_search_results_pel,
+    url(r'^course/search/results/pel/(?P<term>\d+)/(?P<ptrm>\w*)/$', views.course_search_results_pel,
         {'template_name': 'course_search_results_pel.html'}, name='course_search_results_pel'),
 
+    # the results urls from before the search criteria were part of them, redirected to the default terms
+    url(r'^course/search/results/res/$', views.course_search_results_res,
+        {'template_name': 'course_search_results_res.html'}),
+    url(r'^course/search/results/pel/$', views.course_search_results_pel,
+        {'template_name': 'course_search_results_pel.html'}),
+
+    # course detail, loaded into the results page modals
+    url(r'^course/detail/(?P<term>\d+)/(?P<ptrm>\w*)/(?P<crn>\w+)/$', views.course_detail,
+        {'template_name': 'course_detail.html'}, name='course_detail'),
+
+    # course search typeahead suggestions
+    url(r'^course/typeahead/(?P<term>\d+)/(?P<ptrm>\w*)/$', views.course_typeahead, name='course_typeahead'),
+
+    # conflict-free schedules of a list of courses
+    url(r'^course/schedules/(?P<term>\d+)/(?P<ptrm>\w*)/$', views.course_schedules, name='course_schedules'),
+
+    # prometheus metrics
+    url(r'^metrics$', views.metrics, name='metrics'),
+
 ]
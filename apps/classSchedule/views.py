@@ -2,22 +2,156 @@
 
 # python
 import datetime
+import hashlib
+import itertools
+import logging
+from collections import OrderedDict
+from urllib.parse import urlencode
 
+from django.conf import settings
 from django.core import urlresolvers
+from django.http import Http404
+from django.http import HttpResponse
+from django.http import HttpResponseBadRequest
+from django.http import HttpResponseForbidden
+from django.http import HttpResponsePermanentRedirect
 from django.http import HttpResponseRedirect
+from django.http import JsonResponse
+from django.http import StreamingHttpResponse
 # django
 from django.shortcuts import render
+from django.template import loader
+from django.utils.cache import get_conditional_response
+from django.utils.cache import patch_cache_control
+from django.utils.http import http_date
+
+# python
+import cx_Oracle
 
-from apps.classSchedule.oracle_models import Campus
-from apps.classSchedule.oracle_models import Instructors
-from apps.classSchedule.oracle_models import PelSpecialized
 # djClassSchedulePrj
+from apps.classSchedule import meetings
+from apps.classSchedule import metrics as classschedule_metrics
+from apps.classSchedule import schedules
+from apps.classSchedule import typeahead
+from apps.classSchedule.form_data import SearchFormData
 from apps.classSchedule.oracle_models import PelTerms
-from apps.classSchedule.oracle_models import PerspectiveAreas
-from apps.classSchedule.oracle_models import ResSpecialized
 from apps.classSchedule.oracle_models import ResTerms
 from apps.classSchedule.oracle_models import Section
-from apps.classSchedule.oracle_models import Subjects
+
+# the stand-in rendered into a streamed results page where the sections are streamed in
+SECTIONS_MARKER = '<!-- classSchedule:sections -->'
+
+# the search filters of each results page, in the order they appear in its url
+PEL_FILTERS = ('subject', 'instructor', 'area', 'specialized', 'campus', 'keywords', 'days', 'start', 'end')
+RES_FILTERS = ('subject', 'instructor', 'area', 'specialized', 'keywords', 'days', 'start', 'end')
+
+
+def search_filters(data, names):
+    """the search filter -> code of a search form post or a results page query, '0' for a filter not applied
+
+    :param data: request.POST, where the choices are 'code|description' - ex: 'ACC|Accounting', or request.GET
+    :param names: PEL_FILTERS or RES_FILTERS
+    :rtype: OrderedDict
+    """
+    filters = OrderedDict((name, str(data.get(name, '0')).split('|')[0] or '0') for name in names)
+    if 'keywords' in filters:
+        # typed in, so spelled the same way whatever the spacing
+        filters['keywords'] = ' '.join(filters['keywords'].split()) or '0'
+    if 'days' in filters:
+        # a checkbox per day on the form, the letters in week order in the url
+        days = data.getlist('days') if hasattr(data, 'getlist') else [data.get('days', '')]
+        filters['days'] = meetings.day_letters(''.join(days)) or '0'
+        for name in ('start', 'end'):
+            filters[name] = meetings.time_code(filters[name]) if filters[name] != '0' else '0'
+    filters['open_only'] = '0' if data.get('open_only', '0') in ('0', '') else '1'
+    return filters
+
+
+def results_query(filters):
+    """the canonical query of a results page - the filters applied, in a fixed order
+
+    :rtype: list
+    :return: a list of (filter, code) pairs
+    """
+    return [(name, code) for name, code in filters.items() if code != '0']
+
+
+def is_canonical(request, filters):
+    """whether the query of request is the canonical query of filters, whatever order its parameters came in -
+    the order of a QueryDict is not kept on every python this runs on
+
+    :rtype: bool
+    """
+    return sorted(request.GET.lists()) == sorted((name, [code]) for name, code in results_query(filters))
+
+
+def results_criteria(filters):
+    """the Section search arguments of the search filters of a results page
+
+    :rtype: dict
+    """
+    return dict((name if name != 'specialized' else 'spec', code) for name, code in filters.items())
+
+
+def results_url(view_name, term, ptrm, filters):
+    """the canonical url of a search, the same for every identical search so that it can be cached and shared
+
+    :param view_name: course_search_results_pel or course_search_results_res
+    :rtype: str
+    """
+    url = urlresolvers.reverse(view_name, args=(term, ptrm))
+    query = urlencode(results_query(filters))
+    return url + '?' + query if query else url
+
+
+def validators(request, versions, csrf=False):
+    """the ETag and Last-Modified of a page built from cached data, derived from when that data was stored so they
+    change whenever the page would. the ETag also covers the url and TIMED_CACHE_VERSION.
+
+    :param request: the request object
+    :param versions: the stored_at time of every cached value the page shows, None for a value not in the cache
+    :param csrf: the page holds a CSRF token - the ETag then also covers the CSRF cookie, and the page gets no
+                 Last-Modified as a date cannot tell the token has changed
+    :rtype: tuple
+    :return: (etag, last_modified) - (None, None) while some of the data is not cached, as the page has to be built
+             to know what it shows
+    """
+    if not versions or None in versions:
+        return None, None
+    key = [getattr(settings, 'TIMED_CACHE_VERSION', 1), request.get_full_path()] + list(versions)
+    if csrf:
+        cookie = request.COOKIES.get(settings.CSRF_COOKIE_NAME)
+        if not cookie:
+            return None, None
+        key.append(cookie)
+    etag = '"%s"' % hashlib.sha1(repr(key).encode()).hexdigest()
+    return etag, None if csrf else int(max(versions))
+
+
+def not_modified(request, etag, last_modified):
+    """the 304 Not Modified answering a conditional GET whose validators still match
+
+    :rtype: HttpResponse
+    :return: response - None when the page has to be sent
+    """
+    if etag is None or request.method not in ('GET', 'HEAD'):
+        return None
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None or response.status_code != 304:
+        return None
+    return with_validators(response, etag, last_modified)
+
+
+def with_validators(response, etag, last_modified):
+    """set the ETag and Last-Modified from validators() on response, when it gave any
+
+    :return: response
+    """
+    if etag is not None:
+        response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
 
 
 def localsite(request, template_name="localsite.html"):
@@ -29,9 +163,15 @@ def localsite(request, template_name="localsite.html"):
     :param template_name: the name of the template to use
     :return: render_to_response
     """
+    etag, last_modified = validators(request, [entry[1] if entry is not None else None for entry in (
+        PelTerms.get_pel_terms.cached(), ResTerms.get_res_terms.cached())])
+    unchanged = not_modified(request, etag, last_modified)
+    if unchanged is not None:
+        return unchanged
+
     pel_terms = PelTerms.get_pel_terms()
     res_terms = ResTerms.get_res_terms()
-    return render(request, template_name, context=locals())
+    return with_validators(render(request, template_name, context=locals()), etag, last_modified)
 
 
 def course_search_pel(request, template_name="course_search_pel.html", term='', ptrm=''):
@@ -42,28 +182,28 @@ def course_search_pel(request, template_name="course_search_pel.html", term='',
     :param template_name: the template name to use for this view
     :param term: the pel term code
     :param ptrm: the ptrm - ex: P5
-    :return: render_to_response if get request - redirect to search results if post request
+    :return: render_to_response if get request - redirect to the search results url if post request
     """
     if request.method == "POST":
-        # write form data to session
-        request.session['term'] = term
-        request.session['ptrm'] = ptrm
-        request.session['subject'] = str(request.POST.get('subject', ['0', 'All'])).split('|')
-        request.session['area'] = str(request.POST.get('area', ['0', 'All'])).split('|')
-        request.session['instructor'] = str(request.POST.get('instructor', ['0', 'All'])).split('|')
-        request.session['specialized'] = str(request.POST.get('specialized', ['0', 'All'])).split('|')
-        request.session['campus'] = str(request.POST.get('campus', ['0', 'All'])).split('|')
-        request.session['open_only'] = request.POST.get('open_only', '0')
-        return HttpResponseRedirect(urlresolvers.reverse('course_search_results_pel'))
-
-    request.session['selected_pel_term_desc'] = selected_pel_term_desc = PelTerms().get_selected_pel_term_desc(term,
-                                                                                                               ptrm)
-    subjects = Subjects().get_all_subjects(term, ptrm)
-    perspective_areas = PerspectiveAreas().get_all_areas()
-    instructors = Instructors().get_all_instructors(term, ptrm)
-    pel_specialized = PelSpecialized().get_all_pel_specialized()
-    campuses = Campus().get_campus(term, ptrm)
-    return render(request, template_name, context=locals())
+        return HttpResponseRedirect(results_url('course_search_results_pel', term, ptrm,
+                                                search_filters(request.POST, PEL_FILTERS)))
+
+    lookups = SearchFormData.pel_lookups(term, ptrm)
+    etag, last_modified = validators(request, SearchFormData.versions(lookups), csrf=True)
+    unchanged = not_modified(request, etag, last_modified)
+    if unchanged is not None:
+        return unchanged
+
+    form_data = SearchFormData(lookups)
+    selected_pel_term_desc = form_data.selected_term_desc
+    subjects = form_data.subjects
+    perspective_areas = form_data.perspective_areas
+    instructors = form_data.instructors
+    pel_specialized = form_data.specialized
+    campuses = form_data.campuses
+    meeting_days = meetings.DAY_CHOICES
+    meeting_times = meetings.TIME_CHOICES
+    return with_validators(render(request, template_name, context=locals()), etag, last_modified)
 
 
 def course_search_res(request, template_name="course_search_res.html", term='', ptrm=''):
@@ -74,71 +214,267 @@ def course_search_res(request, template_name="course_search_res.html", term='',
     :param template_name: the template name to use for this view
     :param term: the residential term code
     :param ptrm: the ptrm code
-    :return: render_to_response if get request - redirect to search results if post request
+    :return: render_to_response if get request - redirect to the search results url if post request
     """
     if request.method == "POST":
-        request.session['term'] = term
-        request.session['ptrm'] = ptrm
-        request.session['subject'] = str(request.POST.get('subject', ['0', 'All'])).split('|')
-        request.session['area'] = str(request.POST.get('area', ['0', 'All'])).split('|')
-        request.session['instructor'] = str(request.POST.get('instructor', ['0', 'All'])).split('|')
-        request.session['specialized'] = str(request.POST.get('specialized', ['0', 'All'])).split('|')
-        request.session['open_only'] = request.POST.get('open_only', '0')
-        return HttpResponseRedirect(urlresolvers.reverse('course_search_results_res'))
-
-    request.session['selected_res_term_desc'] = selected_res_term_desc = ResTerms().get_selected_res_term_desc(term,
-                                                                                                               ptrm)
-    subjects = Subjects().get_all_subjects(term, ptrm)
-    perspective_areas = PerspectiveAreas().get_all_areas()
-    instructors = Instructors().get_all_instructors(term, ptrm)
-    res_specialized = ResSpecialized().get_all_res_specialized()
-    return render(request, template_name, context=locals())
+        return HttpResponseRedirect(results_url('course_search_results_res', term, ptrm,
+                                                search_filters(request.POST, RES_FILTERS)))
+
+    lookups = SearchFormData.res_lookups(term, ptrm)
+    etag, last_modified = validators(request, SearchFormData.versions(lookups), csrf=True)
+    unchanged = not_modified(request, etag, last_modified)
+    if unchanged is not None:
+        return unchanged
 
+    form_data = SearchFormData(lookups)
+    selected_res_term_desc = form_data.selected_term_desc
+    subjects = form_data.subjects
+    perspective_areas = form_data.perspective_areas
+    instructors = form_data.instructors
+    res_specialized = form_data.specialized
+    meeting_days = meetings.DAY_CHOICES
+    meeting_times = meetings.TIME_CHOICES
+    return with_validators(render(request, template_name, context=locals()), etag, last_modified)
 
-def course_search_results_pel(request, template_name="course_search_results_pel.html"):
-    """builds a page with PEL courses listed in a table based upon the persons selected criteria from the
-    course_search_pel() method
+
+def course_search_results_pel(request, template_name="course_search_results_pel.html", term='', ptrm=''):
+    """builds a page with PEL courses listed in a table based upon the search criteria in its url, which is the
+    canonical results_url() of the search - any other spelling of the same search is redirected to it
 
     :param request: the request object
     :param template_name: the template to use for this view
+    :param term: the pel term code, defaults to this year's P3 term
+    :param ptrm: the ptrm - ex: P5
     :return: render_to_response
     """
-    year = datetime.date.today().year
-    no_term = str(year) + '25'
-    term = request.session.get('term', no_term)
-    ptrm = request.session.get('ptrm', 'P3')
-    the_subject = request.session.get('subject', ['0', 'All'])
-    the_area = request.session.get('area', ['0', 'All'])
-    the_instructor = request.session.get('instructor', ['0', 'All'])
-    the_specialized = request.session.get('specialized', ['0', 'All'])
-    the_campus = request.session.get('campus', ['0', 'All'])
-    open_only = request.session.get('open_only', '0')
-    selected_pel_term_desc = request.session.get('selected_pel_term_desc', 'n/a')
-    sections = Section().get_pel_sections(term, ptrm, subject=the_subject[0], area=the_area[0],
-                                          instructor=the_instructor[0], spec=the_specialized[0],
-                                          campus=the_campus[0], open_only=open_only)
-    return render(request, template_name, context=locals())
+    # the default term changes every year, so a url without one is only redirected for now
+    redirect = HttpResponseRedirect if not term else HttpResponsePermanentRedirect
+    if not term:
+        term, ptrm = str(datetime.date.today().year) + '25', 'P3'
+    filters = search_filters(request.GET, PEL_FILTERS)
+    if request.path != urlresolvers.reverse('course_search_results_pel', args=(term, ptrm)) or \
+            not is_canonical(request, filters):
+        return redirect(results_url('course_search_results_pel', term, ptrm, filters))
+
+    lookups = SearchFormData.pel_lookups(term, ptrm)
+    attributes = SearchFormData.results_attributes(filters)
+    criteria = results_criteria(filters)
+    versions = SearchFormData.versions(lookups, attributes) + \
+        Section.sections_versions(Section.query_pel_sections, term, ptrm, **criteria)
+    etag, last_modified = validators(request, versions)
+    unchanged = not_modified(request, etag, last_modified)
+    if unchanged is not None:
+        return cacheable(unchanged)
+
+    form_data = SearchFormData(lookups, only=attributes)
+    the_subject = form_data.selected('subject', filters['subject'])
+    the_area = form_data.selected('area', filters['area'])
+    the_instructor = form_data.selected('instructor', filters['instructor'])
+    the_specialized = form_data.selected('specialized', filters['specialized'])
+    the_campus = form_data.selected('campus', filters['campus'])
+    open_only = filters['open_only']
+    keywords = filters['keywords'] if filters['keywords'] != '0' else ''
+    the_days, the_start, the_end = [filters[name] if filters[name] != '0' else '' for name in ('days', 'start', 'end')]
+    selected_pel_term_desc = form_data.selected_term_desc
+    if getattr(settings, 'SEARCH_RESULTS_STREAMING', True):
+        response = stream_results(request, template_name, Section.stream_pel_sections(term, ptrm, **criteria),
+                                  locals())
+    else:
+        sections = Section().get_pel_sections(term, ptrm, **criteria)
+        response = render(request, template_name, context=locals())
+    return cacheable(with_validators(response, etag, last_modified))
+
+
+def course_search_results_res(request, template_name="course_search_results_res.html", term='', ptrm=''):
+    """builds a page with Residential courses listed in a table based upon the search criteria in its url, which
+    is the canonical results_url() of the search - any other spelling of the same search is redirected to it
+
+    :param request: the request object
+    :param template_name: the template to use for this view
+    :param term: the residential term code, defaults to this year's R2 term
+    :param ptrm: the ptrm code
+    :return: render_to_response
+    """
+    # the default term changes every year, so a url without one is only redirected for now
+    redirect = HttpResponseRedirect if not term else HttpResponsePermanentRedirect
+    if not term:
+        term, ptrm = str(datetime.date.today().year) + '10', 'R2'
+    filters = search_filters(request.GET, RES_FILTERS)
+    if request.path != urlresolvers.reverse('course_search_results_res', args=(term, ptrm)) or \
+            not is_canonical(request, filters):
+        return redirect(results_url('course_search_results_res', term, ptrm, filters))
+
+    lookups = SearchFormData.res_lookups(term, ptrm)
+    attributes = SearchFormData.results_attributes(filters)
+    criteria = results_criteria(filters)
+    versions = SearchFormData.versions(lookups, attributes) + \
+        Section.sections_versions(Section.query_res_sections, term, ptrm, **criteria)
+    etag, last_modified = validators(request, versions)
+    unchanged = not_modified(request, etag, last_modified)
+    if unchanged is not None:
+        return cacheable(unchanged)
+
+    form_data = SearchFormData(lookups, only=attributes)
+    the_subject = form_data.selected('subject', filters['subject'])
+    the_area = form_data.selected('area', filters['area'])
+    the_instructor = form_data.selected('instructor', filters['instructor'])
+    the_specialized = form_data.selected('specialized', filters['specialized'])
+    open_only = filters['open_only']
+    keywords = filters['keywords'] if filters['keywords'] != '0' else ''
+    the_days, the_start, the_end = [filters[name] if filters[name] != '0' else '' for name in ('days', 'start', 'end')]
+    selected_res_term_desc = form_data.selected_term_desc
+    if getattr(settings, 'SEARCH_RESULTS_STREAMING', True):
+        response = stream_results(request, template_name, Section.stream_res_sections(term, ptrm, **criteria),
+                                  locals())
+    else:
+        sections = Section().get_res_sections(term, ptrm, **criteria)
+        response = render(request, template_name, context=locals())
+    return cacheable(with_validators(response, etag, last_modified))
+
+
+def cacheable(response):
+    """let browsers and shared HTTP caches keep a results page for SEARCH_RESULTS_MAX_AGE seconds
+
+    :return: response
+    """
+    patch_cache_control(response, public=True, max_age=getattr(settings, 'SEARCH_RESULTS_MAX_AGE', 30))
+    return response
+
+
+def stream_results(request, template_name, batches, context):
+    """streams a results page - the first batch of sections is read, then everything above the sections is sent,
+    then each batch of sections is rendered and sent as it arrives, followed by the rest of the page. the page is
+    the same as the one template_name renders with every section in the context.
+
+    a DatabaseError raised by the first batch goes to the error page like any other, as nothing has been sent yet.
+    one raised by a later batch is logged and the page ends with a notice that the sections listed are incomplete.
 
+    :param request: the request object
+    :param template_name: the results template, with the sections_marker stand-in
+    :param batches: an iterable of section lists
+    :param context: the context of template_name, without the sections
+    :return: StreamingHttpResponse
+    """
+    batches = iter(batches)
+    started = list(itertools.islice(batches, 1))
+    context = dict(context, streaming=True, sections_marker=SECTIONS_MARKER)
+    head, tail = loader.render_to_string(template_name, context, request).split(SECTIONS_MARKER, 1)
+    sections_template = loader.get_template('course_search_results_sections.html')
+    empty_template = loader.get_template('course_search_results_empty.html')
+    error_template = loader.get_template('course_search_results_error.html')
+    term, ptrm = context['term'], context['ptrm']
+
+    def content():
+        yield head
+        first = True
+        failed = False
+        try:
+            for batch in itertools.chain(started, batches):
+                if batch:
+                    yield sections_template.render({'sections': batch, 'first': first, 'term': term, 'ptrm': ptrm})
+                    first = False
+        except cx_Oracle.DatabaseError as e:
+            logging.getLogger('django').error("%s %s results cut short while streaming: %s" % (term, ptrm, e))
+            failed = True
+        if not first:
+            yield sections_template.render({'sections': [], 'last': True})
+        if failed:
+            yield error_template.render({})
+        elif first:
+            yield empty_template.render({})
+        yield tail
 
-def course_search_results_res(request, template_name="course_search_results_res.html"):
-    """builds a page with Residential courses listed in a table based upon the persons selected criteria from the
-    course_search_res() method
+    return StreamingHttpResponse(content(), content_type='text/html; charset=utf-8')
+
+
+def course_detail(request, template_name="course_detail.html", term='', ptrm='', crn=''):
+    """the course detail of one section, loaded into the results page modal when its title is clicked
 
     :param request: the request object
     :param template_name: the template to use for this view
+    :param term: the term code
+    :param ptrm: the ptrm code
+    :param crn: the CRN of the section
     :return: render_to_response
     """
-    year = datetime.date.today().year
-    no_term = str(year) + '10'
-    term = request.session.get('term', no_term)
-    ptrm = request.session.get('ptrm', 'R2')
-    default_values = ['0', 'All']
-    the_subject = request.session.get('subject', default_values)
-    the_area = request.session.get('area', default_values)
-    the_instructor = request.session.get('instructor', default_values)
-    the_specialized = request.session.get('specialized', default_values)
-    open_only = request.session.get('open_only', '0')
-    selected_res_term_desc = request.session.get('selected_res_term_desc', 'n/a')
-    sections = Section().get_res_sections(term, ptrm, subject=the_subject[0], instructor=the_instructor[0],
-                                          area=the_area[0], spec=the_specialized[0], open_only=open_only)
+    sections = Section.get_section(term, ptrm, crn)
+    details = Section.get_section_detail(term, ptrm, crn)
+    if not sections or not details:
+        raise Http404("no section %s in term %s %s" % (crn, term, ptrm))
+    section = sections[0]
+    detail = details[0]
     return render(request, template_name, context=locals())
+
+
+def course_typeahead(request, term='', ptrm=''):
+    """the courses, subjects and sections of a term matching what has been typed into the course search so far,
+    as JSON - answered from the typeahead prefix index of the term, so it can be called on every keystroke
+
+    :param request: the request object, with the text typed so far in q and, optionally, at most how many
+                    suggestions to return in limit - never more than TYPEAHEAD_RESULTS
+    :param term: the term code
+    :param ptrm: the ptrm code
+    :return: JsonResponse
+    """
+    most = getattr(settings, 'TYPEAHEAD_RESULTS', 10)
+    try:
+        limit = min(int(request.GET.get('limit', most)), most)
+    except ValueError:
+        return HttpResponseBadRequest("limit must be a number")
+    index = typeahead.term_index(term, ptrm)
+    if index is None:
+        return JsonResponse({'error': "the sections of term %s %s could not be read" % (term, ptrm)}, status=503)
+    query = request.GET.get('q', '')
+    return cacheable(JsonResponse({'term': term, 'ptrm': ptrm, 'query': query,
+                                   'results': index.lookup(query, limit)}))
+
+
+def course_schedules(request, term='', ptrm=''):
+    """the best conflict-free schedules of the courses a student wants to take in a term, as JSON - each takes one
+    section of every course, fewest days on campus first, and is built from the weekly meetings of the sections
+    already loaded for the results pages
+
+    :param request: the request object, with a course for each course to take - ex: ?course=ACC+201&course=BIO+101,
+                    optionally open_only=1 to only use sections with a seat left and at most how many schedules to
+                    return in limit - never more than SCHEDULE_RESULTS
+    :param term: the term code
+    :param ptrm: the ptrm code
+    :return: JsonResponse
+    """
+    most = getattr(settings, 'SCHEDULE_RESULTS', 10)
+    try:
+        limit = min(int(request.GET.get('limit', most)), most)
+    except ValueError:
+        return HttpResponseBadRequest("limit must be a number")
+    courses = []
+    for text in request.GET.getlist('course'):
+        course = schedules.course_key(text)
+        if course is None:
+            return HttpResponseBadRequest("%s is not a course - ex: ACC 201" % text)
+        if course not in courses:
+            courses.append(course)
+    if not courses or len(courses) > getattr(settings, 'SCHEDULE_COURSES', 8):
+        return HttpResponseBadRequest("a schedule takes 1 to %s courses" % getattr(settings, 'SCHEDULE_COURSES', 8))
+
+    index, rows = schedules.term_meetings(term, ptrm)
+    if index is None:
+        return JsonResponse({'error': "the sections of term %s %s could not be read" % (term, ptrm)}, status=503)
+    missing = [course for course in courses if course not in index.courses]
+    if missing:
+        return JsonResponse({'error': "no sections of %s in term %s %s" % (', '.join(missing), term, ptrm),
+                             'missing': missing}, status=404)
+    open_only = request.GET.get('open_only') == '1'
+    found, complete = schedules.schedules(rows, index, courses, open_only, limit)
+    return cacheable(JsonResponse({'term': term, 'ptrm': ptrm, 'courses': courses, 'open_only': open_only,
+                                   'complete': complete, 'schedules': found}))
+
+
+def metrics(request):
+    """the counters and histograms of this process in the Prometheus text format, for METRICS_ALLOWED_IPS only
+
+    :param request: the request object
+    :return: HttpResponse
+    """
+    if request.META.get('REMOTE_ADDR') not in getattr(settings, 'METRICS_ALLOWED_IPS', []):
+        return HttpResponseForbidden()
+    return HttpResponse(classschedule_metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -42,6 +42,66 @@ vars().update(EMAIL_CONFIG)
 
 BANNER_CONNECTION_URL = env('BANNER_CONNECTION_URL')
 
+# banner session pool - see apps/classSchedule/banner.py
+BANNER_POOL_MIN = env.int('BANNER_POOL_MIN', default=2)
+BANNER_POOL_MAX = env.int('BANNER_POOL_MAX', default=10)
+BANNER_POOL_INCREMENT = env.int('BANNER_POOL_INCREMENT', default=1)
+BANNER_POOL_ACQUIRE_TIMEOUT = env.float('BANNER_POOL_ACQUIRE_TIMEOUT', default=10.0)  # seconds
+# seconds a session sits idle before it is pinged
+BANNER_POOL_PING_INTERVAL = env.int('BANNER_POOL_PING_INTERVAL', default=60)
+BANNER_STATEMENT_CACHE_SIZE = env.int('BANNER_STATEMENT_CACHE_SIZE', default=80)  # prepared statements kept per session
+BANNER_ARRAYSIZE = env.int('BANNER_ARRAYSIZE', default=500)  # rows fetched per round trip
+BANNER_PREFETCH_ROWS = env.int('BANNER_PREFETCH_ROWS', default=500)  # rows returned with the execute (cx_Oracle 8+)
+
+# where the oracle_models lookups read from: oracle, mirror (the SWV* copy sync_mirror keeps in the extra database),
+# fixture (the stand-in in apps/classSchedule/fixture_source.py) or the dotted path of a cursor context manager
+BANNER_DATA_SOURCE = env('BANNER_DATA_SOURCE', default='oracle')
+BANNER_MIRROR_DATABASE = 'extra'
+# seconds a sync_mirror load may hold the lock of a view before another load may take it over
+BANNER_MIRROR_LOCK_TIMEOUT = env.int('BANNER_MIRROR_LOCK_TIMEOUT', default=3600)
+BANNER_FIXTURES = env('BANNER_FIXTURES', default='')  # a file written by banner_fixtures, generated data when empty
+BANNER_FIXTURE_SECTIONS = env.int('BANNER_FIXTURE_SECTIONS', default=2000)  # generated sections per term / ptrm
+BANNER_FIXTURE_LATENCY = env.float('BANNER_FIXTURE_LATENCY', default=0.0)  # seconds added to every fixture query
+BANNER_FIXTURE_JITTER = env.float('BANNER_FIXTURE_JITTER', default=0.0)  # up to this many more seconds at random
+BANNER_FIXTURE_FAILURE_RATE = env.float('BANNER_FIXTURE_FAILURE_RATE', default=0.0)  # share of queries that fail
+
+# part of every TimedCache key - bump it when the shape of a cached lookup changes
+TIMED_CACHE_VERSION = env.int('TIMED_CACHE_VERSION', default=2)
+# seconds one worker may spend filling a missing TimedCache entry while the others wait for it
+TIMED_CACHE_LEASE_TIMEOUT = env.int('TIMED_CACHE_LEASE_TIMEOUT', default=30)
+# background threads refreshing stale TimedCache entries and section snapshots, and how many may be queued
+TIMED_CACHE_REFRESH_WORKERS = env.int('TIMED_CACHE_REFRESH_WORKERS', default=4)
+TIMED_CACHE_REFRESH_QUEUE = env.int('TIMED_CACHE_REFRESH_QUEUE', default=32)
+# the in-process cache in front of CACHES['default'] - entries and pickled bytes it may hold
+TIMED_CACHE_LOCAL_ENTRIES = env.int('TIMED_CACHE_LOCAL_ENTRIES', default=512)
+TIMED_CACHE_LOCAL_BYTES = env.int('TIMED_CACHE_LOCAL_BYTES', default=16 * 1024 * 1024)
+# seconds a worker trusts its copy of the invalidation generations before asking the cache again
+TIMED_CACHE_GENERATION_TTL = env.int('TIMED_CACHE_GENERATION_TTL', default=5)
+
+# threads loading the drop downs of the course search forms concurrently
+FORM_DATA_WORKERS = env.int('FORM_DATA_WORKERS', default=6)
+
+# course searches are answered from an in-process snapshot of each term - see apps/classSchedule/snapshot.py
+SECTION_SNAPSHOTS = env.bool('SECTION_SNAPSHOTS', default=True)
+SECTION_SNAPSHOT_MAX_AGE = env.int('SECTION_SNAPSHOT_MAX_AGE', default=1800)  # seconds before a background rebuild
+SECTION_SNAPSHOT_HARD_MAX_AGE = env.int('SECTION_SNAPSHOT_HARD_MAX_AGE', default=21600)  # seconds a stale one is served
+# the seat counts are read on their own and patched into the snapshots in between rebuilds
+SECTION_SEATS_MAX_AGE = env.int('SECTION_SEATS_MAX_AGE', default=30)
+SECTION_SEATS_HARD_MAX_AGE = env.int('SECTION_SEATS_HARD_MAX_AGE', default=600)
+# the most terms / ptrms whose snapshot, typeahead, schedule and text indexes each process keeps in memory
+TERMS_KEPT = env.int('TERMS_KEPT', default=24)
+
+# the results pages are streamed - the top of the page is sent before the sections are read, then the sections
+# follow in batches of BANNER_ARRAYSIZE rows
+SEARCH_RESULTS_STREAMING = env.bool('SEARCH_RESULTS_STREAMING', default=True)
+# seconds browsers and shared HTTP caches may keep a results page, whose url holds the whole search
+SEARCH_RESULTS_MAX_AGE = env.int('SEARCH_RESULTS_MAX_AGE', default=30)
+# the most suggestions the course typeahead returns for one keystroke
+TYPEAHEAD_RESULTS = env.int('TYPEAHEAD_RESULTS', default=10)
+# the most schedules the schedule builder returns, and the most courses one schedule may take
+SCHEDULE_RESULTS = env.int('SCHEDULE_RESULTS', default=10)
+SCHEDULE_COURSES = env.int('SCHEDULE_COURSES', default=8)
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -55,6 +115,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'apps.classSchedule.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -64,6 +125,9 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# addresses allowed to scrape /metrics
+METRICS_ALLOWED_IPS = env.list('METRICS_ALLOWED_IPS', default=['127.0.0.1', '::1'])
+
 ROOT_URLCONF = 'djClassSchedule.urls'
 
 TEMPLATES = [
@@ -0,0 +1,8 @@
+// loads the course detail of a results page title into the modal it opens
+$(function () {
+    $('#course-detail').on('show.bs.modal', function (event) {
+        var content = $(this).find('.modal-content');
+        content.html('<div class="modal-body"><p>Loading...</p></div>');
+        content.load($(event.relatedTarget).attr('href'));
+    });
+});